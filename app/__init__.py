@@ -1,22 +1,86 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
-from flasgger import Swagger
 from config import Config
+from app.admission import AdmissionControl
+from app.changes import ChangeFeed
+from app.database import init_database
+from app.hashing import PasswordHasher
+from app.cache import RosterCache
+from app.instrumentation import Instrumentation
+from app.metrics import Metrics
+from app.replicas import ReplicaRouter, RoutingSession
+from app.serializers import FastJSONProvider
 
 
-app = Flask(__name__)
-app.config.from_object(Config)
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-jwt = JWTManager(app)  # Инициализация JWTManager
-swagger = Swagger(app)
+# Расширения создаются без приложения и подключаются в create_app
+db = SQLAlchemy(session_options={"class_": RoutingSession})  # Чтения GET-эндпоинтов могут идти на реплики
+jwt = JWTManager()
+hasher = PasswordHasher()  # Хеширование паролей в пуле процессов
+roster_cache = RosterCache()  # Кеш списков участников команд
+instrumentation = Instrumentation()  # Замеры Server-Timing
+metrics = Metrics()  # Метрики Prometheus на /metrics
+admission = AdmissionControl()  # Лимиты одновременных запросов и частоты по IP
+replicas = ReplicaRouter()  # Выбор реплики для чтения
+change_feed = ChangeFeed()  # Потоки SSE журнала изменений команд
 
-# Импортируем маршруты после инициализации приложения и базы данных
-from app import routes, models
-from app.auth import auth_bp
-from app.routes import routes_bp  # Импортируем Blueprint для маршрутов
+# Модели используют db, поэтому импортируются после создания расширений
+from app import models
+from app.idempotency import IdempotencyStore
+from app.principal import PrincipalLoader
 
-app.register_blueprint(auth_bp, url_prefix='/auth')
-app.register_blueprint(routes_bp)  # Регистрируем Blueprint для маршрутов
+principals = PrincipalLoader()  # Загрузка текущего пользователя по JWT с кешированием
+idempotency = IdempotencyStore()  # Ответы POST-запросов по заголовку Idempotency-Key
+
+
+def create_app(config=Config):
+    """
+    Создаёт и настраивает экземпляр приложения.
+
+    Swagger UI и Flask-Migrate подключаются только при ``SWAGGER_ENABLED`` и
+    ``MIGRATIONS_ENABLED``: flasgger, jsonschema, alembic и mako импортируются лишь тогда,
+    когда они нужны, и не попадают в память рабочих процессов.
+
+    :param config: Класс или объект конфигурации
+    :return: Экземпляр Flask приложения
+    """
+    from app.utils import LimitedRequest
+
+    app = Flask(__name__)
+    app.request_class = LimitedRequest  # эндпоинты ограничивают размер тела, в том числе chunked
+    app.json = FastJSONProvider(app)  # orjson для request.get_json и jsonify
+    app.config.from_object(config)
+    if app.config['TRUSTED_PROXY_COUNT']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        # request.remote_addr - адрес клиента, переданный доверенными прокси (лимиты частоты, реплики)
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'])
+
+    init_database(app, db)
+    replicas.init_app(app)
+    jwt.init_app(app)
+    if app.config['SWAGGER_ENABLED']:
+        from flasgger import Swagger
+        from app.schemas import DEFINITIONS
+        Swagger(app, template={"definitions": DEFINITIONS})
+    if app.config['MIGRATIONS_ENABLED']:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    hasher.init_app(app)
+    roster_cache.init_app(app)
+    change_feed.init_app(app)
+    instrumentation.init_app(app)
+    metrics.init_app(app, db)
+    admission.init_app(app)  # после Metrics: отклонённые запросы тоже учитываются
+    principals.init_app(app, jwt)
+    idempotency.init_app(app)
+
+    # Импортируем маршруты после инициализации расширений
+    from app.auth import auth_bp
+    from app.batch import batch_bp
+    from app.routes import routes_bp
+
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(routes_bp)  # Регистрируем Blueprint для маршрутов
+    app.register_blueprint(batch_bp)  # POST /batch - подзапросы к маршрутам auth и routes
+    return app
@@ -0,0 +1,266 @@
+import math
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from app.cache import LRUCache
+
+
+def parse_limits(value):
+    """
+    Разбирает настройку вида ``endpoint=число,endpoint=число``.
+
+    :param value: Строка настройки или готовый словарь
+    :return: Словарь {эндпоинт: число}
+    """
+    if isinstance(value, dict):
+        return dict(value)
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        endpoint, _, limit = item.partition('=')
+        limits[endpoint.strip()] = float(limit)
+    return limits
+
+
+class AdaptiveLimit:
+    """
+    Лимит одновременных запросов с ограниченной очередью ожидания и градиентной адаптацией.
+
+    Задержка сравнивается по двум экспоненциальным скользящим средним: короткому окну
+    (``SHORT_WINDOW``, последние ~10 запросов) и длинному (``LONG_WINDOW``, ~100 запросов),
+    которое служит базовой задержкой. Лимит уменьшается в ``DECREASE`` раз, только когда
+    короткое среднее больше базового в ``tolerance`` раз и лимит исчерпан (все места заняты
+    или есть очередь): рост задержки без перегрузки - например, смесь попаданий и промахов
+    кеша - лимит не снижает. Иначе лимит растёт на ``1 / limit`` (примерно на единицу за
+    «поколение» запросов), но не выше настроенного максимума.
+
+    :param max_limit: Максимальное количество одновременных запросов
+    :param min_limit: Минимальное количество одновременных запросов
+    :param queue_size: Максимальное количество ожидающих запросов
+    :param queue_timeout: Максимальное время ожидания в очереди, секунды
+    :param tolerance: Допустимое отношение короткого среднего задержки к базовому
+    """
+
+    DECREASE = 0.9
+    SHORT_WINDOW = 0.1
+    LONG_WINDOW = 0.01
+
+    def __init__(self, max_limit, min_limit, queue_size, queue_timeout, tolerance):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.limit = float(max_limit)
+        self.baseline = None
+        self.latency = None
+        self.in_flight = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def _has_capacity(self):
+        return self.in_flight < int(self.limit)
+
+    def acquire(self):
+        """
+        Занимает место для запроса, при необходимости ожидая в очереди.
+
+        :return: True, если запрос допущен; False, если очередь заполнена или время ожидания истекло
+        """
+        with self._condition:
+            if not self._has_capacity():
+                if self.waiting >= self.queue_size:
+                    return False
+                self.waiting += 1
+                try:
+                    if not self._condition.wait_for(self._has_capacity, self.queue_timeout):
+                        return False
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            return True
+
+    def release(self, latency):
+        """
+        Освобождает место и адаптирует лимит по задержке завершённого запроса.
+
+        :param latency: Время обработки запроса, секунды
+        """
+        with self._condition:
+            saturated = self.waiting > 0 or self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if self.baseline is None:
+                self.baseline = self.latency = latency
+            else:
+                self.baseline += (latency - self.baseline) * self.LONG_WINDOW
+                self.latency += (latency - self.latency) * self.SHORT_WINDOW
+            if saturated and self.latency > self.baseline * self.tolerance:
+                self.limit = max(self.min_limit, self.limit * self.DECREASE)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            free = int(self.limit) - self.in_flight
+            if free > 0:
+                self._condition.notify(free)
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов по ключу (IP клиента) алгоритмом token bucket.
+
+    Корзины хранятся в LRU-кеше; запись живёт, пока корзина не наполнится снова,
+    после чего её отсутствие равносильно полной корзине.
+
+    :param rate: Скорость пополнения, запросов в секунду
+    :param burst: Ёмкость корзины
+    :param max_clients: Максимальное количество отслеживаемых клиентов
+    """
+
+    def __init__(self, rate, burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = LRUCache(max_clients, burst / rate)
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """
+        Забирает токен из корзины клиента.
+
+        :param key: Ключ клиента
+        :return: 0, если запрос разрешён, иначе через сколько секунд появится токен
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets.set(key, (tokens, now))
+                return (1 - tokens) / self.rate
+            self._buckets.set(key, (tokens - 1, now))
+            return 0
+
+
+class AdmissionControl:
+    """
+    Контроль допуска запросов к эндпоинтам блюпринтов ``auth`` и ``routes``.
+
+    Каждый эндпоинт имеет свой адаптивный лимит одновременных запросов (``ADMISSION_LIMITS``,
+    для остальных - ``ADMISSION_DEFAULT_LIMIT``) и ограниченную очередь. Когда очередь заполнена
+    или ожидание дольше ``ADMISSION_QUEUE_TIMEOUT``, запрос сразу получает 503 с Retry-After,
+    поэтому дорогие запросы с хешированием паролей не занимают все потоки и не задерживают
+    дешёвые. Эндпоинты из ``RATE_LIMIT_ENDPOINTS`` дополнительно ограничены по частоте для
+    каждого IP клиента (429 с Retry-After).
+
+    Лимиты действуют в пределах процесса: общая пропускная способность сервера - лимит,
+    умноженный на количество рабочих процессов.
+    """
+
+    BLUEPRINTS = ('auth', 'routes')
+
+    def __init__(self, app=None):
+        self.config = None
+        self.limits = {}
+        self.rate_limits = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Читает настройки ``ADMISSION_*`` и ``RATE_LIMIT_*`` и регистрирует обработчики запросов.
+
+        Подключается после Metrics, чтобы отклонённые запросы попадали в метрики.
+
+        :param app: Экземпляр Flask приложения
+        """
+        self.config = app.config
+        self.limits = {}
+        self.rate_limits = {
+            endpoint: TokenBucket(app.config['RATE_LIMIT_PER_SECOND'], app.config['RATE_LIMIT_BURST'],
+                                  app.config['RATE_LIMIT_MAX_CLIENTS'])
+            for endpoint in filter(None, (name.strip() for name in app.config['RATE_LIMIT_ENDPOINTS'].split(',')))
+        }
+        app.extensions['admission_control'] = self
+        if app.config['ADMISSION_ENABLED']:
+            app.before_request(self._admit)
+            app.teardown_request(self._release)
+
+    def limit_for(self, endpoint):
+        """
+        Возвращает лимит эндпоинта, создавая его при первом запросе.
+
+        :param endpoint: Название эндпоинта Flask
+        :return: AdaptiveLimit
+        """
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            with self._lock:
+                limit = self.limits.get(endpoint)
+                if limit is None:
+                    config = self.config
+                    max_limit = parse_limits(config['ADMISSION_LIMITS']).get(
+                        endpoint, config['ADMISSION_DEFAULT_LIMIT']
+                    )
+                    limit = self.limits[endpoint] = AdaptiveLimit(
+                        max_limit, config['ADMISSION_MIN_LIMIT'], config['ADMISSION_QUEUE_SIZE'],
+                        config['ADMISSION_QUEUE_TIMEOUT'], config['ADMISSION_LATENCY_TOLERANCE']
+                    )
+        return limit
+
+    @staticmethod
+    def _reject(status, error, retry_after):
+        response = jsonify({"error": error})
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response, status
+
+    def _admit(self):
+        if request.blueprint not in self.BLUEPRINTS or request.endpoint is None:
+            return None
+        rejection, g._admission = self.admit(request.endpoint)
+        return rejection
+
+    def admit(self, endpoint):
+        """
+        Проверяет частоту запросов с IP клиента и занимает место в лимите эндпоинта.
+
+        Подзапросы ``POST /batch`` не проходят before_request и допускаются этим методом явно.
+
+        :param endpoint: Название эндпоинта Flask
+        :return: Кортеж (ответ 429/503 или None; занятое место для :meth:`finish` или None)
+        """
+        if not self.config['ADMISSION_ENABLED']:
+            return None, None
+
+        bucket = self.rate_limits.get(endpoint)
+        if bucket is not None:
+            retry_after = bucket.take(request.remote_addr)
+            if retry_after:
+                return self._reject(429, "Too many requests", retry_after), None
+
+        limit = self.limit_for(endpoint)
+        if not limit.acquire():
+            return self._reject(503, "Server is busy, retry later", self.config['ADMISSION_QUEUE_TIMEOUT']), None
+        return None, (limit, time.perf_counter())
+
+    @staticmethod
+    def finish(admitted):
+        """
+        Освобождает место, занятое :meth:`admit`, и учитывает задержку запроса в лимите.
+
+        :param admitted: Занятое место или None
+        """
+        if admitted is not None:
+            limit, started = admitted
+            limit.release(time.perf_counter() - started)
+
+    def release(self):
+        """
+        Досрочно освобождает место текущего запроса в лимите эндпоинта.
+
+        Вызывается долгими потоковыми ответами (SSE): лимит защищает подготовку ответа,
+        а время жизни подключения не должно учитываться в задержке эндпоинта.
+        """
+        self._release()
+
+    def _release(self, error=None):
+        self.finish(g.pop('_admission', None))
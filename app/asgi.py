@@ -0,0 +1,546 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import jwt as pyjwt
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+from app import services
+from app.cache import RosterCache
+from app.database import engine_options
+from app.hashing import HasherBusy, PasswordHasher
+from app.models import User
+from app.principal import PrincipalLoader
+from app.queries import team_etag, team_members_stmt
+from app.schemas import LOGIN, MEMBER, NEW_TEAM, PROFILE, REGISTER
+from app.serializers import TEAM, TEAM_MEMBER, dumpb, dumps, loads, team_change_events, team_leader
+from app.services import APIError
+from app.uow import conflict_insert
+from app.utils import parse_changes_args, parse_page_args, wants_format
+from config import Config
+
+
+logger = logging.getLogger(__name__)
+
+# Асинхронные драйверы для синхронных адресов базы данных
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+class AuthError(Exception):
+    """Ошибка проверки JWT; ответ совпадает с ответом flask_jwt_extended."""
+
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class _RequestSession(Session):
+    """Класс синхронной сессии ASGI-версии, чтобы события не затрагивали сессии Flask-SQLAlchemy."""
+
+
+def async_database_url(url):
+    """
+    Адрес базы данных с асинхронным драйвером.
+
+    :param url: Адрес в формате SQLAlchemy (например, ``postgresql://...``)
+    :return: Адрес с драйвером asyncpg или aiosqlite
+    """
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f'No async driver for {url.get_backend_name()}')
+    return url.set(drivername=driver)
+
+
+def _json(obj, status=200, headers=None):
+    return Response(dumpb(obj) + b'\n', status, headers=headers, media_type='application/json')
+
+
+def _accept(request):
+    return parse_accept_header(request.headers.get('accept'), MIMEAccept)
+
+
+async def _read_body(request, limit):
+    # Размер проверяется по Content-Length до чтения и по фактически прочитанным байтам
+    length = request.headers.get('content-length')
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise APIError(413, "Request body too large")
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise APIError(413, "Request body too large")
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+async def _json_body(request, limit):
+    body = await _read_body(request, limit)
+    try:
+        return loads(body)
+    except ValueError:
+        return None
+
+
+async def _validated_json(request, schema, limit):
+    """
+    Тело запроса, проверенное по схеме (как :func:`app.utils.validate_json`).
+
+    :raises APIError: Тело больше limit или не соответствует схеме
+    """
+    data = await _json_body(request, limit)
+    error = schema.validate(data)
+    if error:
+        raise APIError(400, error)
+    return data
+
+
+class AsyncAPI:
+    """
+    Асинхронная (ASGI) версия API на Starlette и SQLAlchemy asyncio.
+
+    Логика эндпоинтов общая с Flask-версией (:mod:`app.services`): операции выполняются
+    синхронным кодом через ``AsyncSession.run_sync``, а обращения к базе остаются асинхронными.
+    Здесь только разбор запросов, проверка токенов и формирование ответов; токены совместимы
+    с flask_jwt_extended. Хеширование паролей выполняется в пуле потоков (а при
+    ``PASSWORD_HASH_BACKEND=process`` - в пуле процессов), поэтому цикл событий не блокируется
+    и один рабочий процесс обслуживает тысячи одновременных соединений.
+    Метрики, пакетные запросы (``POST /batch``), ключи идемпотентности (``Idempotency-Key``) и Swagger UI
+    есть только во Flask-версии.
+
+    :param config: Класс конфигурации
+    :raises ValueError: Для базы данных без асинхронного драйвера или без ``INSERT ... ON CONFLICT``
+    """
+
+    def __init__(self, config=Config):
+        self.config = {key: getattr(config, key) for key in dir(config) if key.isupper()}
+        url = self.config['ASYNC_DATABASE_URL'] or async_database_url(self.config['SQLALCHEMY_DATABASE_URI'])
+        options = engine_options({**self.config, "SQLALCHEMY_DATABASE_URI": url})
+        if self.config['DB_PGBOUNCER'] and make_url(url).get_backend_name() == 'postgresql':
+            # asyncpg по умолчанию готовит запросы; в режиме пулинга транзакций это недопустимо
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f'__asyncpg_{uuid.uuid4()}__',
+            }
+        self.engine = create_async_engine(url, **options)
+        # Вставки без ON CONFLICT шли бы по строке в точках сохранения; такая база отклоняется при запуске
+        if conflict_insert(self.engine.dialect.name, User) is None:
+            raise ValueError(f'ON CONFLICT is not supported by {self.engine.dialect.name}')
+        # Свой класс сессии у каждого экземпляра: его слушатель не действует на сессии других экземпляров
+        session_class = type('RequestSession', (_RequestSession,), {})
+        event.listen(session_class, 'after_begin', self._set_statement_timeout)
+        self.sessionmaker = async_sessionmaker(
+            self.engine, expire_on_commit=False, sync_session_class=session_class
+        )
+
+        self.hasher = PasswordHasher()
+        self.hasher.configure(self.config)
+        self.roster_cache = RosterCache()
+        self.roster_cache.configure(self.config)
+        self.principals = PrincipalLoader()
+        self.principals.configure(self.config)
+        # Потоки журнала изменений: количество открытых и событие, которое будит их после изменений
+        self.change_streams = 0
+        self._changes = asyncio.Event()
+
+        self.app = Starlette(
+            routes=[
+                Route('/auth/register', self.register, methods=['POST']),
+                Route('/auth/login', self.login, methods=['POST']),
+                Route('/auth/protected', self.protected, methods=['GET']),
+                Route('/new_team', self.new_team, methods=['POST']),
+                Route('/{name_team}/add_member', self.add_member, methods=['POST']),
+                Route('/{name_team}/members:bulk', self.add_members_bulk, methods=['POST']),
+                Route('/teams:restructure', self.restructure_teams, methods=['POST']),
+                Route('/{name_team}/changes', self.get_team_changes, methods=['GET']),
+                Route('/{name_team}/{user_email}', self.delete_user, methods=['DELETE']),
+                Route('/{name_team}/{user_email}/profile', self.update_profile, methods=['PUT']),
+                Route('/users', self.list_users, methods=['GET']),
+                Route('/{name_team}', self.get_team_members, methods=['GET']),
+            ],
+            exception_handlers={
+                APIError: self._handle_api_error,
+                AuthError: self._handle_auth_error,
+                HasherBusy: self._handle_busy,
+            },
+            lifespan=self._lifespan,
+        )
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+    @asynccontextmanager
+    async def _lifespan(self, app):
+        await self.warm_up_pool()
+        yield
+        await self.engine.dispose()
+        self.hasher.backend.shutdown()
+
+    async def warm_up_pool(self):
+        """Открывает ``DB_POOL_MIN`` соединений до приёма запросов."""
+        pool_size = getattr(self.engine.pool, 'size', None)
+        if pool_size is None:
+            return 0
+        count = min(self.config['DB_POOL_MIN'], pool_size())
+        connections = []
+        try:
+            for _ in range(count):
+                connections.append(await self.engine.connect())
+        except Exception as error:
+            logger.warning('Database pool warm-up failed: %s', error)
+        finally:
+            for connection in connections:
+                await connection.close()
+        return len(connections)
+
+    def _set_statement_timeout(self, session, transaction, connection):
+        timeout = self.config['DB_STATEMENT_TIMEOUT_MS']
+        if timeout and connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+    @staticmethod
+    async def _handle_api_error(request, error):
+        return _json(error.body, error.status)
+
+    @staticmethod
+    async def _handle_auth_error(request, error):
+        return _json({"msg": error.message}, error.status)
+
+    @staticmethod
+    async def _handle_busy(request, error):
+        return _json({"error": "Server is busy, retry later"}, 503, headers={"Retry-After": '1'})
+
+    def _respond(self, result):
+        """
+        Ответ по результату операции :mod:`app.services` после фиксации транзакции: сбрасывает
+        кеши изменённых команд и пользователей и будит потоки журнала изменений.
+        """
+        if result.team_names or result.user_ids:
+            self.roster_cache.invalidate(*result.team_names)
+            for user_id in result.user_ids:
+                self.principals.invalidate(user_id)
+            self._notify_changes()
+        if isinstance(result.body, str):
+            return Response(result.body, result.status, media_type='application/json')
+        return _json(result.body, result.status)
+
+    def create_access_token(self, user):
+        """
+        Выпускает access-токен в формате flask_jwt_extended.
+
+        :param user: Пользователь
+        :return: Строка JWT
+        """
+        now = datetime.now(timezone.utc)
+        expires = self.config['JWT_ACCESS_TOKEN_EXPIRES']
+        if not isinstance(expires, timedelta):
+            expires = timedelta(seconds=expires)
+        claims = {
+            "fresh": False,
+            "iat": now,
+            "jti": str(uuid.uuid4()),
+            "type": 'access',
+            self.principals.identity_claim: user.id,
+            "nbf": now,
+            "exp": now + expires,
+            **self.principals.claims_for(user),
+        }
+        return pyjwt.encode(claims, self.config['JWT_SECRET_KEY'], algorithm=self.config.get('JWT_ALGORITHM', 'HS256'))
+
+    async def current_principal(self, request, session):
+        """
+        Проверяет access-токен из заголовка Authorization и возвращает Principal.
+
+        :raises AuthError: Если токен отсутствует, неверен, истёк или пользователь не найден
+        """
+        header = request.headers.get('Authorization')
+        if not header:
+            raise AuthError('Missing Authorization Header')
+        scheme, _, token = header.partition(' ')
+        if scheme != 'Bearer' or not token:
+            raise AuthError("Missing 'Bearer' type in 'Authorization' header. "
+                            "Expected 'Authorization: Bearer <JWT>'", 422)
+        try:
+            claims = pyjwt.decode(token, self.config['JWT_SECRET_KEY'],
+                                  algorithms=[self.config.get('JWT_ALGORITHM', 'HS256')])
+        except pyjwt.ExpiredSignatureError:
+            raise AuthError('Token has expired')
+        except pyjwt.InvalidTokenError as error:
+            raise AuthError(str(error), 422)
+        if claims.get('type') != 'access':
+            raise AuthError('Only non-refresh tokens are allowed', 422)
+
+        principal = await session.run_sync(self.principals.lookup, claims)
+        if principal is None:
+            raise AuthError(f'Error loading the user {claims[self.principals.identity_claim]}')
+        return principal
+
+    async def register(self, request):
+        data = await _validated_json(request, REGISTER, self.config['JSON_MAX_BODY_SIZE'])
+        services.check_registration(data, self.config)
+        hashed_password = await run_in_threadpool(self.hasher.hash, data['password'])
+        async with self.sessionmaker() as session:
+            result = await session.run_sync(services.register_user, data, hashed_password)
+            await session.commit()
+        return self._respond(result)
+
+    async def login(self, request):
+        data = await _validated_json(request, LOGIN, self.config['JSON_MAX_BODY_SIZE'])
+        async with self.sessionmaker() as session:
+            user = await session.run_sync(services.user_by_email, data['email'])
+        # Пароль проверяется и пересчитывается без открытой сессии, как в register
+        if not user or not await run_in_threadpool(self.hasher.verify, user.password, data['password']):
+            return _json({"error": "Invalid credentials"}, 401)
+
+        # Пересчитываем хеш, если он создан с устаревшими параметрами алгоритма
+        if await run_in_threadpool(self.hasher.needs_rehash, user.password):
+            hashed_password = await run_in_threadpool(self.hasher.hash, data['password'])
+            async with self.sessionmaker() as session:
+                await session.run_sync(services.update_password, user.id, hashed_password)
+                await session.commit()
+
+        return _json({"access_token": self.create_access_token(user)}, 200)
+
+    async def protected(self, request):
+        async with self.sessionmaker() as session:
+            principal = await self.current_principal(request, session)
+        return _json({"email": principal.email}, 200)
+
+    async def new_team(self, request):
+        async with self.sessionmaker() as session:
+            principal = await self.current_principal(request, session)
+            data = await _validated_json(request, NEW_TEAM, self.config['JSON_MAX_BODY_SIZE'])
+            result = await session.run_sync(services.create_team, data['team_name'], principal.id)
+            await session.commit()
+        return self._respond(result)
+
+    async def add_member(self, request):
+        name_team = request.path_params['name_team']
+        data = await _validated_json(request, MEMBER, self.config['JSON_MAX_BODY_SIZE'])
+        async with self.sessionmaker() as session:
+            team_id = await session.run_sync(services.team_id_by_name, name_team)
+        hashed_password = await run_in_threadpool(self.hasher.hash, data['password'])
+        async with self.sessionmaker() as session:
+            result = await session.run_sync(services.add_member, team_id, name_team, data, hashed_password)
+            await session.commit()
+        return self._respond(result)
+
+    async def add_members_bulk(self, request):
+        name_team = request.path_params['name_team']
+        async with self.sessionmaker() as session:
+            principal = await self.current_principal(request, session)
+        if request.headers.get('content-type', '').split(';')[0].strip() == 'application/x-ndjson':
+            body = await _read_body(request, self.config['MAX_CONTENT_LENGTH'])
+            try:
+                rows = [loads(line) for line in body.decode().splitlines() if line.strip()]
+            except ValueError:
+                rows = None
+        else:
+            rows = await _json_body(request, self.config['MAX_CONTENT_LENGTH'])
+        if not isinstance(rows, list):
+            return _json({"error": "Invalid JSON"}, 400)
+
+        async with self.sessionmaker() as session:
+            members = await session.run_sync(
+                services.prepare_member_import, name_team, principal.id, rows, self.config
+            )
+        # Тело читается и пароли хешируются без открытой сессии; дубликаты, появившиеся
+        # за это время, отсекает ON CONFLICT в import_members
+        hashed_passwords = await run_in_threadpool(
+            self.hasher.hash_many, [values['password'] for _, values in members.new_users]
+        )
+        async with self.sessionmaker() as session:
+            result = await session.run_sync(
+                services.import_members, name_team, members, hashed_passwords, self.config['BULK_INSERT_BATCH_SIZE']
+            )
+            await session.commit()
+        return self._respond(result)
+
+    async def delete_user(self, request):
+        async with self.sessionmaker() as session:
+            principal = await self.current_principal(request, session)
+            result = await session.run_sync(
+                services.remove_member, request.path_params['name_team'], request.path_params['user_email'],
+                principal.id
+            )
+            await session.commit()
+        return self._respond(result)
+
+    async def restructure_teams(self, request):
+        async with self.sessionmaker() as session:
+            principal = await self.current_principal(request, session)
+            data = await _json_body(request, self.config['MAX_CONTENT_LENGTH'])
+            result = await session.run_sync(services.restructure_teams, data, principal.id, self.config)
+            await session.commit()
+        return self._respond(result)
+
+    async def update_profile(self, request):
+        async with self.sessionmaker() as session:
+            principal = await self.current_principal(request, session)
+            data = await _validated_json(request, PROFILE, self.config['JSON_MAX_BODY_SIZE'])
+            result = await session.run_sync(
+                services.update_profile, request.path_params['user_email'], principal, data
+            )
+            await session.commit()
+        return self._respond(result)
+
+    def _notify_changes(self):
+        # Будит потоки журнала изменений этого процесса; ожидающие держат ссылку на прежнее событие
+        self._changes.set()
+        self._changes = asyncio.Event()
+
+    async def get_team_changes(self, request):
+        name_team = request.path_params['name_team']
+        event_stream = wants_format(request.query_params, _accept(request), 'sse', 'text/event-stream')
+        try:
+            since, limit = parse_changes_args(
+                request.query_params, self.config, request.headers.get('last-event-id') if event_stream else None
+            )
+        except ValueError as error:
+            return _json({"error": str(error)}, 400)
+
+        async with self.sessionmaker() as session:
+            team = await session.run_sync(services.team_by_name, name_team)
+            if not event_stream:
+                return self._respond(await session.run_sync(services.team_changes_page, team, since, limit))
+
+        if self.change_streams >= self.config['CHANGES_MAX_STREAMS']:
+            return _json({"error": "Too many change streams, retry later"}, 503,
+                         {"Retry-After": str(max(1, round(self.config['CHANGES_POLL_INTERVAL'])))})
+        return StreamingResponse(self._stream_team_changes(team, since, limit), media_type='text/event-stream',
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    async def _stream_team_changes(self, team, since, limit):
+        poll_interval = self.config['CHANGES_POLL_INTERVAL']
+        heartbeat_interval = self.config['CHANGES_HEARTBEAT_INTERVAL']
+        deadline = time.monotonic() + self.config['CHANGES_STREAM_TIMEOUT']
+        cursor = since
+        # Поток учитывается с начала отправки: генератор, который так и не запустился
+        # (клиент отключился раньше), не выполнил бы finally
+        self.change_streams += 1
+        try:
+            yield f'retry: {int(poll_interval * 1000)}\n\n'
+            last_sent = time.monotonic()
+            while True:
+                changes = self._changes
+                async with self.sessionmaker() as session:
+                    rows = await session.run_sync(services.team_changes, team.id, cursor, limit)
+                now = time.monotonic()
+                if rows:
+                    cursor = rows[-1].id
+                    last_sent = now
+                    yield team_change_events(rows)
+                    if len(rows) == limit:
+                        continue
+                elif now - last_sent >= heartbeat_interval:
+                    last_sent = now
+                    yield ': keepalive\n\n'
+                if now >= deadline:
+                    return
+                try:
+                    await asyncio.wait_for(changes.wait(), min(poll_interval, deadline - now))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.change_streams -= 1
+
+    async def list_users(self, request):
+        async with self.sessionmaker() as session:
+            principal = await self.current_principal(request, session)
+            result = await session.run_sync(services.users_page, principal, request.query_params, self.config)
+        return self._respond(result)
+
+    @staticmethod
+    def _roster_headers(etag):
+        # Формат списка выбирается и по Accept (см. routes._roster_response)
+        return {"ETag": quote_etag(etag), "Vary": "Accept"}
+
+    def _not_modified(self, etag):
+        return Response(status_code=304, headers=self._roster_headers(etag))
+
+    async def get_team_members(self, request):
+        name_team = request.path_params['name_team']
+        try:
+            limit, after = parse_page_args(request.query_params, self.config)
+        except ValueError:
+            return _json({"error": "Invalid pagination parameters"}, 400)
+
+        if_none_match = parse_etags(request.headers.get('if-none-match'))
+        ndjson = wants_format(request.query_params, _accept(request), 'ndjson', 'application/x-ndjson')
+        cacheable = limit is None and after is None and not ndjson
+        session = self.sessionmaker()
+        current_etag = None
+        try:
+            if cacheable:
+                if self.roster_cache.verify_versions:
+                    # Кеш процесса не видит изменений из других рабочих процессов: сверяем версию команды
+                    current_etag = await session.run_sync(services.current_team_etag, name_team, ndjson)
+                cached = self.roster_cache.get(name_team, current_etag)
+                if cached is not None:
+                    etag, body = cached
+                    if if_none_match.contains_weak(etag):
+                        return self._not_modified(etag)
+                    return Response(body, 200, headers=self._roster_headers(etag), media_type='application/json')
+
+            if if_none_match:
+                etag = current_etag or await session.run_sync(services.current_team_etag, name_team, ndjson)
+                if etag is not None and if_none_match.contains_weak(etag):
+                    return self._not_modified(etag)
+
+            team = await session.run_sync(services.team_with_leader, name_team)
+            etag = team_etag(team.id, team.version, ndjson)
+            if ndjson:
+                # Сессия закрывается генератором после отправки последней строки
+                stream, session = self._stream_team_members(session, team, after), None
+                return StreamingResponse(stream, media_type='application/x-ndjson',
+                                         headers=self._roster_headers(etag))
+
+            body = await session.run_sync(services.team_members_body, team, limit, after)
+        finally:
+            if session is not None:
+                await session.close()
+
+        if cacheable:
+            self.roster_cache.set(name_team, etag, body)
+        return Response(body, 200, headers=self._roster_headers(etag), media_type='application/json')
+
+    async def _stream_team_members(self, session, team, after):
+        stmt = team_members_stmt(team.id, after=after).execution_options(
+            yield_per=self.config['TEAM_MEMBERS_STREAM_BATCH']
+        )
+        try:
+            yield TEAM(team) + '\n'
+            result = await session.stream(stmt)
+            async for partition in result.partitions():
+                yield ''.join(TEAM_MEMBER(member) + '\n' for member in partition)
+            if not team.leader_is_member:
+                yield dumps(team_leader(team)) + '\n'
+        finally:
+            await session.close()
+
+
+def create_asgi_app(config=Config):
+    """
+    Создаёт ASGI-приложение с API.
+
+    :param config: Класс конфигурации
+    :return: ASGI-приложение
+    """
+    return AsyncAPI(config)
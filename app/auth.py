@@ -1,96 +1,90 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-from app.models import db, User
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import create_access_token, current_user
+from app import hasher, principals, services
+from app.idempotency import idempotent
+from app.models import db
+from app.schemas import LOGIN, REGISTER
+from app.uow import end_read, unit_of_work
+from app.utils import jwt_required, validate_json
 
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['POST'])
+@validate_json(REGISTER)
+@idempotent
 def register():
     """
     Регистрация нового пользователя.
     ---
     parameters:
-      - name: email
+      - name: body
         in: body
-        type: string
-        required: true
-        description: Email пользователя
-      - name: password
-        in: body
-        type: string
         required: true
-        description: Пароль пользователя
-      - name: role
-        in: body
-        type: string
-        required: false
-        description: Роль пользователя
-      - name: name
-        in: body
-        type: string
-        required: false
-        description: Имя пользователя
-      - name: surname
-        in: body
+        schema:
+          $ref: '#/definitions/Register'
+      - name: Idempotency-Key
+        in: header
         type: string
         required: false
-        description: Фамилия пользователя
+        description: Ключ для безопасного повтора запроса (повтор получает сохранённый ответ)
     responses:
       201:
         description: Пользователь успешно зарегистрирован
       400:
         description: Пользователь уже существует или неверный запрос
+      409:
+        description: Запрос с этим Idempotency-Key ещё выполняется
+      422:
+        description: Idempotency-Key уже использован с другим запросом
+      503:
+        description: Сервер перегружен, повторите запрос позже
     """
     data = request.get_json()
-    email = data.get('email')
-    password = data.get('password')
-    role = data.get('role', 'user')
-    name = data.get('name', None)
-    surname = data.get('surname', None)
-
-    if User.query.filter_by(email=email).first():
-        return jsonify({"error": "User already exists"}), 400
-
-    hashed_password = generate_password_hash(password)
-    new_user = User(email=email, password=hashed_password, role=role, name=name, surname=surname)
-    db.session.add(new_user)
-    db.session.commit()
-
-    return jsonify({"message": "User registered successfully"}), 201
+    services.check_registration(data, current_app.config)
+    hashed_password = hasher.hash(data['password'])
+    with unit_of_work() as session:
+        result = services.register_user(session, data, hashed_password)
+    return jsonify(result.body), result.status
 
 @auth_bp.route('/login', methods=['POST'])
+@validate_json(LOGIN)
 def login():
     """
     Вход пользователя.
     ---
     parameters:
-      - name: email
+      - name: body
         in: body
-        type: string
         required: true
-        description: Email пользователя
-      - name: password
-        in: body
-        type: string
-        required: true
-        description: Пароль пользователя
+        schema:
+          $ref: '#/definitions/Login'
     responses:
       200:
         description: Успешный вход
+      400:
+        description: Неверный запрос
       401:
         description: Неверные учетные данные
+      503:
+        description: Сервер перегружен, повторите запрос позже
     """
     data = request.get_json()
     email = data.get('email')
     password = data.get('password')
 
-    user = User.query.filter_by(email=email).first()
-    if not user or not check_password_hash(user.password, password):
+    user = services.user_by_email(db.session, email)
+    end_read()  # пароль проверяется без открытой транзакции
+    if not user or not hasher.verify(user.password, password):
         return jsonify({"error": "Invalid credentials"}), 401
 
-    access_token = create_access_token(identity=user.id)
+    # Пересчитываем хеш, если он создан с устаревшими параметрами алгоритма
+    if hasher.needs_rehash(user.password):
+        hashed_password = hasher.hash(password)
+        with unit_of_work() as session:
+            services.update_password(session, user.id, hashed_password)
+
+    access_token = create_access_token(identity=user.id, additional_claims=principals.claims_for(user))
     return jsonify({"access_token": access_token}), 200
 
 @auth_bp.route('/protected', methods=['GET'])
@@ -103,6 +97,4 @@ def protected():
       200:
         description: Успешное получение информации
     """
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    return jsonify({"email": user.email}), 200
\ No newline at end of file
+    return jsonify({"email": current_user.email}), 200
\ No newline at end of file
@@ -0,0 +1,192 @@
+from flask import Blueprint, current_app, g, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request
+from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.test import EnvironBuilder
+
+from app import admission, db
+from app.schemas import BATCH_REQUEST
+from app.utils import body_too_large
+
+
+batch_bp = Blueprint('batch', __name__)
+
+# Блюпринты, к маршрутам которых можно обращаться из пакета
+BLUEPRINTS = ('auth', 'routes')
+# Заголовки, которые подзапрос передаёт сам; Authorization и адрес клиента берутся из запроса пакета
+FORWARDED_HEADERS = {'if-none-match': 'If-None-Match'}
+# Заголовки ответа подзапроса, которые возвращаются клиенту
+RESPONSE_HEADERS = ('ETag', 'Retry-After')
+
+
+def _check_item(item):
+    """
+    Проверяет подзапрос пакета.
+
+    :param item: Подзапрос из тела запроса
+    :return: Текст ошибки или None
+    """
+    error = BATCH_REQUEST.validate(item)
+    if error:
+        return error
+    if not item['path'].startswith('/'):
+        return "Invalid argument: path"
+    headers = item.get('headers', {})
+    if not isinstance(headers, dict) or not all(
+        name.lower() in FORWARDED_HEADERS and isinstance(value, str) for name, value in headers.items()
+    ):
+        return "Invalid argument: headers"
+    return None
+
+
+def _environ(item):
+    """
+    WSGI-окружение подзапроса.
+
+    :param item: Подзапрос из тела запроса
+    :return: Словарь окружения
+    """
+    headers = {FORWARDED_HEADERS[name.lower()]: value for name, value in item.get('headers', {}).items()}
+    if 'Authorization' in request.headers:
+        headers['Authorization'] = request.headers['Authorization']
+    body = item.get('body')
+    builder = EnvironBuilder(
+        path=item['path'],
+        base_url=request.host_url,
+        method=item['method'].upper(),
+        headers=headers,
+        data=None if body is None else current_app.json.dumps(body),
+        content_type=None if body is None else 'application/json',
+        environ_base={'REMOTE_ADDR': request.remote_addr},
+    )
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def _error(status, error):
+    response = jsonify({"error": error})
+    response.status_code = status
+    return response
+
+
+def _dispatch(item):
+    """
+    Выполняет подзапрос в собственном контексте запроса.
+
+    Контекст приложения, а с ним ``g`` и сессия базы данных, общий с запросом пакета:
+    подзапросы используют проверенный пакетом JWT и одну сессию. Обработчики before_request
+    и after_request для подзапросов не выполняются, поэтому допуск проверяется явно,
+    а чтения идут с основной базы, чтобы подзапросы видели изменения предыдущих.
+
+    :param item: Подзапрос из тела запроса
+    :return: Ответ Flask
+    """
+    with current_app.request_context(_environ(item)):
+        if request.routing_exception is not None:
+            return _error(request.routing_exception.code, request.routing_exception.name)
+        if request.blueprint not in BLUEPRINTS:
+            return _error(404, HTTP_STATUS_CODES[404])
+        if request.args.get('format', 'json') != 'json':
+            # Потоковые ответы (NDJSON, SSE) не собираются в общий ответ пакета
+            return _error(400, "Streaming responses are not supported in batch")
+
+        rejection, admitted = admission.admit(request.endpoint)
+        if rejection is not None:
+            return current_app.make_response(rejection)
+        try:
+            rv = current_app.dispatch_request()
+        except Exception as error:
+            rv = current_app.handle_user_exception(error)
+        finally:
+            admission.finish(admitted)
+        return current_app.make_response(rv)
+
+
+def _result(response):
+    """
+    Ответ подзапроса в теле ответа пакета.
+
+    :param response: Ответ Flask
+    :return: Словарь status, headers, body
+    """
+    body = response.get_json(silent=True)
+    if body is None and response.status_code >= 400:
+        body = {"error": HTTP_STATUS_CODES.get(response.status_code, 'Unknown Error')}
+    headers = {name: response.headers[name] for name in RESPONSE_HEADERS if name in response.headers}
+    return {"status": response.status_code, "headers": headers, "body": body}
+
+
+@batch_bp.route('/batch', methods=['POST'])
+def batch():
+    """
+    Выполнение нескольких запросов к API одним HTTP-запросом.
+    ---
+    parameters:
+      - name: atomic
+        in: query
+        type: boolean
+        required: false
+        description: Выполнить все подзапросы в одной транзакции (всё или ничего)
+      - name: requests
+        in: body
+        required: true
+        description: Подзапросы с полями method, path, body (JSON) и headers (If-None-Match)
+        schema:
+          type: array
+          items:
+            $ref: '#/definitions/BatchRequest'
+    responses:
+      200:
+        description: Ответы подзапросов в порядке подзапросов
+      400:
+        description: Неверный запрос
+      409:
+        description: Атомарный пакет откачен из-за ошибки подзапроса
+      413:
+        description: Слишком много подзапросов или слишком большое тело запроса
+    """
+    if body_too_large(current_app.config['MAX_CONTENT_LENGTH']):
+        return jsonify({"error": "Request body too large"}), 413
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        return jsonify({"error": "Invalid JSON"}), 400
+    if len(items) > current_app.config['BATCH_MAX_REQUESTS']:
+        return jsonify({"error": "Too many requests in batch"}), 413
+    for index, item in enumerate(items):
+        error = _check_item(item)
+        if error:
+            return jsonify({"error": f"[{index}]: {error}"}), 400
+    atomic = request.args.get('atomic', 'false').lower() == 'true'
+
+    # Токен декодируется и пользователь загружается один раз на пакет; подзапросы
+    # с jwt_required (app.utils) берут их из общего g
+    if verify_jwt_in_request(optional=True) is not None:
+        g._batch_jwt_verified = True
+
+    if atomic:
+        # Подзапросы только отправляют изменения в базу (unit_of_work), а действия после
+        # фиксации (сброс кешей, уведомления) копятся до фиксации пакета
+        g._batch_after_commit = []
+    if not atomic:
+        return jsonify([_result(_dispatch(item)) for item in items]), 200
+
+    responses = []
+    for item in items:
+        response = _dispatch(item)
+        responses.append(response)
+        if response.status_code >= 400:
+            break
+    deferred = g.pop('_batch_after_commit')
+    if responses and responses[-1].status_code >= 400:
+        db.session.rollback()
+        # Ответы остальных подзапросов (тела и ETag) описывают откаченные изменения и клиенту не передаются
+        aborted = {"status": 424, "headers": {}, "body": {"error": "Batch aborted"}}
+        results = [aborted] * (len(responses) - 1) + [_result(responses[-1])]
+        results.extend(aborted for _ in items[len(responses):])
+        return jsonify(results), 409
+    db.session.commit()
+    for callback, args in deferred:
+        callback(*args)
+    # ETag ответов верны только для зафиксированных версий, поэтому результаты собираются после фиксации
+    return jsonify([_result(response) for response in responses]), 200
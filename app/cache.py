@@ -0,0 +1,243 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Потокобезопасный кеш в памяти процесса с вытеснением по LRU и сроком жизни записей.
+
+    :param maxsize: Максимальное количество записей
+    :param ttl: Время жизни записи в секундах
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class MemoryBackend:
+    """Хранилище в памяти процесса (по умолчанию)."""
+
+    def __init__(self, config):
+        self._cache = LRUCache(config['ROSTER_CACHE_SIZE'], config['ROSTER_CACHE_TTL'])
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def delete(self, *keys):
+        for key in keys:
+            self._cache.delete(key)
+
+
+class LocalStoreClient:
+    """
+    Замена клиента Redis в памяти процесса для тестов и локальной разработки.
+
+    Поддерживает только команды, которые использует :class:`RedisBackend`, и, как Redis,
+    хранит значения в виде байтов.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def setex(self, key, ttl, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value.encode() if isinstance(value, str) else value)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class RedisBackend:
+    """Общее для всех рабочих процессов хранилище в Redis."""
+
+    def __init__(self, config, client=None):
+        if client is None:
+            try:
+                import redis  # необязательная зависимость, нужна только для этого хранилища
+            except ImportError as error:
+                raise ValueError('ROSTER_CACHE_BACKEND=redis requires the redis package (pip install redis)') from error
+
+            client = redis.Redis.from_url(config['ROSTER_CACHE_REDIS_URL'])
+        self.client = client
+        self.ttl = config['ROSTER_CACHE_TTL']
+        self.prefix = config['ROSTER_CACHE_PREFIX']
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, int(self.ttl), value)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+
+class NullBackend:
+    """Отключённый кеш."""
+
+    def __init__(self, config):
+        pass
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+
+# Хранилища в памяти процесса: изменения, сделанные другими рабочими процессами, их не сбрасывают
+PER_PROCESS_BACKENDS = {'memory', 'local'}
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'redis': RedisBackend,
+    'local': lambda config: RedisBackend(config, client=LocalStoreClient()),
+    'null': NullBackend,
+}
+
+
+class RosterCache:
+    """
+    Read-through кеш сериализованного списка участников команды, ключ - название команды.
+
+    Хранилище выбирается ``ROSTER_CACHE_BACKEND``: ``memory`` - в памяти процесса,
+    ``redis`` - общее для нескольких рабочих процессов, ``local`` - замена Redis в памяти
+    для тестов, ``null`` - кеш выключен. Маршруты, меняющие состав или профили участников,
+    вызывают :meth:`invalidate` после фиксации транзакции. Хранилище в памяти процесса не видит
+    сбросов из других рабочих процессов, поэтому при ``verify_versions`` маршрут передаёт в
+    :meth:`get` текущий ETag команды, и запись с другим ETag считается промахом.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.verify_versions = False
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Создаёт хранилище по конфигурации приложения.
+
+        :param app: Экземпляр Flask приложения
+        """
+        self.configure(app.config)
+        app.extensions['roster_cache'] = self
+
+    def configure(self, config):
+        """
+        Создаёт хранилище по настройкам ``ROSTER_CACHE_*`` (без привязки к Flask).
+
+        :param config: Словарь конфигурации
+        """
+        self.backend = BACKENDS[config['ROSTER_CACHE_BACKEND']](config)
+        self.verify_versions = config['ROSTER_CACHE_BACKEND'] in PER_PROCESS_BACKENDS
+
+    @property
+    def enabled(self):
+        return not isinstance(self.backend, NullBackend)
+
+    def get(self, team_name, current_etag=None):
+        """
+        Возвращает закешированный список участников или None.
+
+        :param team_name: Название команды
+        :param current_etag: Текущий ETag команды или None, если её нет; при ``verify_versions``
+            запись с другим ETag устарела и удаляется
+        :return: Кортеж (etag, тело ответа в формате JSON) или None
+        """
+        value = self.backend.get(team_name)
+        if value is not None and self.verify_versions and not value.startswith(f'{current_etag}\n'):
+            self.backend.delete(team_name)
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            return None
+        etag, body = value.split('\n', 1)
+        return etag, body
+
+    def set(self, team_name, etag, body):
+        """
+        Сохраняет сериализованный список участников вместе с его ETag.
+
+        :param team_name: Название команды
+        :param etag: ETag ответа (версия команды)
+        :param body: Тело ответа в формате JSON
+        """
+        self.backend.set(team_name, f'{etag}\n{body}')
+
+    def invalidate(self, *team_names):
+        """
+        Сбрасывает закешированные списки участников указанных команд.
+
+        :param team_names: Названия команд
+        """
+        self.backend.delete(*team_names)
+
+    def stats(self):
+        """Счётчики попаданий и промахов кеша в текущем процессе."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,59 @@
+import threading
+
+
+class ChangeFeed:
+    """
+    Потоки Server-Sent Events журнала изменений команд (``GET /<name_team>/changes``).
+
+    Поток занимает рабочий поток сервера на всё время подключения, поэтому их количество
+    в процессе ограничено ``CHANGES_MAX_STREAMS``. Потоки опрашивают журнал раз в
+    ``CHANGES_POLL_INTERVAL`` секунд; изменения, сделанные в этом же процессе, будят их
+    сразу (:meth:`notify`), а изменения из других процессов приходят со следующим опросом.
+    """
+
+    def __init__(self, app=None):
+        self.max_streams = 0
+        self.streams = 0
+        self._condition = threading.Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Читает ограничение количества потоков из конфигурации.
+
+        :param app: Экземпляр Flask приложения
+        """
+        self.max_streams = app.config['CHANGES_MAX_STREAMS']
+        app.extensions['change_feed'] = self
+
+    def open_stream(self):
+        """
+        Занимает место для нового потока.
+
+        :return: True, если поток можно открыть; False, если открыто ``CHANGES_MAX_STREAMS`` потоков
+        """
+        with self._condition:
+            if self.streams >= self.max_streams:
+                return False
+            self.streams += 1
+            return True
+
+    def close_stream(self):
+        """Освобождает место завершившегося потока."""
+        with self._condition:
+            self.streams -= 1
+
+    def notify(self):
+        """Будит потоки после фиксации изменений в журнале."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def wait(self, timeout):
+        """
+        Ждёт новых изменений в этом процессе не дольше ``timeout`` секунд.
+
+        :param timeout: Время ожидания, секунды
+        """
+        with self._condition:
+            self._condition.wait(timeout)
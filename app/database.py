@@ -0,0 +1,90 @@
+import logging
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import NullPool
+
+
+logger = logging.getLogger(__name__)
+
+
+def engine_options(config):
+    """
+    Параметры движка SQLAlchemy (``SQLALCHEMY_ENGINE_OPTIONS``) из настроек ``DB_*``.
+
+    В режиме ``DB_PGBOUNCER`` пулом соединений управляет PgBouncer, поэтому приложение
+    использует NullPool: соединение открывается к PgBouncer на время транзакции и сразу
+    возвращается ему. Для SQLite параметры пула не задаются (Flask-SQLAlchemy сам выбирает
+    пул для базы в памяти).
+
+    :param config: Конфигурация приложения
+    :return: Словарь параметров create_engine
+    """
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite':
+        return {}
+    if config['DB_PGBOUNCER']:
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": config['DB_POOL_SIZE'],
+        "max_overflow": config['DB_MAX_OVERFLOW'],
+        "pool_timeout": config['DB_POOL_TIMEOUT'],
+        "pool_recycle": config['DB_POOL_RECYCLE'],
+        "pool_pre_ping": config['DB_POOL_PRE_PING'],
+    }
+
+
+def _set_statement_timeout(session, transaction, connection):
+    # SET LOCAL действует до конца транзакции и безопасен при пулинге транзакций в PgBouncer
+    if not has_app_context() or connection.dialect.name != 'postgresql':
+        return
+    timeout = current_app.config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout:
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+
+def init_database(app, db):
+    """
+    Подключает SQLAlchemy к приложению с параметрами пула из конфигурации.
+
+    Явно заданный ``SQLALCHEMY_ENGINE_OPTIONS`` имеет приоритет над настройками ``DB_*``.
+    Если задан ``DB_STATEMENT_TIMEOUT_MS``, каждая транзакция сессии начинается
+    с ``SET LOCAL statement_timeout`` (только PostgreSQL).
+
+    :param app: Экземпляр Flask приложения
+    :param db: Экземпляр SQLAlchemy
+    """
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    db.init_app(app)
+    if not event.contains(db.session, 'after_begin', _set_statement_timeout):
+        event.listen(db.session, 'after_begin', _set_statement_timeout)
+
+
+def warm_up_pool(app, db):
+    """
+    Открывает ``DB_POOL_MIN`` соединений, чтобы первые запросы не ждали подключения к базе.
+
+    Вызывается в рабочем процессе до приёма запросов. Ошибка подключения только
+    записывается в лог: процесс стартует, а соединения откроются при первых запросах.
+
+    :param app: Экземпляр Flask приложения
+    :param db: Экземпляр SQLAlchemy
+    :return: Количество открытых соединений
+    """
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    if 'pool_size' not in options:
+        return 0
+    count = min(app.config['DB_POOL_MIN'], options['pool_size'])
+    connections = []
+    with app.app_context():
+        try:
+            for _ in range(count):
+                connections.append(db.engine.connect())
+        except SQLAlchemyError as error:
+            logger.warning('Database pool warm-up failed: %s', error)
+        finally:
+            # Закрытые соединения возвращаются в пул и остаются открытыми
+            for connection in connections:
+                connection.close()
+    return len(connections)
@@ -0,0 +1,256 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import jsonify
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app.instrumentation import timed
+
+
+class HasherBusy(Exception):
+    """Очередь хеширования переполнена или задача не уложилась в таймаут."""
+
+
+def _hash_password(password, method, salt_length):
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def _hash_passwords(passwords, method, salt_length):
+    return [generate_password_hash(password, method=method, salt_length=salt_length) for password in passwords]
+
+
+def _check_password(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+class InlineBackend:
+    """Выполняет хеширование в текущем потоке (для разработки и тестов)."""
+
+    def __init__(self, config):
+        pass
+
+    @property
+    def queue_depth(self):
+        return 0
+
+    def run(self, fn, *args):
+        return fn(*args)
+
+    def map(self, fn, chunks):
+        return [fn(*chunk) for chunk in chunks]
+
+    def shutdown(self):
+        pass
+
+    def after_fork(self):
+        pass
+
+
+class ProcessPoolBackend:
+    """
+    Выполняет хеширование в пуле процессов, чтобы не удерживать GIL в потоке запроса.
+
+    Количество принятых и не завершённых задач ограничено ``PASSWORD_HASH_MAX_QUEUE``:
+    при переполнении сразу выбрасывается :class:`HasherBusy`, а не копится очередь. Массовое
+    хеширование (:meth:`map`) отправляет части списка по одной, каждая занимает место в очереди
+    и ждёт не дольше ``PASSWORD_HASH_TIMEOUT``; одновременно выполняется не больше
+    ``PASSWORD_HASH_BULK_WORKERS`` частей, остальные процессы пула остаются входу и регистрации.
+    """
+
+    def __init__(self, config):
+        self.workers = config['PASSWORD_HASH_WORKERS']
+        self.timeout = config['PASSWORD_HASH_TIMEOUT']
+        self.mp_context = config['PASSWORD_HASH_MP_CONTEXT']
+        self.max_queue = config['PASSWORD_HASH_MAX_QUEUE']
+        self.bulk_workers = config['PASSWORD_HASH_BULK_WORKERS'] or max(1, self.workers // 2)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._bulk_slots = threading.BoundedSemaphore(self.bulk_workers)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def queue_depth(self):
+        return self._pending
+
+    def _get_executor(self):
+        # Пул создаётся лениво, при первом обращении в рабочем процессе
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(self.mp_context)
+                    )
+        return self._executor
+
+    def _release(self, future=None):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def _submit(self, fn, *args):
+        with self._pending_lock:
+            if self._pending >= self.max_queue:
+                raise HasherBusy()
+            self._pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # Место в очереди освобождается, когда задача завершена, а не когда её перестали ждать
+        future.add_done_callback(self._release)
+        return future
+
+    def _result(self, future):
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            raise HasherBusy()
+
+    def run(self, fn, *args):
+        return self._result(self._submit(fn, *args))
+
+    def map(self, fn, chunks):
+        futures = []
+        try:
+            for chunk in chunks:
+                if not self._bulk_slots.acquire(timeout=self.timeout):
+                    raise HasherBusy()
+                try:
+                    future = self._submit(fn, *chunk)
+                except BaseException:
+                    self._bulk_slots.release()
+                    raise
+                future.add_done_callback(lambda future: self._bulk_slots.release())
+                futures.append(future)
+            return [self._result(future) for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def after_fork(self):
+        # Пул и блокировки родительского процесса в дочернем непригодны: создаём заново
+        self._executor = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._bulk_slots = threading.BoundedSemaphore(self.bulk_workers)
+        self._lock = threading.Lock()
+
+
+BACKENDS = {
+    'inline': InlineBackend,
+    'process': ProcessPoolBackend,
+}
+
+
+class PasswordHasher:
+    """
+    Хеширование и проверка паролей с настраиваемым алгоритмом и стоимостью.
+
+    Алгоритм задаётся ``PASSWORD_HASH_METHOD`` в формате werkzeug (например ``scrypt:32768:8:1``
+    или ``pbkdf2:sha256:600000``), способ выполнения - ``PASSWORD_HASH_BACKEND``.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.method = None
+        self.salt_length = None
+        self._method_prefix = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Настраивает хешер по конфигурации приложения и регистрирует обработчик перегрузки.
+
+        :param app: Экземпляр Flask приложения
+        """
+        self.configure(app.config)
+        app.extensions['password_hasher'] = self
+        app.register_error_handler(HasherBusy, self._handle_busy)
+
+    def configure(self, config):
+        """
+        Настраивает алгоритм и способ выполнения по настройкам ``PASSWORD_HASH_*`` (без привязки к Flask).
+
+        :param config: Словарь конфигурации
+        """
+        self.method = config['PASSWORD_HASH_METHOD']
+        self.salt_length = config['PASSWORD_HASH_SALT_LENGTH']
+        self.backend = BACKENDS[config['PASSWORD_HASH_BACKEND']](config)
+
+    @staticmethod
+    def _handle_busy(error):
+        response = jsonify({"error": "Server is busy, retry later"})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
+    @property
+    def queue_depth(self):
+        return self.backend.queue_depth
+
+    def after_fork(self):
+        """Сбрасывает унаследованный от родительского процесса пул; вызывается в дочернем процессе после fork."""
+        self.backend.after_fork()
+
+    def hash(self, password):
+        """
+        Хеширует пароль текущим алгоритмом.
+
+        :param password: Пароль в открытом виде
+        :return: Строка хеша в формате werkzeug
+        :raises HasherBusy: Если очередь хеширования переполнена
+        """
+        with timed('hash'):
+            return self.backend.run(_hash_password, password, self.method, self.salt_length)
+
+    def hash_many(self, passwords, chunk_size=64):
+        """
+        Хеширует список паролей, распределяя части списка по процессам пула.
+
+        Таймаут ``PASSWORD_HASH_TIMEOUT`` действует на каждую часть, а не на весь список.
+
+        :param passwords: Список паролей в открытом виде
+        :param chunk_size: Количество паролей в одной задаче
+        :return: Список хешей в том же порядке
+        :raises HasherBusy: Если очередь хеширования переполнена или часть не уложилась в таймаут
+        """
+        chunks = [(passwords[i:i + chunk_size], self.method, self.salt_length)
+                  for i in range(0, len(passwords), chunk_size)]
+        if not chunks:
+            return []
+        with timed('hash'):
+            return [pwhash for hashes in self.backend.map(_hash_passwords, chunks) for pwhash in hashes]
+
+    def verify(self, pwhash, password):
+        """
+        Проверяет пароль по сохранённому хешу.
+
+        :param pwhash: Сохранённый хеш
+        :param password: Пароль в открытом виде
+        :return: True, если пароль верный
+        """
+        with timed('hash'):
+            return self.backend.run(_check_password, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """
+        Проверяет, создан ли хеш с устаревшими параметрами алгоритма.
+
+        :param pwhash: Сохранённый хеш
+        :return: True, если хеш нужно пересчитать текущим алгоритмом
+        """
+        if self._method_prefix is None:
+            # werkzeug дополняет сокращённые названия ("scrypt") параметрами по умолчанию,
+            # поэтому эталонный префикс берём из реального хеша
+            self._method_prefix = self.hash('').split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._method_prefix
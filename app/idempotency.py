@@ -0,0 +1,277 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, select, update
+
+from app.cache import LRUCache
+from app.models import IdempotencyKey, db
+from app.uow import insert_ignore, unit_of_work
+
+
+# Заголовок запроса с ключом и заголовок ответа, повторённого по ключу
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+# Количество устаревших записей, удаляемых одной очисткой таблицы
+PRUNE_BATCH_SIZE = 1000
+# Опрос ключа, занятого другим процессом: первый и наибольший интервал (удваивается после попытки), секунды
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _digest(*parts):
+    """
+    SHA-256 частей, разделённых нулевым байтом.
+
+    :param parts: Строки или байты
+    :return: Шестнадцатеричная строка
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _identity():
+    """Идентификатор пользователя проверенного JWT или None для эндпоинтов без авторизации."""
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+def _scope():
+    """
+    Область действия ключа: эндпоинт, путь (с названием команды) и пользователь.
+
+    Анонимные клиенты различаются по адресу (``request.remote_addr``, за прокси - см. ``TRUSTED_PROXY_COUNT``),
+    чтобы одинаковые ключи разных клиентов не занимали одну запись и не получали чужие ответы.
+    """
+    identity = _identity()
+    client = request.remote_addr if identity is None else None
+    return request.endpoint, request.path, identity, client
+
+
+def _error(status, error):
+    response = jsonify({"error": error})
+    response.status_code = status
+    return response
+
+
+class IdempotencyStore:
+    """
+    Ключи идемпотентности (заголовок ``Idempotency-Key``) для POST-эндпоинтов, которые
+    клиенты повторяют по таймауту.
+
+    Первый запрос с ключом выполняется, а код и тело его ответа сохраняются на ``IDEMPOTENCY_TTL``
+    секунд; повторы получают сохранённый ответ с заголовком ``Idempotent-Replayed: true``.
+    Ответы хранятся в таблице ``idempotency_key``, общей для всех процессов, и в LRU-кеше процесса
+    на ``IDEMPOTENCY_CACHE_SIZE`` записей. Выполняющийся запрос занимает ключ строкой без кода
+    ответа: дубликаты ждут его завершения не дольше ``IDEMPOTENCY_WAIT_TIMEOUT`` секунд и получают
+    сохранённый ответ, а по истечении ожидания - 409 с ``Retry-After``. Дубликаты из того же процесса
+    ждут события, из других процессов - опрашивают строку ключа с растущим интервалом. Ответы 5xx
+    и исключения не сохраняются: ключ освобождается, и повтор выполнит запрос заново. Ключ, занятый
+    завершившимся аварийно процессом, освобождается через ``IDEMPOTENCY_LOCK_TIMEOUT`` секунд.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.cache = None
+        self.ttl = 0
+        self.lock_timeout = 0
+        self.wait_timeout = 0
+        self.prune_interval = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Читает настройки ключей идемпотентности из конфигурации.
+
+        :param app: Экземпляр Flask приложения
+        """
+        config = app.config
+        self.enabled = config['IDEMPOTENCY_ENABLED']
+        self.ttl = config['IDEMPOTENCY_TTL']
+        self.lock_timeout = config['IDEMPOTENCY_LOCK_TIMEOUT']
+        self.wait_timeout = config['IDEMPOTENCY_WAIT_TIMEOUT']
+        self.prune_interval = config['IDEMPOTENCY_PRUNE_INTERVAL']
+        self.cache = LRUCache(config['IDEMPOTENCY_CACHE_SIZE'], self.ttl)
+        app.extensions['idempotency'] = self
+
+    def execute(self, key, fingerprint, view):
+        """
+        Выполняет запрос с ключом идемпотентности или повторяет сохранённый ответ.
+
+        :param key: Ключ записи (хеш области действия :func:`_scope` и заголовка Idempotency-Key)
+        :param fingerprint: Хеш метода, пути и тела запроса
+        :param view: Функция без аргументов, выполняющая запрос
+        :return: Ответ Flask
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            stored = self.cache.get(key)
+            if stored is not None:
+                return self._replay(stored, fingerprint)
+            with self._lock:
+                event = self._in_flight.get(key)
+                owner = event is None
+                if owner:
+                    event = self._in_flight[key] = threading.Event()
+            if owner:
+                break
+            # После завершения запроса его ответ уже в кеше; если ключ освобождён, запрос выполнит этот поток
+            if not event.wait(max(deadline - time.monotonic(), 0)):
+                return self._in_progress()
+
+        try:
+            return self._execute(key, fingerprint, view, deadline)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            event.set()
+
+    def _execute(self, key, fingerprint, view, deadline):
+        interval = POLL_INTERVAL
+        while not self._claim(key, fingerprint):
+            row = db.session.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.status, IdempotencyKey.body,
+                       IdempotencyKey.expires_at).where(IdempotencyKey.key == key)
+            ).first()
+            # Завершаем транзакцию, чтобы повторная попытка занять ключ видела изменения других процессов
+            db.session.rollback()
+            if row is None:
+                continue
+            if row.expires_at <= _utcnow():
+                self._expire(key)
+                continue
+            if row.status is not None:
+                stored = (row.fingerprint, row.status, row.body)
+                self.cache.set(key, stored)
+                return self._replay(stored, fingerprint)
+            if row.fingerprint != fingerprint:
+                return self._mismatch()
+            # Ключ занят запросом другого процесса: ждём его ответа, опрашивая строку ключа
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return self._in_progress()
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+        try:
+            try:
+                rv = view()
+            except Exception as error:
+                # Ошибки операций (app.services.APIError) - такие же ответы, их повтор получает сохранённый ответ
+                rv = current_app.handle_user_exception(error)
+            response = current_app.make_response(rv)
+        except BaseException:
+            self._release(key)
+            raise
+        if response.status_code >= 500 or response.is_streamed:
+            self._release(key)
+            return response
+        stored = (fingerprint, response.status_code, response.get_data(as_text=True))
+        self._complete(key, stored)
+        self.cache.set(key, stored)
+        return response
+
+    def _claim(self, key, fingerprint):
+        """
+        Занимает ключ строкой без кода ответа (``INSERT ... ON CONFLICT DO NOTHING``).
+
+        :return: True, если ключ занят этим запросом
+        """
+        with unit_of_work():
+            return bool(insert_ignore(IdempotencyKey, {
+                "key": key,
+                "fingerprint": fingerprint,
+                "expires_at": _utcnow() + timedelta(seconds=self.lock_timeout),
+            }, IdempotencyKey.key))
+
+    def _complete(self, key, stored):
+        _, status, body = stored
+        with unit_of_work():
+            db.session.execute(update(IdempotencyKey).where(IdempotencyKey.key == key).values(
+                status=status, body=body, expires_at=_utcnow() + timedelta(seconds=self.ttl)
+            ))
+        self._prune()
+
+    def _release(self, key):
+        db.session.rollback()
+        with unit_of_work():
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key,
+                                                            IdempotencyKey.status.is_(None)))
+
+    def _expire(self, key):
+        with unit_of_work():
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key,
+                                                            IdempotencyKey.expires_at <= _utcnow()))
+
+    def _prune(self):
+        """Удаляет устаревшие записи не чаще раза в ``IDEMPOTENCY_PRUNE_INTERVAL`` секунд (по индексу expires_at)."""
+        now = time.monotonic()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + self.prune_interval
+        expired = select(IdempotencyKey.key).where(IdempotencyKey.expires_at <= _utcnow()).limit(PRUNE_BATCH_SIZE)
+        with unit_of_work():
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired)))
+
+    def _replay(self, stored, fingerprint):
+        stored_fingerprint, status, body = stored
+        if stored_fingerprint != fingerprint:
+            return self._mismatch()
+        response = current_app.response_class(body, status=status, mimetype='application/json')
+        response.headers[REPLAYED_HEADER] = 'true'
+        return response
+
+    @staticmethod
+    def _mismatch():
+        return _error(422, f"{HEADER} is already used with a different request")
+
+    @staticmethod
+    def _in_progress():
+        response = _error(409, f"Request with this {HEADER} is in progress")
+        response.headers['Retry-After'] = '1'
+        return response
+
+
+def idempotent(f):
+    """
+    Декоратор POST-эндпоинта с поддержкой заголовка ``Idempotency-Key`` (см. :class:`IdempotencyStore`).
+
+    Ставится после проверки JWT и тела запроса: ключ действует в пределах эндпоинта, пути и пользователя
+    (анонимного - по адресу клиента), а неверные запросы не занимают ключ. Запросы без заголовка выполняются как обычно.
+
+    :param f: Функция представления
+    :return: Обёрнутая функция
+    """
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get(HEADER)
+        store = current_app.extensions['idempotency']
+        if header is None or not store.enabled:
+            return f(*args, **kwargs)
+        if not header or len(header) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"Invalid header: {HEADER}"}), 400
+        # Тело запроса не сохраняется (в нём пароль), только его хеш
+        key = _digest(*_scope(), header)
+        fingerprint = _digest(request.method, request.path, request.get_data())
+        return store.execute(key, fingerprint, lambda: f(*args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,149 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    """Накопленные за запрос замеры: количество SQL-запросов и время по категориям (в секундах)."""
+
+    __slots__ = ('started', 'queries', 'durations')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.durations = {'db': 0.0, 'hash': 0.0, 'serialize': 0.0}
+
+    def add(self, kind, seconds):
+        self.durations[kind] = self.durations.get(kind, 0.0) + seconds
+
+
+def current_timings():
+    """Замеры текущего запроса или None, если запрос не попал в выборку."""
+    if not has_request_context():
+        return None
+    return g.get('_request_timings')
+
+
+def record(kind, seconds):
+    """
+    Добавляет время к категории замеров текущего запроса.
+
+    :param kind: Категория (db, hash, serialize, ...)
+    :param seconds: Длительность в секундах
+    """
+    timings = current_timings()
+    if timings is not None:
+        timings.add(kind, seconds)
+
+
+@contextmanager
+def timed(kind):
+    """
+    Контекстный менеджер, замеряющий время блока в категорию ``kind`` текущего запроса.
+
+    :param kind: Категория замера
+    """
+    if current_timings() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_timings() is not None:
+        conn.info.setdefault('query_started', []).append((context, time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_query(conn, context)
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute не вызывается для упавшего запроса: без этого замер остался бы в стеке
+    # соединения, и следующий запрос на нём получил бы чужое время начала
+    if exception_context.connection is not None:
+        _finish_query(exception_context.connection, exception_context.execution_context)
+
+
+def _finish_query(conn, context):
+    # Замер снимается, только если он поставлен этим же выполнением: ошибка при чтении результата
+    # (после after_cursor_execute) не должна снять замер внешнего запроса
+    started = conn.info.get('query_started')
+    if not started or started[-1][0] is not context:
+        return
+    seconds = time.perf_counter() - started.pop()[1]
+    timings = current_timings()
+    if timings is not None:
+        timings.queries += 1
+        timings.add('db', seconds)
+
+
+class Instrumentation:
+    """
+    Замеры времени обработки запросов.
+
+    Для доли запросов ``INSTRUMENTATION_SAMPLE_RATE`` считает количество и время SQL-запросов
+    (события движка SQLAlchemy), время хеширования паролей и сериализации ответа.
+    Результат отдаётся в заголовке ``Server-Timing`` и пишется в лог одной JSON-строкой.
+    """
+
+    def __init__(self, app=None):
+        self.sample_rate = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Подключает обработчики запросов и событий движка.
+
+        :param app: Экземпляр Flask приложения
+        """
+        self.sample_rate = app.config['INSTRUMENTATION_SAMPLE_RATE']
+        app.extensions['instrumentation'] = self
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        # Слушаем все движки, включая созданные позже (например, реплики)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+    def _start_request(self):
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            g._request_timings = RequestTimings()
+
+    @staticmethod
+    def _finish_request(response):
+        timings = current_timings()
+        if timings is None:
+            return response
+
+        total = time.perf_counter() - timings.started
+        metrics = [f'{kind};dur={seconds * 1000:.2f}' for kind, seconds in timings.durations.items()]
+        metrics[0] += f';desc="{timings.queries} queries"'
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        response.headers.add('Server-Timing', ', '.join(metrics))
+
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "duration_ms": round(total * 1000, 2),
+            "queries": timings.queries,
+            **{f'{kind}_ms': round(seconds * 1000, 2) for kind, seconds in timings.durations.items()}
+        }))
+        return response
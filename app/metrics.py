@@ -0,0 +1,256 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+from sqlalchemy import event
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+    """Значения метрик, накопленные одним потоком."""
+
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in list(other.histograms.items()):
+            merged = self.histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(list(values)):
+                merged[i] += value
+
+
+class MetricsRegistry:
+    """
+    Реестр счётчиков, гистограмм и gauge-метрик в текстовом формате Prometheus.
+
+    Запись идёт без блокировок в шард текущего потока; при чтении шарды объединяются,
+    а шарды завершившихся потоков сворачиваются в общий накопитель.
+    """
+
+    def __init__(self):
+        self._descriptions = {}
+        self._buckets = {}
+        self._callbacks = {}
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, callback=None):
+        """
+        Регистрирует счётчик.
+
+        :param callback: Функция без аргументов, возвращающая текущее значение счётчика, который
+            ведётся вне реестра; без неё счётчик увеличивается через :meth:`inc`
+        """
+        self._descriptions[name] = ('counter', documentation)
+        if callback is not None:
+            self._callbacks[name] = callback
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self._descriptions[name] = ('histogram', documentation)
+        self._buckets[name] = tuple(buckets)
+
+    def gauge(self, name, documentation, callback):
+        """
+        Регистрирует gauge-метрику, значение которой вычисляется при чтении.
+
+        :param callback: Функция без аргументов, возвращающая число или None
+        """
+        self._descriptions[name] = ('gauge', documentation)
+        self._callbacks[name] = callback
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        buckets = self._buckets[name]
+        histograms = self._shard().histograms
+        key = (name, labels)
+        values = histograms.get(key)
+        if values is None:
+            # Счётчики по корзинам (последняя - +Inf), затем сумма и количество
+            values = histograms[key] = [0] * (len(buckets) + 3)
+        values[bisect_left(buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def collect(self):
+        """Объединяет шарды всех потоков в один."""
+        total = _Shard()
+        with self._lock:
+            alive = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                else:
+                    self._retired.merge(shard)
+            self._shards = alive
+            total.merge(self._retired)
+        for shard in alive:
+            total.merge(shard)
+        return total
+
+    def render(self):
+        """Текст всех метрик в формате экспозиции Prometheus."""
+        snapshot = self.collect()
+        series = {}
+        for (name, labels), value in snapshot.counters.items():
+            series.setdefault(name, []).append(f'{name}{_format_labels(labels)} {value}')
+        for (name, labels), values in snapshot.histograms.items():
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self._buckets[name] + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {values[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {values[-1]}')
+        for name, callback in self._callbacks.items():
+            value = callback()
+            if value is not None:
+                series[name] = [f'{name} {value}']
+
+        output = []
+        for name, (kind, documentation) in self._descriptions.items():
+            if name in series:
+                output.append(f'# HELP {name} {documentation}')
+                output.append(f'# TYPE {name} {kind}')
+                output.extend(sorted(series[name]))
+        return '\n'.join(output) + '\n'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels) + '}'
+
+
+class Metrics:
+    """
+    Метрики приложения и эндпоинт ``/metrics``.
+
+    Собирает количество запросов по эндпоинтам и кодам ответа, гистограммы длительности,
+    состояние пула соединений SQLAlchemy (занятые соединения, переполнение, ожидание
+    соединения), количество здоровых реплик, глубину очереди хеширования паролей, счётчики
+    кеша списков участников и количество открытых потоков журнала изменений.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.registry = MetricsRegistry()
+        self.db = None
+        if app is not None and db is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """
+        Подключает обработчики запросов, пула соединений и регистрирует ``/metrics``.
+
+        :param app: Экземпляр Flask приложения
+        :param db: Экземпляр SQLAlchemy
+        """
+        self.db = db
+        registry = self.registry
+        registry.counter('http_requests_total', 'Total HTTP requests by endpoint, method and status.')
+        registry.histogram('http_request_duration_seconds', 'HTTP request latency by endpoint.')
+        registry.histogram('db_pool_wait_seconds', 'Time spent waiting for a pooled database connection.')
+        registry.gauge('db_pool_checked_out', 'Connections currently checked out of the pool.',
+                       lambda: self._pool_stat('checkedout'))
+        registry.gauge('db_pool_overflow', 'Connections opened above the pool size.',
+                       lambda: self._pool_stat('overflow'))
+        registry.gauge('db_pool_size', 'Configured pool size.', lambda: self._pool_stat('size'))
+
+        hasher = app.extensions.get('password_hasher')
+        if hasher is not None:
+            registry.gauge('password_hasher_queue_depth', 'Password hashing tasks accepted and not finished.',
+                           lambda: hasher.queue_depth)
+        replica_router = app.extensions.get('replica_router')
+        if replica_router is not None and replica_router.replicas:
+            registry.gauge('db_replicas_healthy', 'Read replicas currently in rotation.',
+                           lambda: replica_router.healthy_count)
+        change_feed = app.extensions.get('change_feed')
+        if change_feed is not None:
+            registry.gauge('change_feed_streams', 'Open team change Server-Sent Events streams.',
+                           lambda: change_feed.streams)
+        roster_cache = app.extensions.get('roster_cache')
+        if roster_cache is not None:
+            registry.counter('roster_cache_hits_total', 'Team roster cache hits in this process.',
+                             lambda: roster_cache.stats()['hits'])
+            registry.counter('roster_cache_misses_total', 'Team roster cache misses in this process.',
+                             lambda: roster_cache.stats()['misses'])
+
+        app.extensions['metrics'] = self
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view, methods=['GET'])
+
+        with app.app_context():
+            engine = db.engine
+        self._instrument_pool(engine.pool)
+        # После dispose() движок создаёт новый пул - оборачиваем и его
+        event.listen(engine, 'engine_disposed', lambda engine: self._instrument_pool(engine.pool))
+
+    def _instrument_pool(self, pool):
+        connect = pool.connect
+        observe = self.registry.observe
+
+        def timed_connect():
+            started = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                observe('db_pool_wait_seconds', time.perf_counter() - started)
+
+        pool.connect = timed_connect
+
+    def _pool_stat(self, name):
+        stat = getattr(self.db.engine.pool, name, None)
+        return stat() if stat is not None else None
+
+    @staticmethod
+    def _start_request():
+        g._metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        self.registry.inc('http_requests_total', (
+            ('endpoint', endpoint), ('method', request.method), ('status', str(response.status_code))
+        ))
+        self.registry.observe('http_request_duration_seconds', time.perf_counter() - started,
+                              (('endpoint', endpoint),))
+        return response
+
+    def metrics_view(self):
+        """
+        Метрики приложения в текстовом формате Prometheus.
+        ---
+        responses:
+          200:
+            description: Метрики в формате экспозиции Prometheus
+        """
+        return Response(self.registry.render(), mimetype='text/plain; version=0.0.4')
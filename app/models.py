@@ -1,10 +1,14 @@
+from sqlalchemy import DDL, event
+
 from app import db
 
 
 # Сводная таблица для хранения отношений между пользователями и командами
 user_team = db.Table('user_team',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('team_id', db.Integer, db.ForeignKey('team.id'), primary_key=True)
+    db.Column('team_id', db.Integer, db.ForeignKey('team.id'), primary_key=True),
+    # Первичный ключ начинается с user_id, поэтому для выборки участников команды нужен отдельный индекс
+    db.Index('ix_user_team_team_id', 'team_id')
 )
 
 class User(db.Model):
@@ -16,13 +20,85 @@ class User(db.Model):
     surname = db.Column(db.String(80), nullable=True)
     teams = db.relationship('Team', secondary=user_team, back_populates='members')
 
+    __table_args__ = (
+        # Email уникален и ищется без учёта регистра
+        db.Index('uq_user_email_lower', db.func.lower(email), unique=True),
+        # Каталог пользователей (GET /users): фильтр по роли с keyset-пагинацией,
+        # поиск по префиксу (btree text_pattern_ops) и поиск подстроки по триграммам (расширение pg_trgm)
+        db.Index('ix_user_role_id', role, id),
+        db.Index('ix_user_email_lower_pattern', db.func.lower(email).label('email_lower'),
+                 postgresql_ops={'email_lower': 'text_pattern_ops'}),
+        db.Index('ix_user_name_lower_pattern', db.func.lower(name).label('name_lower'),
+                 postgresql_ops={'name_lower': 'text_pattern_ops'}),
+        db.Index('ix_user_surname_lower_pattern', db.func.lower(surname).label('surname_lower'),
+                 postgresql_ops={'surname_lower': 'text_pattern_ops'}),
+        db.Index('ix_user_email_trgm', db.func.lower(email).label('email_lower'),
+                 postgresql_using='gin', postgresql_ops={'email_lower': 'gin_trgm_ops'}),
+        db.Index('ix_user_name_trgm', db.func.lower(name).label('name_lower'),
+                 postgresql_using='gin', postgresql_ops={'name_lower': 'gin_trgm_ops'}),
+        db.Index('ix_user_surname_trgm', db.func.lower(surname).label('surname_lower'),
+                 postgresql_using='gin', postgresql_ops={'surname_lower': 'gin_trgm_ops'}),
+    )
+
+    @classmethod
+    def email_is(cls, email):
+        """
+        Условие поиска пользователя по email без учёта регистра (индекс uq_user_email_lower).
+
+        :param email: Email пользователя
+        """
+        return db.func.lower(cls.email) == (email.lower() if isinstance(email, str) else email)
+
+# Триграммные индексы требуют расширения pg_trgm (при создании таблиц без миграций)
+event.listen(
+    User.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
 class Team(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
-    leader_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    leader_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # Версия состава команды: увеличивается при каждом изменении участников или их профилей
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     leader = db.relationship('User', backref=db.backref('led_teams', lazy=True))
     members = db.relationship('User', secondary=user_team, back_populates='teams')
 
+# Журнал изменений состава команд (outbox): строка добавляется в транзакции изменения,
+# клиенты читают из него только новые изменения (GET /<name_team>/changes).
+# Типы и данные изменений:
+#   team_created   - {"team_name", "leader_id"}
+#   member_added   - {"user_id", "name", "surname", "role"}
+#   member_removed - {"user_id"}
+#   member_updated - {"user_id", "name", "surname"}
+#   leader_changed - {"leader_id"}
+# Строки пишутся после увеличения Team.version: блокировка строки команды упорядочивает
+# номера изменений одной команды в порядке фиксации транзакций, поэтому читатель, запомнивший
+# последний номер, не пропустит изменение, зафиксированное позже с меньшим номером.
+class TeamChange(db.Model):
+    __tablename__ = 'team_change'
+    # Порядковый номер изменения (seq); в SQLite - INTEGER PRIMARY KEY для автоинкремента
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+    __table_args__ = (db.Index('ix_team_change_team_id_id', team_id, id),)
+
+# Ключи идемпотентности POST-запросов (app/idempotency.py): строка без кода ответа - запрос
+# выполняется, с кодом - сохранённый ответ. Строки с истёкшим expires_at удаляются при следующем
+# обращении к ключу и периодической очисткой.
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+    # SHA-256 эндпоинта, пользователя и значения заголовка Idempotency-Key
+    key = db.Column(db.String(64), primary_key=True)
+    # SHA-256 метода, пути и тела запроса: ключ нельзя повторить с другим запросом
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer, nullable=True)
+    body = db.Column(db.Text, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 class Role(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
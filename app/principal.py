@@ -0,0 +1,106 @@
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from app import replicas
+from app.cache import LRUCache
+from app.models import db, User
+
+
+# Облегчённое представление текущего пользователя: только то, что нужно обработчикам
+Principal = namedtuple('Principal', ['id', 'email', 'role'])
+
+
+class PrincipalLoader:
+    """
+    Загрузка текущего пользователя по JWT для ``flask_jwt_extended.current_user``.
+
+    Пользователи кешируются в памяти процесса (LRU + TTL), поэтому повторные запросы
+    с тем же токеном не обращаются к базе данных. Кеш локален для процесса: маршруты,
+    изменяющие или удаляющие пользователя, вызывают :meth:`invalidate`, а в остальных
+    процессах запись устаревает по ``PRINCIPAL_CACHE_TTL``.
+
+    При ``JWT_EMBED_PRINCIPAL_CLAIMS`` email и роль кладутся в сам токен и поиск не нужен
+    вовсе; изменения роли в этом случае вступают в силу только с новым токеном.
+    """
+
+    def __init__(self, app=None, jwt=None):
+        self.cache = None
+        self.identity_claim = 'sub'
+        self.embed_claims = False
+        if app is not None and jwt is not None:
+            self.init_app(app, jwt)
+
+    def init_app(self, app, jwt):
+        """
+        Создаёт кеш и регистрирует загрузчик пользователя в JWTManager.
+
+        :param app: Экземпляр Flask приложения
+        :param jwt: Экземпляр JWTManager
+        """
+        self.configure(app.config)
+        app.extensions['principal_loader'] = self
+        jwt.user_lookup_loader(self.load)
+
+    def configure(self, config):
+        """
+        Создаёт кеш по настройкам ``PRINCIPAL_CACHE_*`` и ``JWT_*`` (без привязки к Flask).
+
+        :param config: Словарь конфигурации
+        """
+        self.cache = LRUCache(config['PRINCIPAL_CACHE_SIZE'], config['PRINCIPAL_CACHE_TTL'])
+        self.identity_claim = config.get('JWT_IDENTITY_CLAIM', 'sub')
+        self.embed_claims = config['JWT_EMBED_PRINCIPAL_CLAIMS']
+
+    def load(self, jwt_header, jwt_data):
+        """
+        Возвращает Principal для проверенного токена или None, если пользователь не найден.
+
+        :param jwt_header: Заголовок токена
+        :param jwt_data: Полезная нагрузка токена
+        """
+        return self.lookup(db.session, jwt_data, replicas.use_primary)
+
+    def lookup(self, session, jwt_data, use_primary=None):
+        """
+        Principal по полезной нагрузке проверенного токена: из самого токена, кеша или базы данных.
+
+        :param session: Сессия SQLAlchemy
+        :param jwt_data: Полезная нагрузка токена
+        :param use_primary: Переключает сессию с реплики на основную базу; True, если сессия читала с реплики
+        :return: Principal или None, если пользователь не найден
+        """
+        identity = jwt_data[self.identity_claim]
+        if self.embed_claims and 'email' in jwt_data and 'role' in jwt_data:
+            return Principal(identity, jwt_data['email'], jwt_data['role'])
+
+        principal = self.cache.get(identity)
+        if principal is None:
+            stmt = select(User.id, User.email, User.role).where(User.id == identity)
+            row = session.execute(stmt).first()
+            if row is None and use_primary is not None and use_primary():
+                # Только что зарегистрированный пользователь мог ещё не дойти до реплики
+                row = session.execute(stmt).first()
+            if row is None:
+                return None
+            principal = Principal(*row)
+            self.cache.set(identity, principal)
+        return principal
+
+    def invalidate(self, user_id):
+        """
+        Удаляет пользователя из кеша после изменения или удаления.
+
+        :param user_id: Идентификатор пользователя
+        """
+        self.cache.delete(user_id)
+
+    def claims_for(self, user):
+        """
+        Дополнительные claims для токена пользователя (пусто, если встраивание выключено).
+
+        :param user: Пользователь, для которого выпускается токен
+        """
+        if not self.embed_claims:
+            return {}
+        return {"email": user.email, "role": user.role}
@@ -0,0 +1,273 @@
+from sqlalchemy import Integer, delete, exists, func, insert, literal, or_, select, tuple_, union, update
+from sqlalchemy.orm import aliased
+
+from app.models import User, Team, TeamChange, user_team
+
+
+# Построители SQL-запросов, общие для синхронного (Flask) и асинхронного (ASGI) API
+
+
+def team_version_bump(*criteria):
+    """
+    Запрос увеличения версии команд, отобранных условиями.
+
+    :param criteria: Условия отбора команд
+    """
+    return update(Team).where(*criteria).values(version=Team.version + 1)
+
+
+def team_with_leader_stmt(name_team):
+    """
+    Запрос команды вместе с именем и фамилией её лидера.
+
+    :param name_team: Название команды
+    :return: Запрос строки (id, name, leader_name, leader_surname, leader_is_member, version)
+    """
+    leader = aliased(User)
+    leader_is_member = exists().where(
+        user_team.c.user_id == Team.leader_id,
+        user_team.c.team_id == Team.id
+    )
+    return (
+        select(
+            Team.id,
+            Team.name,
+            leader.name.label('leader_name'),
+            leader.surname.label('leader_surname'),
+            leader_is_member.label('leader_is_member'),
+            Team.version
+        )
+        .join(leader, leader.id == Team.leader_id)
+        .where(Team.name == name_team)
+    )
+
+
+def team_members_stmt(team_id, after=None, limit=None):
+    """
+    Строит запрос проекции участников команды, упорядоченных по id (keyset-пагинация).
+
+    :param team_id: Идентификатор команды
+    :param after: Id последнего участника предыдущей страницы
+    :param limit: Максимальное количество строк
+    """
+    stmt = (
+        select(User.id, User.name, User.surname, User.role)
+        .join(user_team, user_team.c.user_id == User.id)
+        .where(user_team.c.team_id == team_id)
+        .order_by(User.id)
+    )
+    if after is not None:
+        stmt = stmt.where(User.id > after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def user_teams_clause(user_id):
+    """
+    Условие отбора команд, в списках участников которых отображается пользователь.
+
+    :param user_id: Идентификатор пользователя
+    :return: Условие для Team: пользователь участник или лидер команды
+    """
+    # UNION вместо OR, чтобы обе части использовали индексы (ix_user_team_team_id, ix_team_leader_id)
+    member_or_leader = union(
+        select(user_team.c.team_id).where(user_team.c.user_id == user_id),
+        select(Team.id).where(Team.leader_id == user_id)
+    )
+    return Team.id.in_(member_or_leader)
+
+
+def membership_delete(user_id, team_id):
+    """
+    Запрос удаления пользователя из команды.
+
+    :param user_id: Идентификатор пользователя
+    :param team_id: Идентификатор команды
+    """
+    return delete(user_team).where(user_team.c.user_id == user_id, user_team.c.team_id == team_id)
+
+
+def memberships_delete(pairs):
+    """
+    Запрос удаления участия пользователей в командах одним ``DELETE ... WHERE (user_id, team_id) IN``.
+
+    :param pairs: Пары (user_id, team_id)
+    :return: Запрос, возвращающий удалённые пары (user_id, team_id)
+    """
+    return (
+        delete(user_team)
+        .where(tuple_(user_team.c.user_id, user_team.c.team_id).in_(pairs))
+        .returning(user_team.c.user_id, user_team.c.team_id)
+    )
+
+
+def memberships_copy(user_ids, from_team_id, to_team_id):
+    """
+    Запрос ``INSERT ... SELECT``, добавляющий участников одной команды в другую.
+
+    Пользователи, которые не состоят в исходной команде или уже состоят в целевой, пропускаются.
+
+    :param user_ids: Идентификаторы пользователей
+    :param from_team_id: Идентификатор исходной команды
+    :param to_team_id: Идентификатор целевой команды
+    :return: Запрос, возвращающий user_id добавленных участников
+    """
+    target = user_team.alias('target')
+    members = select(user_team.c.user_id, literal(to_team_id, Integer)).where(
+        user_team.c.team_id == from_team_id,
+        user_team.c.user_id.in_(user_ids),
+        ~exists().where(target.c.user_id == user_team.c.user_id, target.c.team_id == to_team_id)
+    )
+    return (
+        insert(user_team)
+        .from_select([user_team.c.user_id, user_team.c.team_id], members)
+        .returning(user_team.c.user_id)
+    )
+
+
+def orphaned_user_delete(*user_ids):
+    """
+    Запрос удаления пользователей, которые не состоят ни в одной команде и не руководят ими.
+
+    :param user_ids: Идентификаторы пользователей
+    """
+    return delete(User).where(
+        User.id.in_(user_ids),
+        ~exists().where(user_team.c.user_id == User.id),
+        ~exists().where(Team.leader_id == User.id)
+    )
+
+
+def teams_for_update_stmt(names):
+    """
+    Запрос команд по названиям с блокировкой строк (``SELECT ... FOR UPDATE``) в порядке id.
+
+    Одинаковый порядок блокировки не даёт параллельным транзакциям взаимно заблокировать друг друга.
+
+    :param names: Названия команд
+    :return: Запрос строк (id, name, leader_id)
+    """
+    return (
+        select(Team.id, Team.name, Team.leader_id)
+        .where(Team.name.in_(names))
+        .order_by(Team.id)
+        .with_for_update()
+    )
+
+
+def users_by_email_stmt(emails):
+    """
+    Запрос пользователей по email без учёта регистра (индекс uq_user_email_lower).
+
+    :param emails: Email в нижнем регистре
+    :return: Запрос строк (id, email, name, surname, role); email в нижнем регистре
+    """
+    lowered_email = func.lower(User.email)
+    return (
+        select(User.id, lowered_email.label('email'), User.name, User.surname, User.role)
+        .where(lowered_email.in_(emails))
+    )
+
+
+# Поля каталога пользователей, доступные в параметре fields
+USER_DIRECTORY_COLUMNS = {
+    'id': User.id,
+    'email': User.email,
+    'name': User.name,
+    'surname': User.surname,
+    'role': User.role,
+}
+
+
+def _like_escape(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def user_search_clause(term, contains=False):
+    """
+    Условие поиска пользователей по email, имени и фамилии без учёта регистра.
+
+    Поиск по префиксу использует индекс ix_user_email_lower_pattern (email) и триграммные
+    индексы (имя и фамилия), поиск подстроки - триграммные индексы ix_user_*_trgm (pg_trgm).
+
+    :param term: Строка поиска
+    :param contains: Искать подстроку, а не префикс
+    """
+    pattern = _like_escape(term.lower())
+    pattern = f'%{pattern}%' if contains else f'{pattern}%'
+    return or_(*(
+        func.lower(column).like(pattern, escape='\\') for column in (User.email, User.name, User.surname)
+    ))
+
+
+def users_page_stmt(fields, after=None, limit=None, role=None, team_id=None, search=None, contains=False):
+    """
+    Строит запрос страницы каталога пользователей, упорядоченных по id (keyset-пагинация).
+
+    :param fields: Названия полей из USER_DIRECTORY_COLUMNS; id выбирается всегда (курсор)
+    :param after: Id последнего пользователя предыдущей страницы
+    :param limit: Максимальное количество строк
+    :param role: Отбор по роли
+    :param team_id: Отбор по участию в команде
+    :param search: Строка поиска по email, имени и фамилии
+    :param contains: Искать подстроку, а не префикс
+    """
+    columns = [User.id] + [USER_DIRECTORY_COLUMNS[field] for field in fields if field != 'id']
+    stmt = select(*columns).order_by(User.id)
+    if team_id is not None:
+        stmt = stmt.join(user_team, user_team.c.user_id == User.id).where(user_team.c.team_id == team_id)
+    if role is not None:
+        stmt = stmt.where(User.role == role)
+    if search:
+        stmt = stmt.where(user_search_clause(search, contains))
+    if after is not None:
+        stmt = stmt.where(User.id > after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def team_change(team_id, kind, **data):
+    """
+    Строка журнала изменений команды для ``insert(TeamChange)``.
+
+    Записывается в транзакции изменения после увеличения версии команды (см. TeamChange).
+
+    :param team_id: Идентификатор команды
+    :param kind: Тип изменения
+    :param data: Данные изменения
+    """
+    return {"team_id": team_id, "kind": kind, "payload": data}
+
+
+def team_changes_stmt(team_id, since=0, limit=None):
+    """
+    Запрос изменений команды с номером больше ``since`` (индекс ix_team_change_team_id_id).
+
+    :param team_id: Идентификатор команды
+    :param since: Номер последнего полученного изменения
+    :param limit: Максимальное количество строк
+    :return: Запрос строк (id, kind, payload, created_at)
+    """
+    stmt = (
+        select(TeamChange.id, TeamChange.kind, TeamChange.payload, TeamChange.created_at)
+        .where(TeamChange.team_id == team_id, TeamChange.id > since)
+        .order_by(TeamChange.id)
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def team_etag(team_id, version, ndjson=False):
+    """
+    Строгий ETag списка участников: идентификатор команды, её версия и формат ответа.
+
+    :param team_id: Идентификатор команды
+    :param version: Версия команды
+    :param ndjson: Потоковый формат ответа
+    """
+    etag = f'{team_id}.{version}'
+    return f'{etag}.ndjson' if ndjson else etag
+
@@ -0,0 +1,236 @@
+import itertools
+import logging
+import math
+import threading
+import time
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.cache import LRUCache
+from app.database import engine_options
+
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики PostgreSQL в секундах: 0, если всё полученное WAL уже применено
+# (иначе на простаивающем мастере отставание росло бы без новых транзакций)
+_PG_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+class RoutingSession(Session):
+    """
+    Сессия ``db.session``, отправляющая чтения запроса на реплику, выбранную :class:`ReplicaRouter`.
+
+    На реплику уходят только SELECT вне flush; запись, запросы вне контекста запроса (CLI,
+    миграции, создание таблиц) и запросы без выбранной реплики выполняются на основной базе.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            replica = g.get('_db_replica')
+            if replica is not None and clause is not None and clause.is_select:
+                return replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class Replica:
+    """
+    Движок реплики и результат последней проверки её состояния.
+
+    До первой проверки реплика не получает чтений.
+
+    :param engine: Движок SQLAlchemy
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+        self.checking = False
+
+
+class ReplicaRouter:
+    """
+    Маршрутизация чтений на реплики базы данных (``SQLALCHEMY_REPLICA_URIS``).
+
+    GET-запросы к эндпоинтам из ``DB_REPLICA_ENDPOINTS`` читают с реплики, выбранной по кругу
+    среди здоровых; остальные запросы работают с основной базой. Реплика считается нездоровой
+    после ошибки подключения или при отставании больше ``DB_REPLICA_MAX_LAG`` секунд и снова
+    проверяется не чаще раза в ``DB_REPLICA_CHECK_INTERVAL`` секунд. Проверка выполняется в фоновом
+    потоке, запрос её не ждёт и пользуется последним результатом; подключение к реплике ограничено
+    ``DB_REPLICA_CONNECT_TIMEOUT`` секундами. Если здоровых реплик нет, чтение идёт с основной базы.
+
+    Чтобы клиент видел собственные изменения, после успешного изменяющего запроса его чтения
+    ``DB_REPLICA_STICKY_SECONDS`` секунд идут на основную базу. Клиент определяется по заголовку
+    Authorization (без него - по IP) в пределах процесса и по cookie ``db_sticky`` между процессами.
+    """
+
+    STICKY_COOKIE = 'db_sticky'
+    SAFE_METHODS = ('GET', 'HEAD')
+
+    def __init__(self, app=None):
+        self.replicas = []
+        self.endpoints = frozenset()
+        self.config = None
+        self._sticky = None
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Создаёт движки реплик с параметрами пула основной базы и регистрирует обработчики запросов.
+
+        :param app: Экземпляр Flask приложения
+        """
+        self.config = app.config
+        self.replicas = [self._create_replica(url) for url in app.config['SQLALCHEMY_REPLICA_URIS']]
+        self.endpoints = frozenset(
+            filter(None, (name.strip() for name in app.config['DB_REPLICA_ENDPOINTS'].split(',')))
+        )
+        self._sticky = LRUCache(app.config['DB_REPLICA_STICKY_CLIENTS'], app.config['DB_REPLICA_STICKY_SECONDS'])
+        app.extensions['replica_router'] = self
+        if self.replicas:
+            app.before_request(self._route)
+            app.after_request(self._stick)
+
+    def _create_replica(self, url):
+        options = engine_options({**self.config, "SQLALCHEMY_DATABASE_URI": url})
+        connect_timeout = self.config['DB_REPLICA_CONNECT_TIMEOUT']
+        if connect_timeout and make_url(url).get_backend_name() == 'postgresql':
+            # Недоступная реплика не должна держать запрос и проверку до системного таймаута TCP
+            options["connect_args"] = {"connect_timeout": max(1, math.ceil(connect_timeout))}
+        engine = create_engine(url, **options)
+        replica = Replica(engine)
+        event.listen(engine, 'handle_error', lambda context: self._on_error(replica, context))
+        return replica
+
+    def after_fork(self):
+        """Сбрасывает соединения реплик, унаследованные рабочим процессом от мастер-процесса."""
+        for replica in self.replicas:
+            # close=False: соединения мастер-процесса не закрываются, а просто забываются
+            replica.engine.dispose(close=False)
+            # Поток проверки мастер-процесса в рабочий процесс не переходит
+            replica.healthy, replica.lag, replica.checked_at, replica.checking = False, None, None, False
+
+    @property
+    def healthy_count(self):
+        return sum(replica.healthy for replica in self.replicas)
+
+    def choose(self):
+        """
+        Выбирает следующую здоровую реплику по кругу и запускает фоновые проверки, срок которых подошёл.
+
+        :return: Replica или None, если здоровых реплик нет
+        """
+        for replica in self.replicas:
+            self._check_if_due(replica)
+        count = len(self.replicas)
+        start = next(self._counter)
+        for offset in range(count):
+            replica = self.replicas[(start + offset) % count]
+            if replica.healthy:
+                return replica
+        return None
+
+    def _check_if_due(self, replica):
+        checked_at = replica.checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.config['DB_REPLICA_CHECK_INTERVAL']:
+            return
+        with self._lock:
+            # Проверку выполняет один поток, запросы пользуются последним результатом
+            if replica.checking:
+                return
+            replica.checking = True
+        threading.Thread(target=self._check_in_background, args=(replica,), name='replica-check', daemon=True).start()
+
+    def _check_in_background(self, replica):
+        try:
+            self.check(replica)
+        finally:
+            replica.checking = False
+
+    def check(self, replica):
+        """
+        Проверяет подключение к реплике и её отставание от основной базы (только PostgreSQL).
+
+        :param replica: Проверяемая реплика
+        :return: True, если реплика здорова
+        """
+        try:
+            with replica.engine.connect() as connection:
+                if connection.dialect.name == 'postgresql':
+                    lag = connection.exec_driver_sql(_PG_LAG_QUERY).scalar()
+                else:
+                    lag = 0.0
+        except SQLAlchemyError as error:
+            logger.warning('Replica %s is unavailable: %s', replica.engine.url, error)
+            replica.healthy, replica.lag = False, None
+        else:
+            replica.lag = None if lag is None else float(lag)
+            replica.healthy = replica.lag is not None and replica.lag <= self.config['DB_REPLICA_MAX_LAG']
+            if not replica.healthy:
+                logger.warning('Replica %s is lagging: %s s', replica.engine.url, replica.lag)
+        replica.checked_at = time.monotonic()
+        return replica.healthy
+
+    @staticmethod
+    def _on_error(replica, context):
+        # Ошибки подключения и обрывы соединения выводят реплику из ротации до следующей проверки;
+        # ошибки отдельных запросов (например, таймаут) на её состояние не влияют
+        if context.connection is None or context.is_disconnect:
+            replica.healthy = False
+            replica.checked_at = time.monotonic()
+
+    @staticmethod
+    def _client_key():
+        return request.headers.get('Authorization') or request.remote_addr
+
+    def _is_sticky(self):
+        if self._sticky.get(self._client_key()) is not None:
+            return True
+        try:
+            return float(request.cookies.get(self.STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _route(self):
+        if (request.method not in self.SAFE_METHODS or request.endpoint not in self.endpoints
+                or self._is_sticky()):
+            return None
+        g._db_replica = self.choose()
+        return None
+
+    def _stick(self, response):
+        if request.method in self.SAFE_METHODS or response.status_code >= 400:
+            return response
+        sticky_seconds = self.config['DB_REPLICA_STICKY_SECONDS']
+        self._sticky.set(self._client_key(), True)
+        response.set_cookie(self.STICKY_COOKIE, f'{time.time() + sticky_seconds:.3f}',
+                            max_age=math.ceil(sticky_seconds), httponly=True, samesite='Lax')
+        return response
+
+    @staticmethod
+    def use_primary():
+        """
+        Переключает чтения оставшейся части запроса на основную базу.
+
+        Используется, когда данные могли ещё не дойти до реплики (например, только что
+        созданная команда) или результат попадает в общий кеш.
+
+        :return: True, если запрос до этого читал с реплики
+        """
+        if not has_request_context():
+            return False
+        return g.pop('_db_replica', None) is not None
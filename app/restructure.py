@@ -0,0 +1,155 @@
+from collections import defaultdict
+
+from app.queries import team_change
+from app.schemas import LEADER_TRANSFER, MEMBERSHIP_MOVE, MEMBERSHIP_REMOVAL
+
+
+# Списки операций в теле запроса, схемы их элементов и поля элемента в порядке хранения в плане
+OPERATIONS = (
+    ('remove', MEMBERSHIP_REMOVAL, ('team', 'email')),
+    ('move', MEMBERSHIP_MOVE, ('email', 'from_team', 'to_team')),
+    ('leaders', LEADER_TRANSFER, ('team', 'email')),
+)
+
+
+class RestructurePlan:
+    """
+    План перестройки команд (``POST /teams:restructure``): удаление участников из команд,
+    перевод в другие команды и смена лидеров одной транзакцией.
+
+    План проверяет тело запроса, запоминает найденные команды и пользователей и строит
+    параметры set-based запросов из :mod:`app.queries` и строки журнала изменений.
+    Запросы выполняют Flask- и ASGI-версии API в порядке: удаление, перевод, смена лидеров,
+    удаление осиротевших пользователей, увеличение версий и запись журнала.
+
+    :param data: Разобранное тело запроса
+    :raises ValueError: С текстом ошибки для ответа 400
+    """
+
+    def __init__(self, data):
+        if not isinstance(data, dict) or not data.keys() <= {name for name, _, _ in OPERATIONS}:
+            raise ValueError("Invalid JSON")
+        operations = {}
+        for name, schema, fields in OPERATIONS:
+            items = data.get(name, [])
+            if not isinstance(items, list):
+                raise ValueError(f"Invalid argument: {name}")
+            for index, item in enumerate(items):
+                error = schema.validate(item)
+                if error:
+                    raise ValueError(f"{name}[{index}]: {error}")
+            # Email сравниваются без учёта регистра, как при входе
+            operations[name] = [
+                tuple(item[field].lower() if field == 'email' else item[field] for field in fields) for item in items
+            ]
+        self.remove, self.move, self.leaders = operations['remove'], operations['move'], operations['leaders']
+
+        for index, (_, from_team, to_team) in enumerate(self.move):
+            if from_team == to_team:
+                raise ValueError(f"move[{index}]: Invalid argument: to_team")
+        if len({team for team, _ in self.leaders}) != len(self.leaders):
+            raise ValueError("Duplicate team in leaders")
+
+        self.teams = {}
+        self.users = {}
+
+    def __len__(self):
+        return len(self.remove) + len(self.move) + len(self.leaders)
+
+    @property
+    def team_names(self):
+        """Названия всех команд плана."""
+        return ({team for team, _ in self.remove} | {team for _, team, _ in self.move}
+                | {team for _, _, team in self.move} | {team for team, _ in self.leaders})
+
+    @property
+    def emails(self):
+        """Email всех пользователей плана (в нижнем регистре)."""
+        return ({email for _, email in self.remove} | {email for email, _, _ in self.move}
+                | {email for _, email in self.leaders})
+
+    def check_teams(self, rows, leader_id):
+        """
+        Запоминает найденные команды и проверяет, что все они существуют и ими руководит ``leader_id``.
+
+        :param rows: Строки (id, name, leader_id) запроса :func:`app.queries.teams_for_update_stmt`
+        :param leader_id: Идентификатор пользователя, выполняющего запрос
+        :return: Кортеж (тело ответа, код) с ошибкой или None
+        """
+        self.teams = {row.name: row for row in rows}
+        missing = sorted(self.team_names - self.teams.keys())
+        if missing:
+            return {"error": "Team not found", "teams": missing}, 404
+        if any(team.leader_id != leader_id for team in self.teams.values()):
+            return {"error": "Unauthorized access"}, 403
+        return None
+
+    def check_users(self, rows):
+        """
+        Запоминает найденных пользователей и проверяет, что все они существуют.
+
+        :param rows: Строки (id, email, name, surname, role) запроса :func:`app.queries.users_by_email_stmt`
+        :return: Кортеж (тело ответа, код) с ошибкой или None
+        """
+        self.users = {row.email: row for row in rows}
+        missing = sorted(self.emails - self.users.keys())
+        if missing:
+            return {"error": "User not found", "emails": missing}, 404
+        return None
+
+    def removals(self):
+        """Пары (user_id, team_id) для :func:`app.queries.memberships_delete`."""
+        return [(self.users[email].id, self.teams[team].id) for team, email in self.remove]
+
+    def moves(self):
+        """
+        Переводы, сгруппированные по паре команд: один ``INSERT ... SELECT`` на группу.
+
+        :return: Словарь {(from_team_id, to_team_id): [user_id, ...]}
+        """
+        groups = defaultdict(list)
+        for email, from_team, to_team in self.move:
+            groups[self.teams[from_team].id, self.teams[to_team].id].append(self.users[email].id)
+        return groups
+
+    def transfers(self):
+        """
+        Смена лидеров без команд, которыми уже руководит указанный пользователь.
+
+        :return: Словарь {team_id: leader_id}
+        """
+        transfers = {}
+        for team, email in self.leaders:
+            leader_id = self.users[email].id
+            if leader_id != self.teams[team].leader_id:
+                transfers[self.teams[team].id] = leader_id
+        return transfers
+
+    def changes(self, removed, moved, joined, transfers):
+        """
+        Строки журнала изменений выполненного плана.
+
+        :param removed: Пары (user_id, team_id), удалённые из команд
+        :param moved: Пары (user_id, team_id), переведённые из исходных команд
+        :param joined: Пары (user_id, team_id), добавленные в целевые команды и к новым лидерам
+        :param transfers: Выполненная смена лидеров {team_id: leader_id}
+        :return: Список строк для ``insert(TeamChange)``
+        """
+        users = {user.id: user for user in self.users.values()}
+        changes = [team_change(team_id, 'member_removed', user_id=user_id) for user_id, team_id in removed + moved]
+        changes.extend(
+            team_change(team_id, 'member_added', user_id=user_id, name=users[user_id].name,
+                        surname=users[user_id].surname, role=users[user_id].role)
+            for user_id, team_id in joined
+        )
+        changes.extend(team_change(team_id, 'leader_changed', leader_id=leader_id)
+                       for team_id, leader_id in transfers.items())
+        return changes
+
+    def team_names_of(self, team_ids):
+        """
+        Названия команд по идентификаторам (для сброса кеша списков участников).
+
+        :param team_ids: Идентификаторы команд
+        """
+        return [team.name for team in self.teams.values() if team.id in team_ids]
@@ -1,108 +1,206 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash
-from app.models import db, User, Team
-from app.utils import validate_json
+import time
+
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask_jwt_extended import current_user
+from app import admission, change_feed, hasher, principals, replicas, roster_cache, services
+from app.idempotency import idempotent
+from app.instrumentation import timed
+from app.models import db
+from app.queries import team_etag, team_members_stmt
+from app.serializers import TEAM, TEAM_MEMBER, dumps, team_change_events, team_leader
+from app.services import APIError
+from app.uow import after_commit, end_read, in_batch_transaction, unit_of_work
+from app.schemas import MEMBER, NEW_TEAM, PROFILE
+from app.utils import (
+    body_too_large, jwt_required, parse_changes_args, parse_page_args, validate_json, wants_format
+)
 
 
 routes_bp = Blueprint('routes', __name__)
 
 
+@routes_bp.app_errorhandler(APIError)
+def _handle_api_error(error):
+    """Ответ на ошибку операции :mod:`app.services` (для маршрутов auth и routes)."""
+    return jsonify(error.body), error.status
+
+
+def _publish_changes(team_names, user_ids=()):
+    """
+    После фиксации изменений сбрасывает кеши списков участников и пользователей
+    и будит потоки журнала изменений (:func:`app.uow.after_commit`).
+
+    :param team_names: Названия изменённых команд
+    :param user_ids: Идентификаторы изменённых или удалённых пользователей
+    """
+    def publish(team_names, user_ids):
+        roster_cache.invalidate(*team_names)
+        for user_id in user_ids:
+            principals.invalidate(user_id)
+        change_feed.notify()
+
+    after_commit(publish, tuple(team_names), tuple(user_ids))
+
+
+def _respond(result):
+    """
+    Ответ по результату операции :mod:`app.services`; изменённые команды и пользователи
+    публикуются после фиксации транзакции.
+
+    :param result: services.Result
+    :return: Ответ Flask
+    """
+    if result.team_names or result.user_ids:
+        _publish_changes(result.team_names, result.user_ids)
+    if isinstance(result.body, str):
+        return Response(result.body, result.status, mimetype='application/json')
+    with timed('serialize'):
+        response = jsonify(result.body)
+    return response, result.status
+
+
 @routes_bp.route('/new_team', methods=['POST'])
 @jwt_required()
-@validate_json('team_name')
+@validate_json(NEW_TEAM)
+@idempotent
 def new_team():
     """
     Создание новой команды.
     ---
     parameters:
-      - name: team_name
+      - name: body
         in: body
-        type: string
         required: true
-        description: Название команды
+        schema:
+          $ref: '#/definitions/NewTeam'
+      - name: Idempotency-Key
+        in: header
+        type: string
+        required: false
+        description: Ключ для безопасного повтора запроса (повтор получает сохранённый ответ)
     responses:
       201:
         description: Команда успешно создана
       400:
         description: Название команды уже существует или неверный запрос
+      409:
+        description: Запрос с этим Idempotency-Key ещё выполняется
+      422:
+        description: Idempotency-Key уже использован с другим запросом
     """
-    data = request.get_json()
-    team_name = data.get('team_name')
-    leader_id = get_jwt_identity()
-    leader = User.query.get(leader_id)
-
-    if Team.query.filter_by(name=team_name).first():
-        return jsonify({"error": "Team name already exists"}), 400
-
-    new_team = Team(name=team_name, leader_id=leader_id)
-    db.session.add(new_team)
-    db.session.commit()
-
-    # Обновляем пользователя, чтобы указать его команду
-    leader.teams.append(new_team)
-    db.session.commit()
-
-    return jsonify({
-        "message": "Team created successfully",
-        "invite_link": f"http://site.ru/{team_name}/add_member"
-    }), 201
+    with unit_of_work() as session:
+        result = services.create_team(session, request.get_json()['team_name'], current_user.id)
+    return _respond(result)
 
 
 @routes_bp.route('/<name_team>/add_member', methods=['POST'])
-@validate_json('name', 'surname', 'email', 'password')
+@validate_json(MEMBER)
+@idempotent
 def add_member(name_team):
     """
     Добавление нового участника в команду.
     ---
     parameters:
-      - name: name
+      - name: body
         in: body
-        type: string
         required: true
-        description: Имя участника
-      - name: surname
-        in: body
+        schema:
+          $ref: '#/definitions/Member'
+      - name: Idempotency-Key
+        in: header
         type: string
-        required: true
-        description: Фамилия участника
-      - name: email
-        in: body
-        type: string
-        required: true
-        description: Email участника
-      - name: password
-        in: body
-        type: string
-        required: true
-        description: Пароль участника
+        required: false
+        description: Ключ для безопасного повтора запроса (повтор получает сохранённый ответ)
     responses:
       201:
         description: Участник успешно добавлен
       400:
         description: Участник уже существует или неверный запрос
+      409:
+        description: Запрос с этим Idempotency-Key ещё выполняется
+      422:
+        description: Idempotency-Key уже использован с другим запросом
+      503:
+        description: Сервер перегружен, повторите запрос позже
     """
     data = request.get_json()
-    name = data.get('name')
-    surname = data.get('surname')
-    email = data.get('email')
-    password = data.get('password')
+    team_id = services.team_id_by_name(db.session, name_team)
+    end_read()  # пароль хешируется без открытой транзакции
+    hashed_password = hasher.hash(data['password'])
+    with unit_of_work() as session:
+        result = services.add_member(session, team_id, name_team, data, hashed_password)
+    return _respond(result)
 
-    team = Team.query.filter_by(name=name_team).first()
-    if not team:
-        return jsonify({"error": "Team not found"}), 404
 
-    if User.query.filter_by(email=email).first():
-        return jsonify({"error": "User already exists"}), 400
+def _read_bulk_rows():
+    """
+    Читает тело запроса массового импорта: JSON-массив или NDJSON (по строке на участника).
+
+    :return: Список переданных строк.
+    :raises ValueError: Если тело не является массивом объектов.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        loads = current_app.json.loads
+        rows = [loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+    else:
+        rows = request.get_json(silent=True)
+    if not isinstance(rows, list):
+        raise ValueError('body must be a list')
+    return rows
 
-    hashed_password = generate_password_hash(password)
-    new_user = User(name=name, surname=surname, email=email, password=hashed_password, role='member')
-    new_user.teams.append(team)
-    team.members.append(new_user)
-    db.session.add(new_user)
-    db.session.commit()
 
-    return jsonify({"message": "Member added successfully"}), 201
+@routes_bp.route('/<name_team>/members:bulk', methods=['POST'])
+@jwt_required()
+def add_members_bulk(name_team):
+    """
+    Массовое добавление участников в команду (доступно только лидеру команды).
+    ---
+    consumes:
+      - application/json
+      - application/x-ndjson
+    parameters:
+      - name: name_team
+        in: path
+        type: string
+        required: true
+        description: Название команды
+      - name: members
+        in: body
+        required: true
+        description: JSON-массив или NDJSON с полями name, surname, email, password
+        schema:
+          type: array
+          items:
+            $ref: '#/definitions/Member'
+    responses:
+      200:
+        description: Отчёт о добавлении по каждой строке
+      400:
+        description: Неверный запрос
+      403:
+        description: Нет доступа
+      404:
+        description: Команда не найдена
+      413:
+        description: Слишком много строк в запросе или слишком большое тело запроса
+    """
+    if body_too_large(current_app.config['MAX_CONTENT_LENGTH']):
+        return jsonify({"error": "Request body too large"}), 413
+    try:
+        rows = _read_bulk_rows()
+    except ValueError:
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    config = current_app.config
+    members = services.prepare_member_import(db.session, name_team, current_user.id, rows, config)
+    # Хеширование занимает секунды: соединение на это время возвращается в пул, а дубликаты,
+    # появившиеся за это время, отсекает ON CONFLICT в import_members
+    end_read()
+    hashed_passwords = hasher.hash_many([values['password'] for _, values in members.new_users])
+    with unit_of_work() as session:
+        result = services.import_members(session, name_team, members, hashed_passwords,
+                                         config['BULK_INSERT_BATCH_SIZE'])
+    return _respond(result)
 
 
 @routes_bp.route('/<name_team>/<user_email>', methods=['DELETE'])
@@ -128,76 +226,117 @@ def delete_user(name_team, user_email):
       400:
         description: Пользователь не найден или нет доступа
     """
-    current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
-    user_to_delete = User.query.filter_by(email=user_email).first()
-    team = Team.query.filter_by(name=name_team).first()
-
-    if not user_to_delete:
-        return jsonify({"error": "User not found"}), 404
-
-    if not team:
-        return jsonify({"error": "Team not found"}), 404
-
-    if current_user.id != team.leader_id:
-        return jsonify({"error": "Unauthorized access"}), 403
+    with unit_of_work() as session:
+        result = services.remove_member(session, name_team, user_email, current_user.id)
+    return _respond(result)
 
-    if team not in user_to_delete.teams:
-        return jsonify({"error": "User does not belong to this team"}), 400
 
-    # Удаляем пользователя из команды
-    user_to_delete.teams.remove(team)
-    db.session.commit()
-
-    # Проверяем, состоит ли пользователь еще в каких-либо командах
-    if not user_to_delete.teams:
-        # Если нет, удаляем пользователя из базы данных
-        db.session.delete(user_to_delete)
-        db.session.commit()
-
-    return jsonify({"message": "User removed from team successfully"}), 200
+@routes_bp.route('/teams:restructure', methods=['POST'])
+@jwt_required()
+def restructure_teams():
+    """
+    Перестройка команд одной транзакцией: удаление участников, перевод в другие команды
+    и смена лидеров (доступно лидеру всех указанных команд).
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            remove:
+              type: array
+              items:
+                $ref: '#/definitions/MembershipRemoval'
+            move:
+              type: array
+              items:
+                $ref: '#/definitions/MembershipMove'
+            leaders:
+              type: array
+              items:
+                $ref: '#/definitions/LeaderTransfer'
+    responses:
+      200:
+        description: Количество выполненных и пропущенных операций
+      400:
+        description: Неверный запрос
+      403:
+        description: Нет доступа
+      404:
+        description: Команда или пользователь не найдены
+      413:
+        description: Слишком много операций в запросе или слишком большое тело запроса
+    """
+    if body_too_large(current_app.config['MAX_CONTENT_LENGTH']):
+        return jsonify({"error": "Request body too large"}), 413
+    with unit_of_work() as session:
+        result = services.restructure_teams(session, request.get_json(silent=True), current_user.id,
+                                            current_app.config)
+    return _respond(result)
 
 
 @routes_bp.route('/<name_team>/<user_email>/profile', methods=['PUT'])
 @jwt_required()
-@validate_json('name', 'surname')
+@validate_json(PROFILE)
 def update_profile(name_team, user_email):
     """
     Обновление профиля пользователя.
     ---
     parameters:
-      - name: name
+      - name: body
         in: body
-        type: string
         required: true
-        description: Имя пользователя
-      - name: surname
-        in: body
-        type: string
-        required: true
-        description: Фамилия пользователя
+        schema:
+          $ref: '#/definitions/Profile'
     responses:
       200:
         description: Профиль успешно обновлен
       400:
         description: Пользователь не найден или нет доступа
     """
-    current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
-    user_to_update = User.query.filter_by(email=user_email).first()
+    with unit_of_work() as session:
+        result = services.update_profile(session, user_email, current_user, request.get_json())
+    return _respond(result)
 
-    if not user_to_update:
-        return jsonify({"error": "User not found"}), 404
 
-    if current_user.email != user_email:
-        return jsonify({"error": "Unauthorized access"}), 403
+def _roster_response(response, etag):
+    """
+    Ставит ETag ответа со списком участников.
 
-    data = request.get_json()
-    user_to_update.name = data.get('name', user_to_update.name)
-    user_to_update.surname = data.get('surname', user_to_update.surname)
-    db.session.commit()
+    Формат списка (JSON или NDJSON) выбирается и по заголовку Accept, поэтому ответ,
+    в том числе 304, помечается ``Vary: Accept`` для общих кешей.
+    """
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    return response
+
+
+def _not_modified(etag):
+    """Ответ 304 для клиента, у которого уже есть актуальная версия."""
+    return _roster_response(Response(status=304), etag)
 
-    return jsonify({"message": "Profile updated successfully"}), 200
+
+def _stream_team_members(team, after, etag):
+    """
+    Отдаёт участников команды построчно (NDJSON), читая строки через серверный курсор.
+
+    Первая строка содержит название команды, затем по строке на участника; лидер, если его нет среди
+    участников, - последней строкой, как в конце полного списка.
+    """
+    stmt = team_members_stmt(team.id, after=after).execution_options(
+        yield_per=current_app.config['TEAM_MEMBERS_STREAM_BATCH']
+    )
+
+    def generate():
+        yield TEAM(team) + '\n'
+        for member in db.session.execute(stmt):
+            yield TEAM_MEMBER(member) + '\n'
+        if not team.leader_is_member:
+            yield dumps(team_leader(team)) + '\n'
+
+    return _roster_response(Response(stream_with_context(generate()), mimetype='application/x-ndjson'), etag)
 
 
 @routes_bp.route('/<name_team>', methods=['GET'])
@@ -211,32 +350,221 @@ def get_team_members(name_team):
         type: string
         required: true
         description: Название команды
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Размер страницы (включает keyset-пагинацию)
+      - name: after
+        in: query
+        type: integer
+        required: false
+        description: Курсор - значение next_cursor предыдущей страницы
+      - name: format
+        in: query
+        type: string
+        required: false
+        description: ndjson - потоковая выдача по одному участнику в строке
     responses:
       200:
         description: Информация о членах команды
+      304:
+        description: Список не изменился (If-None-Match совпадает с ETag)
+      400:
+        description: Неверные параметры пагинации
+      404:
+        description: Команда не найдена
+    """
+    try:
+        limit, after = parse_page_args(request.args, current_app.config)
+    except ValueError:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+
+    # Полный список участников в JSON отдаём из кеша; страницы, потоковая выдача и подзапросы
+    # атомарного пакета (видят его незафиксированные изменения) идут в базу
+    ndjson = wants_format(request.args, request.accept_mimetypes, 'ndjson', 'application/x-ndjson')
+    cacheable = limit is None and after is None and not ndjson and not in_batch_transaction()
+    current_etag = None
+    if cacheable:
+        if roster_cache.verify_versions:
+            # Кеш процесса не видит изменений из других рабочих процессов: сверяем версию команды
+            current_etag = services.current_team_etag(db.session, name_team, ndjson)
+        cached = roster_cache.get(name_team, current_etag)
+        if cached is not None:
+            etag, body = cached
+            if request.if_none_match.contains_weak(etag):
+                return _not_modified(etag)
+            return _roster_response(Response(body, 200, mimetype='application/json'), etag)
+        if roster_cache.enabled:
+            # Кеш общий для клиентов: заполняем его только с основной базы, а не с отстающей реплики
+            replicas.use_primary()
+
+    if request.if_none_match:
+        etag = current_etag or services.current_team_etag(db.session, name_team, ndjson)
+        if etag is not None and request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+
+    team = services.team_with_leader(db.session, name_team, replicas.use_primary)
+    etag = team_etag(team.id, team.version, ndjson)
+    if ndjson:
+        return _stream_team_members(team, after, etag)
+
+    body = services.team_members_body(db.session, team, limit, after)
+    if cacheable:
+        roster_cache.set(name_team, etag, body)
+    return _roster_response(Response(body, 200, mimetype='application/json'), etag)
+
+
+def _stream_team_changes(team, since, limit):
+    """
+    Поток Server-Sent Events с изменениями команды после since.
+
+    Между опросами журнала соединение с базой возвращается в пул, без изменений раз
+    в ``CHANGES_HEARTBEAT_INTERVAL`` отправляется комментарий keepalive. Через
+    ``CHANGES_STREAM_TIMEOUT`` поток завершается, и клиент переподключается с Last-Event-ID.
+    """
+    if not change_feed.open_stream():
+        response = jsonify({"error": "Too many change streams, retry later"})
+        response.headers['Retry-After'] = str(max(1, round(current_app.config['CHANGES_POLL_INTERVAL'])))
+        return response, 503
+    # Поток живёт долго: лимит одновременных запросов эндпоинта освобождается сразу
+    admission.release()
+    config = current_app.config
+    poll_interval = config['CHANGES_POLL_INTERVAL']
+    heartbeat_interval = config['CHANGES_HEARTBEAT_INTERVAL']
+    deadline = time.monotonic() + config['CHANGES_STREAM_TIMEOUT']
+
+    def generate():
+        cursor = since
+        # Первая строка отправляет заголовки сразу и задаёт задержку переподключения
+        yield f'retry: {int(poll_interval * 1000)}\n\n'
+        last_sent = time.monotonic()
+        while True:
+            rows = services.team_changes(db.session, team.id, cursor, limit)
+            db.session.close()  # не держим соединение и транзакцию между опросами
+            now = time.monotonic()
+            if rows:
+                cursor = rows[-1].id
+                last_sent = now
+                yield team_change_events(rows)
+                if len(rows) == limit:
+                    continue
+            elif now - last_sent >= heartbeat_interval:
+                last_sent = now
+                yield ': keepalive\n\n'
+            if now >= deadline:
+                return
+            change_feed.wait(min(poll_interval, deadline - now))
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # Место освобождается и для потока, который сервер закрыл, не начав отправку
+    response.call_on_close(change_feed.close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx не буферизует события
+    return response
+
+
+@routes_bp.route('/<name_team>/changes', methods=['GET'])
+def get_team_changes(name_team):
+    """
+    Журнал изменений состава команды: изменения после since или поток Server-Sent Events.
+    ---
+    parameters:
+      - name: name_team
+        in: path
+        type: string
+        required: true
+        description: Название команды
+      - name: since
+        in: query
+        type: integer
+        required: false
+        description: Номер последнего полученного изменения (next_since предыдущего ответа), по умолчанию 0
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Максимальное количество изменений в ответе
+      - name: format
+        in: query
+        type: string
+        required: false
+        description: sse - поток Server-Sent Events (или Accept text/event-stream), продолжение - по Last-Event-ID
+    responses:
+      200:
+        description: Изменения команды (team_created, member_added, member_removed, member_updated)
+      400:
+        description: Неверные параметры
+      404:
+        description: Команда не найдена
+      503:
+        description: Открыто слишком много потоков
+    """
+    event_stream = wants_format(request.args, request.accept_mimetypes, 'sse', 'text/event-stream')
+    try:
+        since, limit = parse_changes_args(
+            request.args, current_app.config, request.headers.get('Last-Event-ID') if event_stream else None
+        )
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+
+    team = services.team_by_name(db.session, name_team)
+    if event_stream:
+        return _stream_team_changes(team, since, limit)
+    return _respond(services.team_changes_page(db.session, team, since, limit))
+
+
+@routes_bp.route('/users', methods=['GET'])
+@jwt_required()
+def list_users():
+    """
+    Каталог пользователей (доступен ролям из USERS_DIRECTORY_ROLES).
+    ---
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Размер страницы
+      - name: after
+        in: query
+        type: integer
+        required: false
+        description: Курсор - значение next_cursor предыдущей страницы
+      - name: fields
+        in: query
+        type: string
+        required: false
+        description: Поля через запятую (id, email, name, surname, role); по умолчанию все
+      - name: role
+        in: query
+        type: string
+        required: false
+        description: Отбор по роли
+      - name: team
+        in: query
+        type: string
+        required: false
+        description: Отбор по команде (название)
+      - name: q
+        in: query
+        type: string
+        required: false
+        description: Поиск по email, имени и фамилии без учёта регистра
+      - name: match
+        in: query
+        type: string
+        required: false
+        description: prefix - по началу строки (по умолчанию), contains - по подстроке (не короче 3 символов)
+    responses:
+      200:
+        description: Страница пользователей, упорядоченных по id, и курсор следующей страницы
+      400:
+        description: Неверные параметры запроса
+      403:
+        description: Нет доступа
       404:
         description: Команда не найдена
     """
-    team = Team.query.filter_by(name=name_team).first()
-
-    if not team:
-        return jsonify({"error": "Team not found"}), 404
-
-    members = [{
-        "name": member.name,
-        "surname": member.surname,
-        "role": member.role
-    } for member in team.members]
-
-    # Добавляем лидера команды в список участников, если его там нет
-    if team.leader not in team.members:
-        members.append({
-            "name": team.leader.name,
-            "surname": team.leader.surname,
-            "role": "leader"
-        })
-
-    return jsonify({
-        "team_name": team.name,
-        "members": members
-    }), 200
+    return _respond(services.users_page(db.session, current_user, request.args, current_app.config,
+                                        replicas.use_primary))
@@ -0,0 +1,216 @@
+import re
+
+
+# Схемы тел запросов в формате JSON Schema. Они же публикуются в Swagger UI (definitions),
+# поэтому документация и проверка запросов описываются в одном месте.
+#
+# Схемы компилируются при импорте в функции проверки: поддерживается подмножество ключевых
+# слов, достаточное для плоских объектов API. Библиотека jsonschema не используется, чтобы
+# не загружать её в рабочие процессы (см. ``python -m bench startup``).
+
+EMAIL_PATTERN = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+# Проверки значений для ключевого слова format
+FORMATS = {
+    'email': EMAIL_PATTERN.fullmatch,
+}
+
+# Python-типы для ключевого слова type
+TYPES = {
+    'string': str,
+    'null': type(None),
+}
+
+# Длины строк совпадают с размерами столбцов в app/models.py; пароль ограничен,
+# чтобы длинные строки не попадали в хеширование
+EMAIL = {"type": "string", "format": "email", "maxLength": 120, "description": "Email пользователя"}
+PASSWORD = {"type": "string", "minLength": 1, "maxLength": 128, "description": "Пароль пользователя"}
+NAME = {"type": "string", "minLength": 1, "maxLength": 80, "description": "Имя пользователя"}
+SURNAME = {"type": "string", "minLength": 1, "maxLength": 80, "description": "Фамилия пользователя"}
+ROLE = {"type": "string", "minLength": 1, "maxLength": 50, "description": "Роль пользователя"}
+TEAM_NAME = {"type": "string", "minLength": 1, "maxLength": 80, "description": "Название команды"}
+
+# Ключевые слова, которые понимает компилятор: для объекта тела запроса и для его полей.
+# Остальные отклоняются при компиляции, а не пропускаются молча
+_OBJECT_KEYWORDS = {'type', 'required', 'properties', 'description'}
+_PROPERTY_KEYWORDS = {'type', 'minLength', 'maxLength', 'format', 'description'}
+
+
+def _compile_property(name, schema):
+    """
+    Компилирует схему значения в функцию проверки.
+
+    :param name: Название поля
+    :param schema: Схема значения
+    :return: Функция, возвращающая True для корректного значения
+    """
+    unsupported = set(schema) - _PROPERTY_KEYWORDS
+    if unsupported:
+        raise ValueError(f'Unsupported schema keywords for {name}: {sorted(unsupported)}')
+    types = schema.get('type')
+    types = types if isinstance(types, list) else [types]
+    if not set(types) <= TYPES.keys():
+        raise ValueError(f'Unsupported type for {name}: {schema.get("type")}')
+    if 'format' in schema and schema['format'] not in FORMATS:
+        raise ValueError(f'Unsupported format for {name}: {schema["format"]}')
+    python_types = tuple(TYPES[type_name] for type_name in types)
+    min_length = schema.get('minLength', 0)
+    max_length = schema.get('maxLength')
+    check_format = FORMATS[schema['format']] if 'format' in schema else None
+
+    def check(value):
+        if not isinstance(value, python_types):
+            return False
+        if value is None:
+            return True
+        if len(value) < min_length or (max_length is not None and len(value) > max_length):
+            return False
+        return check_format is None or check_format(value) is not None
+
+    return check
+
+
+class Schema:
+    """
+    Скомпилированная JSON-схема объекта тела запроса.
+
+    :param definition: JSON-схема с ``type: object``
+    :raises ValueError: Если схема использует неподдерживаемые ключевые слова, типы или форматы
+    """
+
+    def __init__(self, definition):
+        if definition.get('type') != 'object':
+            raise ValueError('Only object schemas are supported')
+        unsupported = set(definition) - _OBJECT_KEYWORDS
+        if unsupported:
+            raise ValueError(f'Unsupported schema keywords: {sorted(unsupported)}')
+        undefined = set(definition.get('required', ())) - definition['properties'].keys()
+        if undefined:
+            raise ValueError(f'Required properties are not defined: {sorted(undefined)}')
+        self.definition = definition
+        self.required = tuple(definition.get('required', ()))
+        self.checks = tuple(
+            (name, _compile_property(name, schema)) for name, schema in definition['properties'].items()
+        )
+
+    def validate(self, data):
+        """
+        Проверяет разобранное тело запроса.
+
+        :param data: Разобранное тело запроса
+        :return: Текст ошибки или None, если данные корректны
+        """
+        if not isinstance(data, dict):
+            return "Invalid JSON"
+        for name in self.required:
+            if name not in data:
+                return f"Missing argument: {name}"
+        for name, check in self.checks:
+            if name in data and not check(data[name]):
+                return f"Invalid argument: {name}"
+        return None
+
+
+REGISTER = Schema({
+    "type": "object",
+    "required": ["email", "password"],
+    "properties": {
+        "email": EMAIL,
+        "password": PASSWORD,
+        "role": ROLE,
+        "name": {**NAME, "type": ["string", "null"]},
+        "surname": {**SURNAME, "type": ["string", "null"]},
+    },
+})
+
+LOGIN = Schema({
+    "type": "object",
+    "required": ["email", "password"],
+    "properties": {
+        "email": {"type": "string", "maxLength": 120, "description": "Email пользователя"},
+        "password": PASSWORD,
+    },
+})
+
+NEW_TEAM = Schema({
+    "type": "object",
+    "required": ["team_name"],
+    "properties": {
+        "team_name": TEAM_NAME,
+    },
+})
+
+MEMBER = Schema({
+    "type": "object",
+    "required": ["name", "surname", "email", "password"],
+    "properties": {
+        "name": NAME,
+        "surname": SURNAME,
+        "email": EMAIL,
+        "password": PASSWORD,
+    },
+})
+
+PROFILE = Schema({
+    "type": "object",
+    "required": ["name", "surname"],
+    "properties": {
+        "name": NAME,
+        "surname": SURNAME,
+    },
+})
+
+# Операции перестройки команд (POST /teams:restructure); тело запроса - объект со списками
+# таких операций, каждая проверяется своей схемой
+MEMBERSHIP_REMOVAL = Schema({
+    "type": "object",
+    "required": ["team", "email"],
+    "properties": {
+        "team": TEAM_NAME,
+        "email": EMAIL,
+    },
+})
+
+MEMBERSHIP_MOVE = Schema({
+    "type": "object",
+    "required": ["email", "from_team", "to_team"],
+    "properties": {
+        "email": EMAIL,
+        "from_team": TEAM_NAME,
+        "to_team": TEAM_NAME,
+    },
+})
+
+LEADER_TRANSFER = Schema({
+    "type": "object",
+    "required": ["team", "email"],
+    "properties": {
+        "team": TEAM_NAME,
+        "email": {**EMAIL, "description": "Email нового лидера команды"},
+    },
+})
+
+# Подзапрос пакета (POST /batch); тело подзапроса (body) и заголовки (headers) проверяются
+# в app/batch.py, так как компилятор схем поддерживает только строковые поля
+BATCH_REQUEST = Schema({
+    "type": "object",
+    "required": ["method", "path"],
+    "properties": {
+        "method": {"type": "string", "minLength": 1, "maxLength": 10, "description": "HTTP-метод подзапроса"},
+        "path": {"type": "string", "minLength": 1, "maxLength": 2048,
+                 "description": "Путь подзапроса вместе со строкой запроса, например /TeamA?limit=100"},
+    },
+})
+
+# Определения для Swagger UI: на них ссылаются docstring эндпоинтов ($ref)
+DEFINITIONS = {
+    "Register": REGISTER.definition,
+    "Login": LOGIN.definition,
+    "NewTeam": NEW_TEAM.definition,
+    "Member": MEMBER.definition,
+    "Profile": PROFILE.definition,
+    "MembershipRemoval": MEMBERSHIP_REMOVAL.definition,
+    "MembershipMove": MEMBERSHIP_MOVE.definition,
+    "LeaderTransfer": LEADER_TRANSFER.definition,
+    "BatchRequest": BATCH_REQUEST.definition,
+}
@@ -0,0 +1,228 @@
+import dataclasses
+import decimal
+import json
+import operator
+import uuid
+from datetime import date
+from functools import lru_cache
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson  # необязательная зависимость: без неё используется стандартный json
+except ImportError:
+    orjson = None
+
+
+# Формат вывода одинаков для orjson и стандартного json: компактный, ключи отсортированы,
+# не-ASCII символы без экранирования. Поэтому тела в общем кеше списков участников не зависят
+# от того, в каком процессе (и с каким кодировщиком) они сериализованы.
+
+def _default(obj):
+    # Типы, которые orjson сериализует сам; для стандартного json - в том же представлении
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumpb(obj):
+        """
+        Сериализует объект в JSON.
+
+        :param obj: Объект
+        :return: JSON в кодировке UTF-8
+        """
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def dumps(obj):
+        """
+        Сериализует объект в строку JSON.
+
+        :param obj: Объект
+        :return: Строка JSON
+        """
+        return orjson.dumps(obj, default=_default, option=_OPTIONS).decode()
+
+    def _dumps_sorted(obj):
+        # Ключи уже упорядочены сериализатором строк, повторная сортировка не нужна
+        return orjson.dumps(obj, default=_default).decode()
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(default=_default, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    _sorted_encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumpb(obj):
+        return _encoder.encode(obj).encode()
+
+    dumps = _encoder.encode
+    _dumps_sorted = _sorted_encoder.encode
+    loads = json.loads
+
+
+class RowSerializer:
+    """
+    Сериализатор строк результата запроса в JSON-объекты через словари.
+
+    Функция преобразования строки в словарь собирается один раз: значения читаются одним
+    ``operator.attrgetter`` по столбцам в порядке уже отсортированных ключей и собираются
+    в словарь с этими ключами. Словарь создаётся на каждую строку, но без ``Row._asdict``,
+    а ключи не сортируются при кодировании: весь список кодируется одним вызовом orjson.
+    Сборка JSON из фрагментов по значениям вместо словарей вдвое медленнее (вызов
+    кодировщика на каждое значение). Вывод совпадает с :func:`dumps`.
+
+    :param fields: Ключи JSON, совпадающие с названиями столбцов
+    :param renamed: Ключи JSON, значения которых берутся из столбцов с другим названием
+    """
+
+    def __init__(self, *fields, **renamed):
+        columns = {field: field for field in fields}
+        columns.update(renamed)
+        for column in columns.values():
+            if not column.isidentifier():
+                raise ValueError(f'Invalid column name: {column!r}')
+        self.keys = keys = tuple(sorted(columns))
+        values = operator.attrgetter(*(columns[key] for key in keys))
+        if len(keys) == 1:
+            # attrgetter с одним атрибутом возвращает значение, а не кортеж
+            key, = keys
+            self.as_dict = lambda row: {key: values(row)}
+        else:
+            self.as_dict = lambda row: dict(zip(keys, values(row)))
+
+    def __call__(self, row):
+        """
+        Сериализует строку результата.
+
+        :param row: Строка результата или объект с нужными атрибутами
+        :return: Строка JSON
+        """
+        return _dumps_sorted(self.as_dict(row))
+
+    def dump(self, **values):
+        """
+        Сериализует значения, переданные по ключам JSON.
+
+        :return: Строка JSON
+        """
+        return _dumps_sorted({key: values[key] for key in self.keys})
+
+
+TEAM = RowSerializer(team_name='name')  # Заголовок списка участников (первая строка NDJSON)
+TEAM_MEMBER = RowSerializer('name', 'surname', 'role')  # Участник команды
+TEAM_CHANGE = RowSerializer('created_at', data='payload', seq='id', type='kind')  # Изменение из журнала команды
+
+_NO_CURSOR = object()
+
+
+def team_leader(team):
+    """
+    Лидер команды в формате участника с ролью ``leader``.
+
+    :param team: Строка запроса команды с лидером (``team_with_leader_stmt``)
+    :return: Словарь с ключами :data:`TEAM_MEMBER`
+    """
+    return {"name": team.leader_name, "role": "leader", "surname": team.leader_surname}
+
+
+def team_members_json(team_name, rows, leader=None, next_cursor=_NO_CURSOR):
+    """
+    Тело ответа со списком участников команды.
+
+    :param team_name: Название команды
+    :param rows: Строки участников (``team_members_stmt``)
+    :param leader: Лидер команды, добавляемый в конец списка (:func:`team_leader`)
+    :param next_cursor: Курсор следующей страницы; не выводится, если не передан
+    :return: Строка JSON, совпадающая с :func:`dumps` для того же словаря
+    """
+    members = list(map(TEAM_MEMBER.as_dict, rows))
+    if leader is not None:
+        members.append(leader)
+    body = {"members": members}
+    if next_cursor is not _NO_CURSOR:
+        body["next_cursor"] = next_cursor
+    body["team_name"] = team_name
+    return _dumps_sorted(body)
+
+
+def team_changes_json(team_name, rows, next_since):
+    """
+    Тело ответа со списком изменений команды.
+
+    :param team_name: Название команды
+    :param rows: Строки изменений (``team_changes_stmt``)
+    :param next_since: Значение ``since`` для следующего запроса
+    :return: Строка JSON
+    """
+    # Порядок ключей данных изменения зависит от базы (json, jsonb, SQLite), поэтому ключи сортируются
+    return dumps({
+        "changes": list(map(TEAM_CHANGE.as_dict, rows)), "next_since": next_since, "team_name": team_name
+    })
+
+
+def team_change_events(rows):
+    """
+    Изменения команды в формате Server-Sent Events: номер изменения - id события, тип - event.
+
+    :param rows: Строки изменений (``team_changes_stmt``)
+    :return: Строка событий
+    """
+    return ''.join(f'id: {row.id}\nevent: {row.kind}\ndata: {dumps(TEAM_CHANGE.as_dict(row))}\n\n' for row in rows)
+
+
+@lru_cache(maxsize=None)
+def user_serializer(fields):
+    """
+    Сериализатор пользователя для набора полей каталога (``fields=``); создаётся один раз на набор.
+
+    :param fields: Кортеж названий полей
+    :return: RowSerializer
+    """
+    return RowSerializer(*fields)
+
+
+def users_json(rows, fields, next_cursor):
+    """
+    Тело ответа страницы каталога пользователей.
+
+    :param rows: Строки пользователей (``users_page_stmt``)
+    :param fields: Кортеж выводимых полей
+    :param next_cursor: Курсор следующей страницы или None
+    :return: Строка JSON
+    """
+    return _dumps_sorted({"next_cursor": next_cursor, "users": list(map(user_serializer(fields).as_dict, rows))})
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSON-провайдер Flask на orjson (при его отсутствии - на стандартном json).
+
+    Используется для ``request.get_json`` и ``jsonify``. Вызовы с дополнительными
+    параметрами (``indent``, ``default`` и т.п.) выполняются стандартным json.
+    """
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', _default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumpb(obj) + b'\n', mimetype=self.mimetype)
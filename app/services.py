@@ -0,0 +1,538 @@
+from collections import namedtuple
+
+from sqlalchemy import func, insert, select, update
+
+from app.instrumentation import timed
+from app.models import User, Team, TeamChange, user_team
+from app.queries import (
+    membership_delete, memberships_copy, memberships_delete, orphaned_user_delete, team_change, team_changes_stmt,
+    team_etag, team_members_stmt, team_version_bump, team_with_leader_stmt, teams_for_update_stmt, user_teams_clause,
+    users_by_email_stmt, users_page_stmt
+)
+from app.restructure import RestructurePlan
+from app.serializers import team_changes_json, team_leader, team_members_json, users_json
+from app.uow import insert_ignore
+from app.utils import check_member_rows, parse_user_directory_args
+
+
+# Результат операции: тело ответа (словарь или готовый JSON), код ответа, а также названия изменённых
+# команд и идентификаторы изменённых пользователей, кеши которых сбрасываются после фиксации транзакции
+Result = namedtuple('Result', ['body', 'status', 'team_names', 'user_ids'], defaults=((), ()))
+
+# Подготовленный массовый импорт: команда, количество строк, результаты по строкам и новые пользователи
+MemberImport = namedtuple('MemberImport', ['team', 'total', 'results', 'new_users'])
+
+
+class APIError(Exception):
+    """
+    Ошибка операции с кодом и телом ответа; Flask- и ASGI-версии превращают её в JSON-ответ.
+
+    :param status: Код ответа
+    :param error: Текст ошибки
+    :param details: Дополнительные поля тела ответа
+    """
+
+    def __init__(self, status, error, **details):
+        super().__init__(error)
+        self.status = status
+        self.body = {"error": error, **details}
+
+
+def _chunks(items, size):
+    """Разбивает список на последовательные части длиной не более size."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def bump_team_version(session, *criteria):
+    """
+    Увеличивает версию команд, отобранных условиями, в текущей транзакции.
+
+    :param session: Сессия SQLAlchemy
+    :param criteria: Условия отбора команд
+    """
+    session.execute(team_version_bump(*criteria))
+
+
+def record_changes(session, changes):
+    """
+    Записывает изменения команд в журнал в текущей транзакции (после :func:`bump_team_version`).
+
+    :param session: Сессия SQLAlchemy
+    :param changes: Строки журнала (:func:`app.queries.team_change`)
+    """
+    if changes:
+        session.execute(insert(TeamChange), changes)
+
+
+def check_registration(data, config):
+    """
+    Проверяет данные регистрации до хеширования пароля.
+
+    :param data: Проверенное по схеме тело запроса
+    :param config: Конфигурация приложения
+    :raises APIError: Роль с доступом к каталогу пользователей (они не назначаются при регистрации)
+    """
+    if data.get('role', 'user') in config['USERS_DIRECTORY_ROLES']:
+        raise APIError(400, "Invalid argument: role")
+
+
+def register_user(session, data, hashed_password):
+    """
+    Регистрирует пользователя.
+
+    :param session: Сессия SQLAlchemy
+    :param data: Проверенное по схеме тело запроса
+    :param hashed_password: Хеш пароля
+    :return: Result
+    :raises APIError: Пользователь с таким email уже существует
+    """
+    created = insert_ignore(User, {
+        "email": data['email'],
+        "password": hashed_password,
+        "role": data.get('role', 'user'),
+        "name": data.get('name'),
+        "surname": data.get('surname')
+    }, User.id, session=session)
+    if not created:
+        raise APIError(400, "User already exists")
+    return Result({"message": "User registered successfully"}, 201)
+
+
+def user_by_email(session, email):
+    """
+    Пользователь для входа по email без учёта регистра.
+
+    Возвращается строка, а не объект сессии: вход проверяет пароль уже после завершения
+    читающей транзакции.
+
+    :param session: Сессия SQLAlchemy
+    :param email: Email пользователя
+    :return: Строка (id, email, role, password) или None
+    """
+    return session.execute(
+        select(User.id, User.email, User.role, User.password).where(User.email_is(email))
+    ).first()
+
+
+def update_password(session, user_id, hashed_password):
+    """
+    Сохраняет пересчитанный хеш пароля пользователя.
+
+    :param session: Сессия SQLAlchemy
+    :param user_id: Идентификатор пользователя
+    :param hashed_password: Хеш пароля
+    """
+    session.execute(update(User).where(User.id == user_id).values(password=hashed_password))
+
+
+def create_team(session, team_name, leader_id):
+    """
+    Создаёт команду; лидер становится её первым участником.
+
+    :param session: Сессия SQLAlchemy
+    :param team_name: Название команды
+    :param leader_id: Идентификатор пользователя, создающего команду
+    :return: Result
+    :raises APIError: Команда с таким названием уже существует
+    """
+    created = insert_ignore(Team, {"name": team_name, "leader_id": leader_id}, Team.id, session=session)
+    if not created:
+        raise APIError(400, "Team name already exists")
+    team_id = created[0].id
+    session.execute(insert(user_team).values(user_id=leader_id, team_id=team_id))
+    leader = session.execute(select(User.name, User.surname, User.role).where(User.id == leader_id)).one()
+    record_changes(session, [
+        team_change(team_id, 'team_created', team_name=team_name, leader_id=leader_id),
+        team_change(team_id, 'member_added', user_id=leader_id, name=leader.name, surname=leader.surname,
+                    role=leader.role),
+    ])
+    return Result({
+        "message": "Team created successfully",
+        "invite_link": f"http://site.ru/{team_name}/add_member"
+    }, 201, [team_name])
+
+
+def team_id_by_name(session, name_team):
+    """
+    Идентификатор команды по названию.
+
+    :param session: Сессия SQLAlchemy
+    :param name_team: Название команды
+    :raises APIError: Команда не найдена
+    """
+    team_id = session.scalar(select(Team.id).where(Team.name == name_team))
+    if team_id is None:
+        raise APIError(404, "Team not found")
+    return team_id
+
+
+def add_member(session, team_id, name_team, data, hashed_password):
+    """
+    Регистрирует участника и добавляет его в команду.
+
+    :param session: Сессия SQLAlchemy
+    :param team_id: Идентификатор команды (:func:`team_id_by_name`)
+    :param name_team: Название команды
+    :param data: Проверенное по схеме тело запроса
+    :param hashed_password: Хеш пароля
+    :return: Result
+    :raises APIError: Пользователь с таким email уже существует
+    """
+    created = insert_ignore(User, {
+        "name": data['name'],
+        "surname": data['surname'],
+        "email": data['email'],
+        "password": hashed_password,
+        "role": 'member'
+    }, User.id, session=session)
+    if not created:
+        raise APIError(400, "User already exists")
+    user_id = created[0].id
+    session.execute(insert(user_team).values(user_id=user_id, team_id=team_id))
+    bump_team_version(session, Team.id == team_id)
+    record_changes(session, [team_change(team_id, 'member_added', user_id=user_id, name=data['name'],
+                                         surname=data['surname'], role='member')])
+    return Result({"message": "Member added successfully"}, 201, [name_team])
+
+
+def prepare_member_import(session, name_team, leader_id, rows, config):
+    """
+    Проверяет строки массового импорта и отбирает новых пользователей (до хеширования паролей).
+
+    :param session: Сессия SQLAlchemy
+    :param name_team: Название команды
+    :param leader_id: Идентификатор пользователя, выполняющего импорт
+    :param rows: Строки из тела запроса
+    :param config: Конфигурация приложения
+    :return: MemberImport; пароли новых пользователей ещё не захешированы
+    :raises APIError: Слишком много строк, команда не найдена или импорт выполняет не её лидер
+    """
+    if len(rows) > config['BULK_IMPORT_MAX_ROWS']:
+        raise APIError(413, "Too many rows")
+    team = session.execute(select(Team.id, Team.leader_id).where(Team.name == name_team)).first()
+    if not team:
+        raise APIError(404, "Team not found")
+    if leader_id != team.leader_id:
+        raise APIError(403, "Unauthorized access")
+
+    results, candidates = check_member_rows(rows)
+    # Проверяем существующие email одним запросом на пачку вместо запроса на каждую строку
+    existing = set()
+    lowered_email = func.lower(User.email)
+    for chunk in _chunks([row['email'].lower() for _, row in candidates], config['BULK_INSERT_BATCH_SIZE']):
+        existing.update(session.scalars(select(lowered_email).where(lowered_email.in_(chunk))))
+
+    new_users = []
+    for index, row in candidates:
+        if row['email'].lower() in existing:
+            results[index] = {"index": index, "email": row['email'], "status": "error",
+                              "error": "User already exists"}
+            continue
+        new_users.append((index, {
+            "name": row['name'],
+            "surname": row['surname'],
+            "email": row['email'],
+            "password": row['password'],
+            "role": 'member'
+        }))
+    return MemberImport(team, len(rows), results, new_users)
+
+
+def import_members(session, name_team, members, hashed_passwords, batch_size):
+    """
+    Добавляет подготовленных пользователей в команду пачками по batch_size.
+
+    :param session: Сессия SQLAlchemy
+    :param name_team: Название команды
+    :param members: MemberImport из :func:`prepare_member_import`
+    :param hashed_passwords: Хеши паролей новых пользователей в порядке ``members.new_users``
+    :param batch_size: Размер пачки вставки
+    :return: Result с отчётом по каждой строке
+    """
+    team, results = members.team, members.results
+    for (_, values), hashed_password in zip(members.new_users, hashed_passwords):
+        values['password'] = hashed_password
+
+    added = []
+    for chunk in _chunks(members.new_users, batch_size):
+        # Строки, добавленные параллельным запросом после проверки, пропускаются вставкой
+        created = {email.lower(): user_id for user_id, email in insert_ignore(
+            User, [values for _, values in chunk], User.id, User.email, session=session
+        )}
+        if created:
+            session.execute(insert(user_team), [
+                {"user_id": user_id, "team_id": team.id} for user_id in created.values()
+            ])
+        for index, values in chunk:
+            user_id = created.get(values['email'].lower())
+            if user_id is not None:
+                results[index] = {"index": index, "email": values['email'], "status": "created"}
+                added.append(team_change(team.id, 'member_added', user_id=user_id, name=values['name'],
+                                         surname=values['surname'], role=values['role']))
+            else:
+                results[index] = {"index": index, "email": values['email'], "status": "error",
+                                  "error": "User already exists"}
+    if added:
+        bump_team_version(session, Team.id == team.id)
+        record_changes(session, added)
+    return Result({"created": len(added), "failed": members.total - len(added), "results": results}, 200,
+                  [name_team])
+
+
+def remove_member(session, name_team, user_email, leader_id):
+    """
+    Удаляет пользователя из команды, а если он больше нигде не состоит и не руководит командами - и его самого.
+
+    :param session: Сессия SQLAlchemy
+    :param name_team: Название команды
+    :param user_email: Email пользователя
+    :param leader_id: Идентификатор пользователя, выполняющего удаление
+    :return: Result
+    :raises APIError: Пользователь или команда не найдены, нет доступа или пользователь не состоит в команде
+    """
+    user_id = session.scalar(select(User.id).where(User.email_is(user_email)))
+    team = session.execute(select(Team.id, Team.leader_id).where(Team.name == name_team)).first()
+    if user_id is None:
+        raise APIError(404, "User not found")
+    if not team:
+        raise APIError(404, "Team not found")
+    if leader_id != team.leader_id:
+        raise APIError(403, "Unauthorized access")
+
+    if not session.execute(membership_delete(user_id, team.id)).rowcount:
+        raise APIError(400, "User does not belong to this team")
+    bump_team_version(session, Team.id == team.id)
+    record_changes(session, [team_change(team.id, 'member_removed', user_id=user_id)])
+    orphaned = session.execute(orphaned_user_delete(user_id)).rowcount
+    return Result({"message": "User removed from team successfully"}, 200, [name_team],
+                  [user_id] if orphaned else [])
+
+
+def restructure_teams(session, data, leader_id, config):
+    """
+    Перестройка команд одной транзакцией (:class:`app.restructure.RestructurePlan`).
+
+    :param session: Сессия SQLAlchemy
+    :param data: Разобранное тело запроса
+    :param leader_id: Идентификатор пользователя, выполняющего перестройку
+    :param config: Конфигурация приложения
+    :return: Result с количеством выполненных и пропущенных операций
+    :raises APIError: Неверный запрос, слишком много операций, команды или пользователи не найдены, нет доступа
+    """
+    try:
+        plan = RestructurePlan(data)
+    except ValueError as error:
+        raise APIError(400, str(error))
+    if len(plan) > config['RESTRUCTURE_MAX_OPERATIONS']:
+        raise APIError(413, "Too many operations")
+
+    # Блокируем строки команд до проверки лидера: до конца транзакции их состав и лидеров
+    # не изменит никто другой, а журнал изменений получит номера в порядке фиксации
+    error = plan.check_teams(session.execute(teams_for_update_stmt(plan.team_names)), leader_id)
+    error = error or plan.check_users(session.execute(users_by_email_stmt(plan.emails)))
+    if error:
+        body, status = error
+        raise APIError(status, **body)
+
+    removed = session.execute(memberships_delete(plan.removals())).all() if plan.remove else []
+    moved, joined = [], []
+    for (from_team_id, to_team_id), user_ids in plan.moves().items():
+        joined.extend((user_id, to_team_id) for user_id in session.scalars(
+            memberships_copy(user_ids, from_team_id, to_team_id)
+        ))
+        moved.extend(session.execute(memberships_delete([(user_id, from_team_id) for user_id in user_ids])))
+    transfers = plan.transfers()
+    if transfers:
+        session.execute(update(Team), [
+            {"id": team_id, "leader_id": new_leader_id} for team_id, new_leader_id in transfers.items()
+        ])
+        # Новый лидер, как и создатель команды, отображается среди её участников
+        joined.extend(insert_ignore(user_team, [
+            {"user_id": new_leader_id, "team_id": team_id} for team_id, new_leader_id in transfers.items()
+        ], user_team.c.user_id, user_team.c.team_id, session=session))
+
+    # Удалённые из команд участники и прежний лидер удаляются одним запросом, если больше
+    # не состоят ни в одной команде и не руководят ими
+    orphans = {user_id for user_id, _ in removed} | ({leader_id} if transfers else set())
+    deleted = session.scalars(orphaned_user_delete(*orphans).returning(User.id)).all() if orphans else []
+
+    touched = {team_id for _, team_id in removed + moved + joined} | transfers.keys()
+    if touched:
+        bump_team_version(session, Team.id.in_(touched))
+        record_changes(session, plan.changes(removed, moved, joined, transfers))
+
+    return Result({
+        "removed": len(removed),
+        "moved": len(moved),
+        "leaders_changed": len(transfers),
+        "deleted_users": len(deleted),
+        "skipped": len(plan) - len(removed) - len(moved) - len(transfers)
+    }, 200, plan.team_names_of(touched), deleted)
+
+
+def update_profile(session, user_email, principal, data):
+    """
+    Обновляет имя и фамилию пользователя (только свои).
+
+    :param session: Сессия SQLAlchemy
+    :param user_email: Email пользователя
+    :param principal: Текущий пользователь (:class:`app.principal.Principal`)
+    :param data: Проверенное по схеме тело запроса
+    :return: Result
+    :raises APIError: Пользователь не найден или нет доступа
+    """
+    user_id = session.scalar(select(User.id).where(User.email_is(user_email)))
+    if user_id is None:
+        raise APIError(404, "User not found")
+    if principal.email.lower() != user_email.lower():
+        raise APIError(403, "Unauthorized access")
+
+    session.execute(update(User).where(User.id == user_id).values(name=data['name'], surname=data['surname']))
+    teams_clause = user_teams_clause(user_id)
+    teams = session.execute(select(Team.id, Team.name).where(teams_clause)).all()
+    bump_team_version(session, teams_clause)
+    record_changes(session, [
+        team_change(team.id, 'member_updated', user_id=user_id, name=data['name'], surname=data['surname'])
+        for team in teams
+    ])
+    return Result({"message": "Profile updated successfully"}, 200, [team.name for team in teams], [user_id])
+
+
+def team_by_name(session, name_team):
+    """
+    Команда (id, name) по названию.
+
+    :param session: Сессия SQLAlchemy
+    :param name_team: Название команды
+    :raises APIError: Команда не найдена
+    """
+    team = session.execute(select(Team.id, Team.name).where(Team.name == name_team)).first()
+    if not team:
+        raise APIError(404, "Team not found")
+    return team
+
+
+def team_changes(session, team_id, since, limit):
+    """
+    Изменения команды после since (строки журнала для сериализаторов ``team_change*``).
+
+    :param session: Сессия SQLAlchemy
+    :param team_id: Идентификатор команды
+    :param since: Номер последнего полученного изменения
+    :param limit: Максимальное количество изменений
+    """
+    return session.execute(team_changes_stmt(team_id, since, limit)).all()
+
+
+def team_changes_page(session, team, since, limit):
+    """
+    Страница журнала изменений команды.
+
+    :param session: Сессия SQLAlchemy
+    :param team: Команда (:func:`team_by_name`)
+    :param since: Номер последнего полученного изменения
+    :param limit: Максимальное количество изменений
+    :return: Result с готовым JSON
+    """
+    rows = team_changes(session, team.id, since, limit)
+    next_since = rows[-1].id if rows else since
+    with timed('serialize'):
+        body = team_changes_json(team.name, rows, next_since) + '\n'
+    return Result(body, 200)
+
+
+def users_page(session, principal, args, config, use_primary=None):
+    """
+    Страница каталога пользователей.
+
+    :param session: Сессия SQLAlchemy
+    :param principal: Текущий пользователь
+    :param args: Параметры строки запроса
+    :param config: Конфигурация приложения
+    :param use_primary: Переключает сессию с реплики на основную базу; True, если сессия читала с реплики
+    :return: Result с готовым JSON
+    :raises APIError: Нет доступа, неверные параметры или команда фильтра не найдена
+    """
+    if principal.role not in config['USERS_DIRECTORY_ROLES']:
+        raise APIError(403, "Unauthorized access")
+    try:
+        query = parse_user_directory_args(args, config)
+    except ValueError as error:
+        raise APIError(400, str(error))
+
+    team_id = None
+    if query.team is not None:
+        team_stmt = select(Team.id).where(Team.name == query.team)
+        team_id = session.scalar(team_stmt)
+        if team_id is None and use_primary is not None and use_primary():
+            team_id = session.scalar(team_stmt)
+        if team_id is None:
+            raise APIError(404, "Team not found")
+
+    rows = session.execute(users_page_stmt(
+        query.fields, after=query.after, limit=query.limit, role=query.role, team_id=team_id,
+        search=query.search, contains=query.contains
+    )).all()
+    next_cursor = rows[-1].id if len(rows) == query.limit else None
+    with timed('serialize'):
+        body = users_json(rows, query.fields, next_cursor) + '\n'
+    return Result(body, 200)
+
+
+def current_team_etag(session, name_team, ndjson):
+    """
+    ETag текущей версии команды - одна выборка по уникальному индексу team.name без загрузки участников.
+
+    :param session: Сессия SQLAlchemy
+    :param name_team: Название команды
+    :param ndjson: ETag потоковой выдачи
+    :return: ETag или None, если команды нет
+    """
+    current = session.execute(select(Team.id, Team.version).where(Team.name == name_team)).first()
+    return team_etag(current.id, current.version, ndjson) if current is not None else None
+
+
+def team_with_leader(session, name_team, use_primary=None):
+    """
+    Одним запросом получает команду и имя/фамилию её лидера.
+
+    :param session: Сессия SQLAlchemy
+    :param name_team: Название команды
+    :param use_primary: Переключает сессию с реплики на основную базу; True, если сессия читала с реплики
+    :return: Строка (id, name, leader_name, leader_surname, leader_is_member, version)
+    :raises APIError: Команда не найдена
+    """
+    team = session.execute(team_with_leader_stmt(name_team)).first()
+    if not team and use_primary is not None and use_primary():
+        # Только что созданная команда могла ещё не дойти до реплики
+        team = session.execute(team_with_leader_stmt(name_team)).first()
+    if not team:
+        raise APIError(404, "Team not found")
+    return team
+
+
+def team_members_body(session, team, limit, after):
+    """
+    JSON со списком участников команды (страница при заданном limit).
+
+    Лидер, если его нет среди участников, добавляется в конец списка, а при постраничной выдаче -
+    в конец последней страницы и входит в limit: страница, заполненная участниками, возвращает курсор,
+    и лидер приходит на следующей. Поэтому страница не длиннее limit, а страницы вместе совпадают
+    с полным списком.
+
+    :param session: Сессия SQLAlchemy
+    :param team: Команда (:func:`team_with_leader`)
+    :param limit: Размер страницы или None для полного списка
+    :param after: Курсор или None
+    :return: Строка JSON
+    """
+    rows = session.execute(team_members_stmt(team.id, after=after, limit=limit)).all()
+    leader = team_leader(team) if not team.leader_is_member else None
+    with timed('serialize'):
+        if limit is not None:
+            next_cursor = rows[-1].id if len(rows) == limit else None
+            if next_cursor is not None:
+                leader = None
+            return team_members_json(team.name, rows, leader, next_cursor) + '\n'
+        return team_members_json(team.name, rows, leader) + '\n'
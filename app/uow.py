@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+
+from flask import g
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db
+
+
+# Диалекты, поддерживающие INSERT ... ON CONFLICT DO NOTHING RETURNING
+_CONFLICT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def in_batch_transaction():
+    """
+    Проверяет, выполняется ли запрос внутри транзакции атомарного пакета (``POST /batch?atomic=true``).
+
+    Её изменения не зафиксированы и видны только подзапросам пакета, поэтому они не должны
+    читаться из общих кешей и попадать в них.
+    """
+    return g.get('_batch_after_commit') is not None
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Одна транзакция на запрос: изменения блока фиксируются одним commit при успешном
+    выходе и откатываются при исключении.
+
+    В атомарном пакете (``POST /batch?atomic=true``) транзакцией владеет пакет: блок только
+    отправляет изменения в базу (flush), а фиксирует их пакет после последнего подзапроса.
+
+    :return: Сессия SQLAlchemy
+    """
+    try:
+        yield db.session
+    except BaseException:
+        db.session.rollback()
+        raise
+    if in_batch_transaction():
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+def end_read():
+    """
+    Завершает читающую транзакцию запроса и возвращает соединение в пул перед долгой работой
+    без базы данных (хеширование паролей), чтобы соединение не простаивало открытой транзакцией.
+
+    В атомарном пакете транзакцией владеет пакет, и она остаётся открытой.
+    """
+    if not in_batch_transaction():
+        db.session.rollback()
+
+
+def after_commit(callback, *args):
+    """
+    Выполняет действие, которое должно следовать за фиксацией транзакции (сброс кешей,
+    уведомление потоков журнала изменений).
+
+    Обычно транзакция уже зафиксирована :func:`unit_of_work`, и действие выполняется сразу;
+    в атомарном пакете оно откладывается до фиксации пакета и отменяется при его откате.
+
+    :param callback: Функция
+    :param args: Аргументы функции
+    """
+    if in_batch_transaction():
+        g._batch_after_commit.append((callback, args))
+    else:
+        callback(*args)
+
+
+def conflict_insert(dialect_name, table, *returning):
+    """
+    Запрос ``INSERT ... ON CONFLICT DO NOTHING [RETURNING ...]`` для диалекта.
+
+    :param dialect_name: Название диалекта SQLAlchemy
+    :param table: Модель или таблица
+    :param returning: Столбцы, возвращаемые для вставленных строк
+    :return: Запрос или None, если диалект не поддерживает ON CONFLICT
+    """
+    dialect_insert = _CONFLICT_INSERTS.get(dialect_name)
+    if dialect_insert is None:
+        return None
+    stmt = dialect_insert(table).on_conflict_do_nothing()
+    return stmt.returning(*returning) if returning else stmt
+
+
+def insert_ignore(table, values, *returning, session=None):
+    """
+    Вставляет строки, пропуская нарушающие ограничения уникальности
+    (``INSERT ... ON CONFLICT DO NOTHING RETURNING``).
+
+    Дубликат определяется по результату вставки, без предварительного SELECT, поэтому
+    параллельные запросы не приводят к ошибке уникальности. Для диалектов без ON CONFLICT
+    каждая строка вставляется в своей точке сохранения.
+
+    :param table: Модель или таблица
+    :param values: Словарь значений одной строки или список словарей
+    :param returning: Столбцы, возвращаемые для вставленных строк
+    :param session: Сессия SQLAlchemy (по умолчанию сессия Flask-SQLAlchemy)
+    :return: Список вставленных строк; пропущенные строки в него не попадают
+    """
+    rows = values if isinstance(values, list) else [values]
+    if not rows:
+        return []
+
+    session = session if session is not None else db.session
+    stmt = conflict_insert(session.get_bind().dialect.name, table, *returning)
+    if stmt is not None:
+        result = session.execute(stmt, rows)
+        return result.all() if returning else []
+
+    stmt = insert(table)
+    if returning:
+        stmt = stmt.returning(*returning)
+    inserted = []
+    for row in rows:
+        try:
+            with session.begin_nested():
+                result = session.execute(stmt, row)
+                if returning:
+                    inserted.append(result.one())
+        except IntegrityError:
+            continue
+    return inserted
@@ -1,15 +1,208 @@
-from flask import request, jsonify
+from collections import namedtuple
 from functools import wraps
 
+from flask import Request, current_app, g, request, jsonify
+from flask_jwt_extended import verify_jwt_in_request
+from werkzeug.exceptions import RequestEntityTooLarge
 
-def validate_json(*expected_args):
+from app.queries import USER_DIRECTORY_COLUMNS
+from app.schemas import MEMBER
+
+
+# Разобранные параметры запроса каталога пользователей (GET /users)
+UserDirectoryQuery = namedtuple('UserDirectoryQuery', ['fields', 'after', 'limit', 'role', 'team', 'search', 'contains'])
+
+
+class LimitedRequest(Request):
+    """
+    Запрос, для которого эндпоинт может уменьшить допустимый размер тела (как в Flask 3.1).
+
+    По умолчанию действует ``MAX_CONTENT_LENGTH``. Werkzeug применяет ограничение и при чтении
+    тела без Content-Length (Transfer-Encoding: chunked), если сервер завершает поток сам.
+    """
+
+    _max_content_length = None
+
+    @property
+    def max_content_length(self):
+        if self._max_content_length is not None:
+            return self._max_content_length
+        return super().max_content_length
+
+    @max_content_length.setter
+    def max_content_length(self, value):
+        self._max_content_length = value
+
+
+def check_member_rows(rows):
+    """
+    Проверяет строки массового импорта участников.
+
+    :param rows: Список строк из тела запроса
+    :return: Кортеж (результаты по строкам с ошибками, None для остальных; список (индекс, строка) для вставки)
+    """
+    results = [None] * len(rows)
+    candidates = []
+    seen = set()
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[index] = {"index": index, "status": "error", "error": "Invalid row"}
+            continue
+        error = MEMBER.validate(row)
+        if error:
+            email = row.get('email')
+            results[index] = {"index": index, "email": email if isinstance(email, str) else None,
+                              "status": "error", "error": error}
+        elif row['email'].lower() in seen:
+            results[index] = {"index": index, "email": row['email'], "status": "error",
+                              "error": "Duplicate email in request"}
+        else:
+            seen.add(row['email'].lower())
+            candidates.append((index, row))
+    return results, candidates
+
+
+def parse_user_directory_args(args, config):
+    """
+    Разбирает и проверяет параметры запроса каталога пользователей.
+
+    :param args: Параметры строки запроса
+    :param config: Конфигурация приложения
+    :return: UserDirectoryQuery
+    :raises ValueError: С текстом ошибки для ответа 400
+    """
+    try:
+        limit = int(args.get('limit', config['USERS_PAGE_SIZE']))
+        after = int(args['after']) if 'after' in args else None
+    except ValueError:
+        raise ValueError("Invalid pagination parameters")
+    if limit < 1:
+        raise ValueError("Invalid pagination parameters")
+
+    fields = args.get('fields')
+    fields = tuple(sorted(set(fields.split(',')))) if fields else tuple(sorted(USER_DIRECTORY_COLUMNS))
+    if not set(fields) <= USER_DIRECTORY_COLUMNS.keys():
+        raise ValueError("Invalid fields")
+
+    role, team, search = args.get('role'), args.get('team'), args.get('q')
+    match = args.get('match', 'prefix')
+    if (role is not None and len(role) > 50) or (team is not None and len(team) > 80):
+        raise ValueError("Invalid filter parameters")
+    if match not in ('prefix', 'contains') or (search is not None and len(search) > 120):
+        raise ValueError("Invalid search parameters")
+    contains = match == 'contains'
+    if search and contains and len(search) < config['USERS_SEARCH_MIN_LENGTH']:
+        # Короче трёх символов триграммный индекс не помогает, запрос сводится к полному сканированию
+        raise ValueError("Search string is too short")
+
+    return UserDirectoryQuery(fields, after, min(limit, config['USERS_MAX_LIMIT']), role, team, search, contains)
+
+
+def parse_changes_args(args, config, last_event_id=None):
+    """
+    Разбирает параметры журнала изменений команды ``since`` и ``limit``.
+
+    :param args: Параметры строки запроса
+    :param config: Конфигурация приложения
+    :param last_event_id: Заголовок Last-Event-ID переподключившегося потока SSE (имеет приоритет над since)
+    :return: Кортеж (since, limit)
+    :raises ValueError: С текстом ошибки для ответа 400
+    """
+    try:
+        since = int(last_event_id or args.get('since', 0))
+        limit = int(args.get('limit', config['CHANGES_PAGE_SIZE']))
+    except ValueError:
+        raise ValueError("Invalid pagination parameters")
+    if since < 0 or limit < 1:
+        raise ValueError("Invalid pagination parameters")
+    return since, min(limit, config['CHANGES_MAX_LIMIT'])
+
+
+def parse_page_args(args, config):
     """
-    Декоратор для проверки наличия ожидаемых аргументов в JSON данных запроса.
+    Разбирает параметры постраничной выдачи участников команды ``limit`` и ``after``.
+
+    :param args: Параметры строки запроса
+    :param config: Конфигурация приложения
+    :return: Кортеж (limit, after); ``None`` для отсутствующих параметров
+    :raises ValueError: Если параметры не являются положительными целыми числами
+    """
+    try:
+        limit = int(args['limit']) if 'limit' in args else None
+        after = int(args['after']) if 'after' in args else None
+    except ValueError:
+        raise ValueError('pagination parameters must be integers')
+    if limit is not None:
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        limit = min(limit, config['TEAM_MEMBERS_MAX_LIMIT'])
+    return limit, after
+
+
+def wants_format(args, accept, name, mimetype):
+    """
+    Проверяет, запросил ли клиент выдачу в формате mimetype вместо JSON.
+
+    :param args: Параметры строки запроса (``format=name``)
+    :param accept: Заголовок Accept (:class:`werkzeug.datastructures.MIMEAccept`)
+    :param name: Значение параметра format
+    :param mimetype: Тип содержимого
+    """
+    if args.get('format') == name:
+        return True
+    return accept.best_match(['application/json', mimetype]) == mimetype
+
+
+def body_too_large(limit):
+    """
+    Читает тело запроса не больше limit байт до его разбора.
+
+    Тело с Content-Length больше limit не читается, тело без него (chunked) читается не дальше
+    limit + 1 байт. Прочитанное тело кешируется, его используют ``request.get_json`` и ``request.get_data``.
+
+    :param limit: Максимальный размер тела в байтах
+    :return: True, если тело больше limit
+    """
+    # Поток без Content-Length на пределе обрезается молча, поэтому читается на байт больше limit
+    request.max_content_length = limit + 1
+    try:
+        return len(request.get_data()) > limit
+    except RequestEntityTooLarge:
+        return True
+
+
+def jwt_required():
+    """
+    Декоратор, требующий действительный access-токен (как ``flask_jwt_extended.jwt_required``).
+
+    Подзапросы ``POST /batch`` выполняются в контексте приложения запроса пакета, который
+    уже проверил токен (см. :mod:`app.batch`), поэтому токен не декодируется повторно.
+
+    :return: Декоратор функции представления
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not g.get('_batch_jwt_verified'):
+                verify_jwt_in_request()
+            return current_app.ensure_sync(f)(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def validate_json(schema):
+    """
+    Декоратор для проверки JSON данных запроса по скомпилированной схеме.
+
+    Тело больше ``JSON_MAX_BODY_SIZE`` отклоняется без чтения сверх этого размера (см. :func:`body_too_large`).
 
-    :param expected_args: Ожидаемые аргументы в JSON данных.
-    :type expected_args: tuple
+    :param schema: Скомпилированная схема тела запроса (:class:`app.schemas.Schema`)
+    :type schema: Schema
 
-    :return: Результат выполнения функции или сообщение об ошибке, если аргументы отсутствуют.
+    :return: Результат выполнения функции или сообщение об ошибке, если данные не соответствуют схеме.
     :rtype: dict
     """
 
@@ -17,22 +210,21 @@ def validate_json(*expected_args):
         @wraps(f)
         def wrapper(*args, **kwargs):
             """
-            Проверяет наличие ожидаемых аргументов в JSON данных запроса.
+            Проверяет размер тела запроса и JSON данные по схеме.
 
             :param args: Позиционные аргументы функции.
             :param kwargs: Именованные аргументы функции.
 
-            :return: Результат выполнения функции или сообщение об ошибке, если аргументы отсутствуют.
+            :return: Результат выполнения функции или сообщение об ошибке, если данные некорректны.
             :rtype: dict
             """
-            data = request.get_json()
-            if not data:
-                return jsonify({"error": "Invalid JSON"}), 400
-            for arg in expected_args:
-                if arg not in data:
-                    return jsonify({"error": f"Missing argument: {arg}"}), 400
+            if body_too_large(current_app.config['JSON_MAX_BODY_SIZE']):
+                return jsonify({"error": "Request body too large"}), 413
+            error = schema.validate(request.get_json(silent=True))
+            if error:
+                return jsonify({"error": error}), 400
             return f(*args, **kwargs)
 
         return wrapper
 
-    return decorator
\ No newline at end of file
+    return decorator
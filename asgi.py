@@ -0,0 +1,11 @@
+from app.asgi import create_asgi_app
+from config import Config
+
+app = create_asgi_app(Config)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    host, _, port = Config.SERVER_BIND.rpartition(':')
+    uvicorn.run('asgi:app', host=host, port=int(port), workers=Config.SERVER_WORKERS,
+                timeout_keep_alive=Config.SERVER_KEEPALIVE)
@@ -0,0 +1,5 @@
+"""
+Нагрузочные сценарии и сравнение результатов.
+
+Запуск: ``python -m bench run --help`` и ``python -m bench compare --help``.
+"""
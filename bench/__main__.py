@@ -0,0 +1,184 @@
+import argparse
+import json
+import random
+import sys
+from datetime import datetime, timezone
+
+from bench.compare import compare_reports
+from bench.runner import run_scenario
+from bench.scenarios import SCENARIOS, load_dataset, member_email, seed_dataset
+from bench.server import LocalServer
+
+
+def _parse_env(pairs):
+    env = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        env[key] = value
+    return env
+
+
+def run(args):
+    """Подготавливает данные, выполняет сценарии и сохраняет отчёт в JSON."""
+    scenarios = args.scenario or list(SCENARIOS)
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = LocalServer(env=_parse_env(args.server_env)).__enter__()
+        base_url = server.base_url
+    try:
+        if args.dataset:
+            with open(args.dataset, encoding='utf-8') as file:
+                dataset = load_dataset(base_url, json.load(file))
+        else:
+            dataset = seed_dataset(base_url, args.teams, args.team_size)
+        report = {
+            "meta": {
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "base_url": base_url,
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "teams": args.teams,
+                "team_size": args.team_size,
+            },
+            "scenarios": {},
+        }
+        for name in scenarios:
+            print(f'Running {name}...', file=sys.stderr)
+            report["scenarios"][name] = run_scenario(
+                SCENARIOS[name], base_url, dataset, args.concurrency,
+                duration=args.duration if args.operations is None else None,
+                operations=args.operations
+            )
+    finally:
+        if server is not None:
+            server.__exit__(None, None, None)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    print(output)
+    return 0
+
+
+def seed(args):
+    """Генерирует синтетический набор данных прямо в базе и сохраняет его описание."""
+    from bench.seed import seed_in_app
+
+    try:
+        manifest = seed_in_app(
+            users=args.users, teams=args.teams, seed=args.seed, exponent=args.zipf,
+            memberships_per_user=args.memberships_per_user, leaders=args.leaders,
+            hash_method='pbkdf2:sha256:1000' if args.cheap_hash else None,
+            log=lambda message: print(message, file=sys.stderr)
+        )
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    with open(args.manifest, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, ensure_ascii=False)
+    return 0
+
+
+def audit(args):
+    """Проверяет планы запросов маршрутов; код возврата 1 при последовательном сканировании больших таблиц."""
+    from bench.plan_audit import audit as audit_plans
+
+    team = email = None
+    if args.dataset:
+        with open(args.dataset, encoding='utf-8') as file:
+            manifest = json.load(file)
+        team = manifest["teams"][0]
+        email = member_email(manifest, random.Random(0))
+    report, violations = audit_plans(args.threshold, team=team, member_email=email)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if violations:
+        print(f'\n{violations} statement(s) with sequential scans above {args.threshold} rows', file=sys.stderr)
+        return 1
+    return 0
+
+
+def startup(args):
+    """Проверяет время старта и память рабочего процесса; код возврата 1 при превышении бюджета."""
+    from bench.startup import check_budget, measure
+
+    report = measure(env=_parse_env(args.server_env), repeat=args.repeat)
+    print(json.dumps(report, indent=2))
+    violations = check_budget(report, args.max_seconds, args.max_rss_mb)
+    for violation in violations:
+        print(violation, file=sys.stderr)
+    return 1 if violations else 0
+
+
+def compare(args):
+    """Сравнивает два отчёта; код возврата 1 при наличии регрессий."""
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    with open(args.candidate, encoding='utf-8') as file:
+        candidate = json.load(file)
+    lines, regressions = compare_reports(baseline, candidate, args.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) above {args.threshold}%', file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Нагрузочное тестирование API')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Выполнить сценарии и сохранить отчёт')
+    run_parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help='Сценарий (можно указать несколько раз; по умолчанию все)')
+    run_parser.add_argument('--base-url', help='Адрес уже запущенного приложения (иначе запускается локально)')
+    run_parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                            help='Переменная окружения для локально запускаемого приложения')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=10.0, help='Длительность сценария в секундах')
+    run_parser.add_argument('--operations', type=int, help='Количество операций вместо длительности')
+    run_parser.add_argument('--teams', type=int, default=3)
+    run_parser.add_argument('--team-size', type=int, default=1000)
+    run_parser.add_argument('--dataset', help='Описание набора данных от команды seed (вместо создания через API)')
+    run_parser.add_argument('--output', help='Файл для отчёта в формате JSON')
+    run_parser.set_defaults(handler=run)
+
+    seed_parser = commands.add_parser('seed', help='Загрузить синтетический набор данных в базу (DATABASE_URL)')
+    seed_parser.add_argument('--users', type=int, default=1000000)
+    seed_parser.add_argument('--teams', type=int, default=100000)
+    seed_parser.add_argument('--seed', type=int, default=42)
+    seed_parser.add_argument('--zipf', type=float, default=1.1, help='Показатель распределения размеров команд')
+    seed_parser.add_argument('--memberships-per-user', type=float, default=1.5)
+    seed_parser.add_argument('--leaders', type=int, help='Размер пула руководителей (по умолчанию teams / 10)')
+    seed_parser.add_argument('--cheap-hash', action='store_true',
+                             help='Дешёвый хеш пароля pbkdf2:sha256:1000 вместо PASSWORD_HASH_METHOD')
+    seed_parser.add_argument('--manifest', default='dataset.json', help='Файл описания набора данных')
+    seed_parser.set_defaults(handler=seed)
+
+    audit_parser = commands.add_parser('audit', help='Проверить планы запросов маршрутов (EXPLAIN ANALYZE)')
+    audit_parser.add_argument('--dataset', help='Описание набора данных от команды seed')
+    audit_parser.add_argument('--threshold', type=int, default=10000,
+                              help='Допустимое число строк последовательного сканирования')
+    audit_parser.set_defaults(handler=audit)
+
+    startup_parser = commands.add_parser('startup', help='Проверить время импорта и RSS рабочего процесса')
+    startup_parser.add_argument('--max-seconds', type=float, default=1.0, help='Бюджет импорта и create_app()')
+    startup_parser.add_argument('--max-rss-mb', type=float, default=80.0, help='Бюджет пикового RSS, МБ')
+    startup_parser.add_argument('--repeat', type=int, default=5)
+    startup_parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                                help='Переменная окружения для проверяемого процесса')
+    startup_parser.set_defaults(handler=startup)
+
+    compare_parser = commands.add_parser('compare', help='Сравнить два отчёта')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='Допустимое ухудшение, %%')
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def compare_reports(baseline, candidate, threshold):
+    """
+    Сравнивает два отчёта и находит регрессии задержек и пропускной способности.
+
+    :param baseline: Отчёт базового прогона
+    :param candidate: Отчёт проверяемого прогона
+    :param threshold: Допустимое ухудшение в процентах
+    :return: Кортеж (строки сравнения, список регрессий)
+    """
+    lines = []
+    regressions = []
+    for scenario, base_result in baseline["scenarios"].items():
+        new_result = candidate["scenarios"].get(scenario)
+        if new_result is None:
+            continue
+        for endpoint, base_stats in base_result["endpoints"].items():
+            new_stats = new_result["endpoints"].get(endpoint)
+            if new_stats is None:
+                continue
+            for metric in METRICS + ('throughput_rps',):
+                before, after = base_stats[metric], new_stats[metric]
+                change = (after - before) / before * 100 if before else 0.0
+                # Для задержек хуже - рост, для пропускной способности - падение
+                worse = change > threshold if metric in METRICS else change < -threshold
+                lines.append(f'{scenario:15} {endpoint:40} {metric:15} {before:10.2f} -> {after:10.2f} '
+                             f'({change:+.1f}%){"  REGRESSION" if worse else ""}')
+                if worse:
+                    regressions.append((scenario, endpoint, metric, before, after))
+    return lines, regressions
@@ -0,0 +1,176 @@
+import uuid
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app, db
+
+
+AUDITED_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+class StatementRecorder:
+    """
+    Запоминает SQL-запросы, выполненные, пока задана метка маршрута ``label``.
+
+    Для ``executemany`` запоминается первый набор параметров: план у всех наборов общий.
+    Пакетный INSERT (insertmanyvalues) передаётся одним набором и запоминается как есть.
+    """
+
+    def __init__(self):
+        self.label = None
+        self.statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.label is not None and statement.lstrip().upper().startswith(AUDITED_STATEMENTS):
+            if executemany and isinstance(parameters, list):
+                parameters = parameters[0] if parameters else None
+            self.statements.append((self.label, statement, parameters, executemany))
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+def drive_routes(recorder, team=None, member_email=None):
+    """
+    Вызывает все маршруты приложения и записывает выполненные ими SQL-запросы.
+
+    Изменяющие маршруты работают со специально созданными командой и пользователями,
+    которые удаляются в конце. Чтение списка участников дополнительно выполняется
+    для ``team`` - большой команды из загруженного набора данных.
+
+    :param recorder: Экземпляр StatementRecorder
+    :param team: Название большой команды для проверки чтения
+    :param member_email: Email существующего пользователя для проверки поиска по email
+    """
+    client = current_app.test_client()
+    suffix = uuid.uuid4().hex[:8]
+    leader = {"email": f'audit-{suffix}@example.com', "password": 'auditpassword', "name": 'Audit'}
+    member = {"email": f'audit-{suffix}-m@example.com', "password": 'auditpassword',
+              "name": 'Audit', "surname": 'Member'}
+    team_name = f'audit-{suffix}'
+
+    def call(label, method, path, **kwargs):
+        recorder.label = label
+        try:
+            return client.open(path, method=method, buffered=True, **kwargs)
+        finally:
+            recorder.label = None
+
+    call('auth.register', 'POST', '/auth/register', json=leader)
+    token = call('auth.login', 'POST', '/auth/login', json=leader).get_json()["access_token"]
+    headers = {"Authorization": f'Bearer {token}'}
+    call('auth.protected', 'GET', '/auth/protected', headers=headers)
+    call('routes.new_team', 'POST', '/new_team', json={"team_name": team_name}, headers=headers)
+    call('routes.add_member', 'POST', f'/{team_name}/add_member', json=member)
+    call('routes.add_members_bulk', 'POST', f'/{team_name}/members:bulk', headers=headers, json=[
+        {**member, "email": f'audit-{suffix}-b{i}@example.com'} for i in range(3)
+    ])
+    call('routes.update_profile', 'PUT', f'/{team_name}/{leader["email"]}/profile',
+         json={"name": 'Audit', "surname": 'Leader'}, headers=headers)
+    call('routes.new_team', 'POST', '/new_team', json={"team_name": f'{team_name}-2'}, headers=headers)
+    call('routes.restructure_teams', 'POST', '/teams:restructure', headers=headers, json={
+        "move": [{"email": f'audit-{suffix}-b1@example.com', "from_team": team_name, "to_team": f'{team_name}-2'}],
+        "leaders": [{"team": f'{team_name}-2', "email": member["email"]}],
+    })
+
+    for name in filter(None, (team_name, team)):
+        etag = call('routes.get_team_members', 'GET', f'/{name}').headers.get('ETag')
+        call('routes.get_team_members (etag)', 'GET', f'/{name}', headers={"If-None-Match": etag or '"0"'})
+        first_page = call('routes.get_team_members (page)', 'GET', f'/{name}?limit=100').get_json()
+        if first_page.get("next_cursor"):
+            call('routes.get_team_members (page)', 'GET', f'/{name}?limit=100&after={first_page["next_cursor"]}')
+        call('routes.get_team_members (ndjson)', 'GET', f'/{name}?format=ndjson')
+        call('routes.get_team_changes', 'GET', f'/{name}/changes?since=0&limit=100')
+    if member_email:
+        call('auth.login (existing)', 'POST', '/auth/login', json={"email": member_email, "password": '-'})
+
+    for email in [member["email"]] + [f'audit-{suffix}-b{i}@example.com' for i in (0, 2)]:
+        call('routes.delete_user', 'DELETE', f'/{team_name}/{email}', headers=headers)
+
+
+def _scan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from _scan_nodes(child)
+
+
+def explain(connection, statement, parameters):
+    """
+    Возвращает план запроса в формате JSON.
+
+    SELECT выполняется с ANALYZE и BUFFERS, изменяющие запросы только планируются,
+    чтобы не менять данные и не получать ошибки уникальности.
+    """
+    analyze = statement.lstrip().upper().startswith(('SELECT', 'WITH'))
+    options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN ({options}) {statement}', parameters)
+        return cursor.fetchone()[0][0], analyze
+
+
+def audit(threshold, team=None, member_email=None):
+    """
+    Проверяет планы всех запросов, которые выполняют маршруты приложения.
+
+    :param threshold: Максимально допустимое число строк, просматриваемых последовательным сканированием
+    :param team: Название большой команды из загруженного набора данных
+    :param member_email: Email существующего пользователя
+    :return: Кортеж (отчёт по запросам, количество нарушений)
+    """
+    with create_app().app_context():
+        if db.engine.dialect.name != 'postgresql':
+            raise SystemExit('Plan audit requires PostgreSQL (DATABASE_URL)')
+
+        with StatementRecorder() as recorder:
+            drive_routes(recorder, team=team, member_email=member_email)
+
+        report = []
+        violations = 0
+        seen = set()
+        raw = db.engine.raw_connection()
+        try:
+            for label, statement, parameters, executemany in recorder.statements:
+                # executemany проверяется один раз на запрос, остальные - на каждый набор параметров
+                key = (label, statement, None if executemany else repr(parameters))
+                if key in seen:
+                    continue
+                seen.add(key)
+                try:
+                    plan, analyzed = explain(raw, statement, parameters)
+                except Exception as error:
+                    report.append({"route": label, "statement": statement, "executemany": executemany,
+                                   "error": str(error).strip()})
+                    continue
+                finally:
+                    raw.rollback()
+
+                seq_scans = []
+                for node in _scan_nodes(plan['Plan']):
+                    if node['Node Type'] != 'Seq Scan':
+                        continue
+                    if analyzed:
+                        rows = (node['Actual Rows'] + node.get('Rows Removed by Filter', 0)) * node['Actual Loops']
+                    else:
+                        rows = node['Plan Rows']
+                    seq_scans.append({"relation": node['Relation Name'], "rows": rows})
+                failed = [scan for scan in seq_scans if scan["rows"] > threshold]
+                violations += bool(failed)
+                report.append({
+                    "route": label,
+                    "statement": ' '.join(statement.split()),
+                    "executemany": executemany,
+                    "execution_ms": plan.get('Execution Time'),
+                    "shared_hit_blocks": plan['Plan'].get('Shared Hit Blocks'),
+                    "shared_read_blocks": plan['Plan'].get('Shared Read Blocks'),
+                    "seq_scans": seq_scans,
+                    "ok": not failed,
+                })
+        finally:
+            raw.close()
+    return report, violations
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+class BenchClient:
+    """
+    HTTP-клиент рабочего потока: общий ``requests.Session`` и запись длительности запросов.
+
+    :param base_url: Адрес приложения
+    :param samples: Словарь метка -> список (длительность, успех), общий для потока
+    """
+
+    def __init__(self, base_url, samples):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.samples = samples
+
+    def request(self, label, method, path, expected=(200, 201, 304), **kwargs):
+        """
+        Выполняет запрос и записывает его длительность под меткой ``label``.
+
+        :return: Объект ответа или None при сетевой ошибке
+        """
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=60, **kwargs)
+        except requests.exceptions.RequestException:
+            response = None
+        elapsed = time.perf_counter() - started
+        ok = response is not None and response.status_code in expected
+        self.samples.setdefault(label, []).append((elapsed, ok))
+        return response
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по методу ближайшего ранга для отсортированного списка."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples, elapsed):
+    """
+    Сводит замеры в статистику по эндпоинтам.
+
+    :param samples: Словарь метка -> список (длительность, успех)
+    :param elapsed: Длительность сценария в секундах
+    """
+    endpoints = {}
+    for label, values in sorted(samples.items()):
+        durations = sorted(duration for duration, _ in values)
+        endpoints[label] = {
+            "count": len(values),
+            "errors": sum(1 for _, ok in values if not ok),
+            "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(sum(durations) / len(durations) * 1000, 2),
+            "p50_ms": round(percentile(durations, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(durations, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(durations, 0.99) * 1000, 2),
+        }
+    total = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {
+        "duration_s": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def run_scenario(scenario, base_url, dataset, concurrency, duration=None, operations=None):
+    """
+    Выполняет сценарий в ``concurrency`` потоках до истечения времени или числа операций.
+
+    :param scenario: Функция (client, dataset, rng) выполняющая одну операцию
+    :param base_url: Адрес приложения
+    :param dataset: Данные, подготовленные для сценариев
+    :param concurrency: Количество параллельных клиентов
+    :param duration: Длительность в секундах
+    :param operations: Общее количество операций (вместо длительности)
+    :return: Сводная статистика сценария
+    """
+    counter = iter(range(operations)) if operations is not None else None
+    counter_lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration is not None else None
+
+    def should_continue():
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        if counter is not None:
+            with counter_lock:
+                return next(counter, None) is not None
+        return True
+
+    def worker(seed):
+        samples = {}
+        client = BenchClient(base_url, samples)
+        rng = random.Random(seed)
+        while should_continue():
+            scenario(client, dataset, rng)
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    merged = {}
+    for samples in results:
+        for label, values in samples.items():
+            merged.setdefault(label, []).extend(values)
+    return summarize(merged, elapsed)
@@ -0,0 +1,157 @@
+import uuid
+
+import requests
+
+
+PASSWORD = 'benchpassword'
+
+
+def _member_email(run_id, team_index, index):
+    return f'bench-{run_id}-{team_index}-{index}@example.com'
+
+
+def member_email(dataset, rng):
+    """
+    Email случайного участника набора данных.
+
+    Адреса участников не хранятся в описании набора, а выводятся из ``run_id`` и его размеров:
+    ``users`` для набора ``python -m bench seed``, количество команд и ``team_size`` для набора,
+    созданного через API.
+
+    :param dataset: Данные для сценариев
+    :param rng: Генератор случайных чисел
+    :return: Email
+    """
+    if "users" in dataset:
+        return f'{dataset["run_id"]}-{rng.randrange(dataset["users"])}@example.com'  # DatasetGenerator.email
+    return _member_email(dataset["run_id"], rng.randrange(len(dataset["teams"])), rng.randrange(dataset["team_size"]))
+
+
+def seed_dataset(base_url, teams, team_size, batch_size=1000):
+    """
+    Создаёт лидера, команды и участников через API.
+
+    Участники добавляются массовым импортом, поэтому время подготовки определяется
+    стоимостью хеширования паролей в приложении (``PASSWORD_HASH_METHOD``).
+
+    :param base_url: Адрес приложения
+    :param teams: Количество команд
+    :param team_size: Количество участников в каждой команде
+    :param batch_size: Размер пачки массового импорта
+    :return: Данные для сценариев
+    """
+    run_id = uuid.uuid4().hex[:8]
+    session = requests.Session()
+    leader_email = f'bench-{run_id}-leader@example.com'
+    session.post(f'{base_url}/auth/register', json={
+        "email": leader_email, "password": PASSWORD, "name": "Bench", "surname": "Leader"
+    }).raise_for_status()
+    token = session.post(f'{base_url}/auth/login', json={
+        "email": leader_email, "password": PASSWORD
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    team_names = []
+    for team_index in range(teams):
+        team_name = f'bench-{run_id}-team-{team_index}'
+        session.post(f'{base_url}/new_team', json={"team_name": team_name}, headers=headers).raise_for_status()
+        team_names.append(team_name)
+        rows = [{
+            "name": f'Name{i}',
+            "surname": f'Surname{i}',
+            "email": _member_email(run_id, team_index, i),
+            "password": PASSWORD
+        } for i in range(team_size)]
+        for start in range(0, len(rows), batch_size):
+            response = session.post(f'{base_url}/{team_name}/members:bulk',
+                                    json=rows[start:start + batch_size], headers=headers, timeout=600)
+            response.raise_for_status()
+
+    return {
+        "run_id": run_id,
+        "password": PASSWORD,
+        "leader_email": leader_email,
+        "leader_headers": headers,
+        "teams": team_names,
+        "team_size": team_size,
+    }
+
+
+def load_dataset(base_url, manifest):
+    """
+    Готовит данные для сценариев по описанию набора, загруженного ``python -m bench seed``.
+
+    :param base_url: Адрес приложения
+    :param manifest: Описание набора данных
+    """
+    response = requests.post(f'{base_url}/auth/login', json={
+        "email": manifest["leader_email"], "password": manifest["password"]
+    })
+    response.raise_for_status()
+    return {
+        "run_id": manifest["run_id"],
+        "password": manifest["password"],
+        "leader_email": manifest["leader_email"],
+        "leader_headers": {"Authorization": f'Bearer {response.json()["access_token"]}'},
+        "teams": manifest["teams"],
+        "users": manifest["users"],
+    }
+
+
+def register_storm(client, dataset, rng):
+    """Регистрация новых пользователей."""
+    client.request('POST /auth/register', 'POST', '/auth/register', json={
+        "email": f'bench-{dataset["run_id"]}-reg-{uuid.uuid4().hex}@example.com', "password": PASSWORD
+    })
+
+
+def login_storm(client, dataset, rng):
+    """Вход существующих участников."""
+    client.request('POST /auth/login', 'POST', '/auth/login', json={
+        "email": member_email(dataset, rng), "password": dataset["password"]
+    })
+
+
+def roster_reads(client, dataset, rng):
+    """Чтение полного списка участников больших команд."""
+    client.request('GET /<name_team>', 'GET', f'/{rng.choice(dataset["teams"])}')
+
+
+def roster_pages(client, dataset, rng):
+    """Постраничное чтение списка участников с переходом по курсору."""
+    team_name = rng.choice(dataset["teams"])
+    path = f'/{team_name}?limit=100'
+    while path:
+        response = client.request('GET /<name_team>?limit', 'GET', path)
+        cursor = response.json().get("next_cursor") if response is not None and response.ok else None
+        path = f'/{team_name}?limit=100&after={cursor}' if cursor else None
+
+
+def mixed(client, dataset, rng):
+    """Смешанная нагрузка: в основном чтение, немного записи и входа."""
+    roll = rng.random()
+    if roll < 0.8:
+        roster_reads(client, dataset, rng)
+    elif roll < 0.9:
+        team_name = rng.choice(dataset["teams"])
+        client.request('POST /<name_team>/add_member', 'POST', f'/{team_name}/add_member', json={
+            "name": "Added", "surname": "Member", "password": PASSWORD,
+            "email": f'bench-{dataset["run_id"]}-add-{uuid.uuid4().hex}@example.com'
+        })
+    elif roll < 0.95:
+        team_name = rng.choice(dataset["teams"])
+        client.request('PUT /<name_team>/<user_email>/profile', 'PUT',
+                       f'/{team_name}/{dataset["leader_email"]}/profile',
+                       json={"name": "Bench", "surname": f'Leader{rng.randrange(1000)}'},
+                       headers=dataset["leader_headers"])
+    else:
+        login_storm(client, dataset, rng)
+
+
+SCENARIOS = {
+    'register_storm': register_storm,
+    'login_storm': login_storm,
+    'roster_reads': roster_reads,
+    'roster_pages': roster_pages,
+    'mixed': mixed,
+}
@@ -0,0 +1,177 @@
+import csv
+import io
+import itertools
+import random
+import time
+from bisect import bisect_left
+
+from flask import current_app
+from sqlalchemy import func, insert, select, text
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+from app.models import User, Team, user_team
+
+
+NAMES = ('Иван', 'Петр', 'Анна', 'Мария', 'Алексей', 'Ольга', 'Сергей', 'Елена', 'Дмитрий', 'Наталья')
+SURNAMES = ('Иванов', 'Петров', 'Смирнова', 'Кузнецова', 'Попов', 'Соколова', 'Лебедев', 'Новикова')
+
+
+def zipf_sizes(count, total, exponent):
+    """
+    Размеры команд по закону Ципфа: размер команды ранга k пропорционален 1 / k^exponent.
+
+    :param count: Количество команд
+    :param total: Суммарное количество участий (строк user_team)
+    :param exponent: Показатель распределения (больше - сильнее перекос)
+    :return: Список размеров, по убыванию
+    """
+    weights = [1 / rank ** exponent for rank in range(1, count + 1)]
+    scale = total / sum(weights)
+    return [max(1, round(weight * scale)) for weight in weights]
+
+
+def zipf_choice(rng, cumulative):
+    """Случайный индекс по накопленным весам распределения Ципфа."""
+    return bisect_left(cumulative, rng.random() * cumulative[-1])
+
+
+class DatasetGenerator:
+    """
+    Детерминированный по ``seed`` генератор пользователей, команд и участий.
+
+    Лидеры выбираются из небольшого пула руководителей по закону Ципфа, поэтому один
+    руководитель может возглавлять много команд; лидер всегда состоит в своей команде,
+    как при создании команды через API.
+    """
+
+    def __init__(self, users, teams, seed=42, exponent=1.1, memberships_per_user=1.5, leaders=None,
+                 user_id_start=1, team_id_start=1):
+        self.users = users
+        self.teams = teams
+        self.seed = seed
+        self.exponent = exponent
+        self.user_id_start = user_id_start
+        self.team_id_start = team_id_start
+        self.sizes = [min(size, users) for size in zipf_sizes(teams, int(users * memberships_per_user), exponent)]
+        self.leaders = leaders or max(1, teams // 10)
+
+    def email(self, index):
+        return f'seed{self.seed}-{index}@example.com'
+
+    def team_name(self, index):
+        return f'seed{self.seed}-team-{index}'
+
+    def user_rows(self, password_hash):
+        rng = random.Random(self.seed)
+        for index in range(self.users):
+            yield (self.user_id_start + index, self.email(index), password_hash, 'member',
+                   rng.choice(NAMES), rng.choice(SURNAMES))
+
+    def team_leaders(self):
+        rng = random.Random(self.seed + 1)
+        pool = rng.sample(range(self.users), min(self.leaders, self.users))
+        cumulative = list(itertools.accumulate(1 / rank ** self.exponent for rank in range(1, len(pool) + 1)))
+        return [pool[zipf_choice(rng, cumulative)] for _ in range(self.teams)]
+
+    def team_rows(self, leaders):
+        for index, leader in enumerate(leaders):
+            yield (self.team_id_start + index, self.team_name(index), self.user_id_start + leader, 1)
+
+    def membership_rows(self, leaders):
+        rng = random.Random(self.seed + 2)
+        for index, (size, leader) in enumerate(zip(self.sizes, leaders)):
+            team_id = self.team_id_start + index
+            members = set(rng.sample(range(self.users), size))
+            members.add(leader)
+            for member in members:
+                yield (self.user_id_start + member, team_id)
+
+
+def _copy_rows(connection, table, columns, rows, chunk_size):
+    """Загрузка строк через COPY ... FROM STDIN (PostgreSQL)."""
+    preparer = db.engine.dialect.identifier_preparer
+    statement = (f'COPY {preparer.format_table(table)} ({", ".join(preparer.quote(c) for c in columns)}) '
+                 f'FROM STDIN WITH (FORMAT csv)')
+    raw = connection.connection.dbapi_connection
+    with raw.cursor() as cursor:
+        for chunk in _chunked(rows, chunk_size):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+
+
+def _insert_rows(connection, table, columns, rows, chunk_size):
+    """Загрузка строк пачками многострочных INSERT."""
+    for chunk in _chunked(rows, chunk_size):
+        connection.execute(insert(table), [dict(zip(columns, row)) for row in chunk])
+
+
+def _chunked(rows, size):
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def seed(users, teams, seed=42, exponent=1.1, memberships_per_user=1.5, leaders=None,
+         password='benchpassword', hash_method=None, chunk_size=50000, log=print):
+    """
+    Генерирует и загружает синтетический набор данных в базу приложения.
+
+    Все пользователи получают один заранее вычисленный хеш пароля ``password``, поэтому
+    загрузка не упирается в хеширование. По умолчанию используется рабочий метод
+    ``PASSWORD_HASH_METHOD``; дешёвый ``hash_method`` ускоряет вход в сценариях, но такие
+    хеши будут пересчитаны при первом входе пользователя.
+
+    :return: Описание набора данных для ``python -m bench run --dataset``
+    :raises ValueError: Набор с этим ``seed`` уже загружен (адреса пользователей совпали бы)
+    """
+    password_hash = generate_password_hash(password, method=hash_method or current_app.config['PASSWORD_HASH_METHOD'])
+    load = _copy_rows if db.engine.dialect.name == 'postgresql' else _insert_rows
+
+    with db.engine.begin() as connection:
+        user_id_start = (connection.scalar(select(func.max(User.id))) or 0) + 1
+        team_id_start = (connection.scalar(select(func.max(Team.id))) or 0) + 1
+        generator = DatasetGenerator(users, teams, seed, exponent, memberships_per_user, leaders,
+                                     user_id_start, team_id_start)
+        if connection.scalar(select(User.id).where(User.email == generator.email(0))) is not None:
+            raise ValueError(f'Dataset seed{seed} is already loaded, use another --seed')
+        leaders_of_teams = generator.team_leaders()
+
+        started = time.perf_counter()
+        load(connection, User.__table__, ('id', 'email', 'password', 'role', 'name', 'surname'),
+             generator.user_rows(password_hash), chunk_size)
+        log(f'users: {users} in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        load(connection, Team.__table__, ('id', 'name', 'leader_id', 'version'),
+             generator.team_rows(leaders_of_teams), chunk_size)
+        log(f'teams: {teams} in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        load(connection, user_team, ('user_id', 'team_id'), generator.membership_rows(leaders_of_teams), chunk_size)
+        log(f'memberships: ~{sum(generator.sizes)} in {time.perf_counter() - started:.1f}s')
+
+        if connection.dialect.name == 'postgresql':
+            # Идентификаторы заданы явно - сдвигаем последовательности за загруженные значения
+            for table in ('user', 'team'):
+                connection.execute(text(
+                    f'SELECT setval(pg_get_serial_sequence(\'"{table}"\', \'id\'), (SELECT max(id) FROM "{table}"))'
+                ))
+
+    largest = sorted(range(teams), key=lambda index: -generator.sizes[index])[:10]
+    return {
+        "run_id": f'seed{seed}',
+        "password": password,
+        "teams": [generator.team_name(index) for index in largest],
+        "team_sizes": [generator.sizes[index] for index in largest],
+        "leader_email": generator.email(leaders_of_teams[largest[0]]),
+        "users": users,  # адреса участников выводятся из run_id (scenarios.member_email)
+    }
+
+
+def seed_in_app(**kwargs):
+    """Выполняет :func:`seed` в контексте приложения."""
+    with create_app().app_context():
+        return seed(**kwargs)
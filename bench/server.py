@@ -0,0 +1,60 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """
+    Запускает приложение в отдельном процессе на свободном порту.
+
+    :param env: Дополнительные переменные окружения для процесса приложения
+    :param startup_timeout: Время ожидания готовности сервера в секундах
+    """
+
+    def __init__(self, env=None, startup_timeout=30):
+        self.port = _free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        # Вся нагрузка идёт с одного IP, поэтому ограничение частоты по IP по умолчанию выключено
+        self.env = {**os.environ, "RATE_LIMIT_ENDPOINTS": '', **(env or {})}
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(self.port),
+             '--no-reload', '--no-debugger', '--with-threads'],
+            cwd=ROOT_DIR, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('Application process exited during startup')
+            try:
+                requests.get(f'{self.base_url}/metrics', timeout=1)
+                return self
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError('Application did not start in time')
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, которые не должны загружаться в рабочих процессах
+HEAVY_MODULES = ('flasgger', 'jsonschema', 'alembic', 'mako')
+
+# Переменные окружения рабочего процесса: без Swagger UI и миграций
+WORKER_ENV = {
+    "SWAGGER_ENABLED": 'false',
+    "MIGRATIONS_ENABLED": 'false',
+}
+
+# Пиковый RSS берётся из VmHWM: ru_maxrss в Linux сохраняется при exec и включал бы RSS родителя
+# (например, процесса pytest), запустившего замер
+PROBE = f'''
+import json, resource, sys, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+def max_rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "max_rss_mb": max_rss_mb(),
+    "heavy_modules": sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules),
+}}))
+'''
+
+
+def measure(env=None, repeat=5):
+    """
+    Замеряет время импорта и создания приложения и пиковый RSS в новых процессах интерпретатора.
+
+    :param env: Дополнительные переменные окружения
+    :param repeat: Количество запусков; время берётся минимальное, RSS - максимальный
+    :return: Словарь с seconds, max_rss_mb и heavy_modules
+    """
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd=ROOT_DIR, env={**os.environ, **WORKER_ENV, **(env or {})},
+            capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    return {
+        "seconds": min(sample["seconds"] for sample in samples),
+        "max_rss_mb": max(sample["max_rss_mb"] for sample in samples),
+        "heavy_modules": sorted({name for sample in samples for name in sample["heavy_modules"]}),
+    }
+
+
+def check_budget(report, max_seconds, max_rss_mb):
+    """
+    Сравнивает замеры с бюджетом старта.
+
+    :return: Список описаний нарушений (пустой, если бюджет соблюдён)
+    """
+    violations = []
+    if report["seconds"] > max_seconds:
+        violations.append(f'startup took {report["seconds"]:.3f}s > {max_seconds}s')
+    if report["max_rss_mb"] > max_rss_mb:
+        violations.append(f'max RSS {report["max_rss_mb"]:.1f} MB > {max_rss_mb} MB')
+    if report["heavy_modules"]:
+        violations.append(f'heavy modules imported: {", ".join(report["heavy_modules"])}')
+    return violations
@@ -0,0 +1,24 @@
+"""Add team version counter
+
+Revision ID: 3f1c9a7d2b64
+Revises: 94bda5c1b52e
+Create Date: 2026-10-18 10:12:41.305518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b64'
+down_revision = '94bda5c1b52e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('team', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('team', 'version')
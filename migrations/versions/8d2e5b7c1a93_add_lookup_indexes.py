@@ -0,0 +1,30 @@
+"""Add lookup indexes
+
+Revision ID: 8d2e5b7c1a93
+Revises: 3f1c9a7d2b64
+Create Date: 2026-10-18 11:40:09.118274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e5b7c1a93'
+down_revision = '3f1c9a7d2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_team_leader_id', 'team', ['leader_id'], unique=False)
+    op.create_index('ix_user_team_team_id', 'user_team', ['team_id'], unique=False)
+    # Email сравнивается без учёта регистра; создание индекса завершится ошибкой,
+    # если в таблице уже есть адреса, отличающиеся только регистром
+    op.create_index('uq_user_email_lower', 'user', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_user_email_lower', table_name='user')
+    op.drop_index('ix_user_team_team_id', table_name='user_team')
+    op.drop_index('ix_team_leader_id', table_name='team')
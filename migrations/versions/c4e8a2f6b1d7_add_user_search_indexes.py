@@ -0,0 +1,50 @@
+"""Add user search indexes
+
+Revision ID: c4e8a2f6b1d7
+Revises: 8d2e5b7c1a93
+Create Date: 2026-10-18 15:20:41.502318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2f6b1d7'
+down_revision = '8d2e5b7c1a93'
+branch_labels = None
+depends_on = None
+
+
+# Индексы поиска по выражениям: (название, выражение, класс операторов PostgreSQL, метод доступа)
+SEARCH_INDEXES = (
+    ('ix_user_email_lower_pattern', 'lower(email)', 'text_pattern_ops', 'btree'),
+    ('ix_user_name_lower_pattern', 'lower(name)', 'text_pattern_ops', 'btree'),
+    ('ix_user_surname_lower_pattern', 'lower(surname)', 'text_pattern_ops', 'btree'),
+    ('ix_user_email_trgm', 'lower(email)', 'gin_trgm_ops', 'gin'),
+    ('ix_user_name_trgm', 'lower(name)', 'gin_trgm_ops', 'gin'),
+    ('ix_user_surname_trgm', 'lower(surname)', 'gin_trgm_ops', 'gin'),
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index('ix_user_role_id', 'user', ['role', 'id'], unique=False)
+        for name, expression, _, _ in SEARCH_INDEXES:
+            op.create_index(name, 'user', [sa.text(expression)], unique=False)
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # На больших таблицах индексы строятся без блокировки записи (CONCURRENTLY вне транзакции)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_role_id', 'user', ['role', 'id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        for name, expression, opclass, using in SEARCH_INDEXES:
+            op.create_index(name, 'user', [sa.text(f'{expression} {opclass}')], unique=False,
+                            postgresql_using=using, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    for name, _, _, _ in reversed(SEARCH_INDEXES):
+        op.drop_index(name, table_name='user')
+    op.drop_index('ix_user_role_id', table_name='user')
@@ -0,0 +1,59 @@
+"""Add team change outbox
+
+Revision ID: e7b3d9f2a5c8
+Revises: c4e8a2f6b1d7
+Create Date: 2026-10-18 18:05:12.640915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3d9f2a5c8'
+down_revision = 'c4e8a2f6b1d7'
+branch_labels = None
+depends_on = None
+
+
+# Функции построения JSON-объекта для заполнения журнала существующими командами
+JSON_OBJECT = {
+    'postgresql': 'json_build_object',
+    'sqlite': 'json_object',
+}
+
+
+def upgrade():
+    op.create_table('team_change',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    sa.ForeignKeyConstraint(['team_id'], ['team.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_team_change_team_id_id', 'team_change', ['team_id', 'id'], unique=False)
+
+    # Журнал существующих команд: создание команды, затем добавление каждого участника,
+    # чтобы клиент мог собрать текущий состав, прочитав журнал с начала
+    json_object = JSON_OBJECT.get(op.get_bind().dialect.name)
+    if json_object is None:
+        return
+    op.execute(f"""
+        INSERT INTO team_change (team_id, kind, payload)
+        SELECT id, 'team_created', {json_object}('team_name', name, 'leader_id', leader_id)
+        FROM team ORDER BY id
+    """)
+    op.execute(f"""
+        INSERT INTO team_change (team_id, kind, payload)
+        SELECT user_team.team_id, 'member_added',
+               {json_object}('user_id', "user".id, 'name', "user".name, 'surname', "user".surname, 'role', "user".role)
+        FROM user_team JOIN "user" ON "user".id = user_team.user_id
+        ORDER BY user_team.team_id, "user".id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_team_change_team_id_id', table_name='team_change')
+    op.drop_table('team_change')
@@ -1,5 +1,9 @@
-from app import app
+from app import create_app, db
+from app.database import warm_up_pool
 from config import Config
 
+app = create_app(Config)
+
 if __name__ == "__main__":
+    warm_up_pool(app, db)
     app.run(debug=Config.DEBUG)
@@ -0,0 +1,92 @@
+import gc
+import os
+import resource
+
+from gunicorn.app.base import BaseApplication
+
+from app import create_app, db, hasher, replicas
+from app.database import warm_up_pool
+from config import ProductionConfig
+
+
+def current_rss_mb():
+    """Текущий размер резидентной памяти процесса в МБ (пиковый, если /proc недоступен)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def post_fork(server, worker):
+    """
+    Сбрасывает унаследованные от мастер-процесса соединения с базой (и репликами) и пул хеширования
+    и заранее открывает DB_POOL_MIN соединений.
+    """
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():
+            # close=False: соединения мастер-процесса не закрываются, а просто забываются
+            engine.dispose(close=False)
+    replicas.after_fork()
+    hasher.after_fork()
+    warm_up_pool(app, db)
+
+
+def post_request(worker, req, environ, resp):
+    """Завершает рабочий процесс после текущего запроса, если он превысил SERVER_MAX_RSS_MB."""
+    max_rss_mb = worker.wsgi.config['SERVER_MAX_RSS_MB']
+    if max_rss_mb and current_rss_mb() > max_rss_mb:
+        worker.log.info('Worker %s exceeded %s MB RSS, restarting', worker.pid, max_rss_mb)
+        worker.alive = False
+
+
+class Server(BaseApplication):
+    """
+    Рабочий сервер gunicorn с предзагруженным приложением.
+
+    Приложение создаётся один раз в мастер-процессе, после чего объекты переносятся
+    в постоянное поколение GC (``gc.freeze``): рабочие процессы получают их через fork
+    и делят страницы памяти, пока не изменяют их. После fork соединения с базой и пул
+    хеширования пересоздаются, а процессы перезапускаются после ``SERVER_MAX_REQUESTS``
+    запросов или при превышении ``SERVER_MAX_RSS_MB``.
+
+    :param config: Класс конфигурации приложения
+    """
+
+    def __init__(self, config=ProductionConfig):
+        self.app_config = config
+        self.application = None
+        super().__init__()
+
+    def load_config(self):
+        settings = {
+            "bind": self.app_config.SERVER_BIND,
+            "workers": self.app_config.SERVER_WORKERS,
+            "worker_class": self.app_config.SERVER_WORKER_CLASS,
+            "threads": self.app_config.SERVER_THREADS,
+            "timeout": self.app_config.SERVER_TIMEOUT,
+            "graceful_timeout": self.app_config.SERVER_GRACEFUL_TIMEOUT,
+            "keepalive": self.app_config.SERVER_KEEPALIVE,
+            "max_requests": self.app_config.SERVER_MAX_REQUESTS,
+            "max_requests_jitter": self.app_config.SERVER_MAX_REQUESTS_JITTER,
+            "preload_app": True,
+            "post_fork": post_fork,
+            "post_request": post_request,
+        }
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        if self.application is None:
+            self.application = create_app(self.app_config)
+            # Сборщик мусора не будет обходить объекты загруженного приложения
+            # и менять их заголовки, поэтому страницы останутся общими после fork
+            gc.collect()
+            gc.freeze()
+        return self.application
+
+
+if __name__ == "__main__":
+    Server().run()
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from config import Config  # noqa: E402
+
+
+class TestConfig(Config):
+    """Конфигурация тестов: SQLite во временном каталоге, быстрое хеширование паролей в процессе."""
+    SQLALCHEMY_REPLICA_URIS = ()
+    SWAGGER_ENABLED = False
+    MIGRATIONS_ENABLED = False
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1'
+    PASSWORD_HASH_BACKEND = 'inline'
+    RATE_LIMIT_ENDPOINTS = ''
+    ROSTER_CACHE_BACKEND = 'memory'
+    INSTRUMENTATION_SAMPLE_RATE = 0.0
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """
+    Фабрика приложений с пустой базой SQLite.
+
+    :return: Функция, принимающая переопределения настроек и возвращающая приложение
+    """
+    apps = []
+
+    def factory(**overrides):
+        config = type('Config', (TestConfig,), {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}", **overrides
+        })
+        app = create_app(config)
+        with app.app_context():
+            db.create_all()
+        apps.append(app)
+        return app
+
+    yield factory
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def auth_headers(client, email, password='password'):
+    """
+    Регистрирует пользователя и возвращает заголовок Authorization с его токеном.
+
+    :param client: Тестовый клиент
+    :param email: Email пользователя
+    :param password: Пароль
+    :return: Словарь заголовков
+    """
+    client.post('/auth/register', json={"email": email, "password": password})
+    token = client.post('/auth/login', json={"email": email, "password": password}).get_json()['access_token']
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,94 @@
+import random
+
+from app.admission import AdaptiveLimit, TokenBucket
+
+
+def make_limit(max_limit=64):
+    # Без очереди: запрос сверх лимита сразу отклоняется, и тест не ждёт
+    return AdaptiveLimit(max_limit, min_limit=1, queue_size=0, queue_timeout=0, tolerance=3.0)
+
+
+def run(limit, latencies):
+    """Выполняет запросы по одному с заданными задержками."""
+    for latency in latencies:
+        assert limit.acquire()
+        limit.release(latency)
+
+
+def bimodal(count, slow_share, seed=1):
+    rng = random.Random(seed)
+    return [0.020 if rng.random() < slow_share else 0.001 for _ in range(count)]
+
+
+def test_bimodal_latency_without_overload_keeps_limit():
+    for slow_share in (0.05, 0.2, 0.5):
+        limit = make_limit()
+        run(limit, bimodal(20000, slow_share))
+        assert limit.limit == 64
+
+
+def test_bimodal_latency_at_saturation_keeps_limit_high():
+    for slow_share in (0.05, 0.2, 0.5):
+        limit = make_limit(max_limit=8)
+        latencies = bimodal(20000, slow_share)
+        for _ in range(7):
+            assert limit.acquire()
+        lowest = limit.limit
+        for latency in latencies:
+            if limit.acquire():
+                limit.release(latency)
+            lowest = min(lowest, limit.limit)
+        assert lowest >= 4
+
+
+def test_overload_at_saturation_decreases_limit_and_recovers():
+    limit = make_limit(max_limit=8)
+    for _ in range(7):
+        assert limit.acquire()
+    for latency in [0.001] * 2000 + [0.010] * 100:
+        if limit.acquire():
+            limit.release(latency)
+    assert limit.limit < 8
+    for _ in range(7):
+        limit.release(0.001)
+
+    run(limit, [0.001] * 2000)
+    assert limit.limit == 8
+
+
+def test_queue_is_bounded():
+    limit = AdaptiveLimit(1, min_limit=1, queue_size=0, queue_timeout=0.01, tolerance=3.0)
+    assert limit.acquire()
+    assert not limit.acquire()
+    limit.release(0.001)
+    assert limit.acquire()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1, burst=2, max_clients=10)
+    assert bucket.take('a') == 0
+    assert bucket.take('a') == 0
+    assert bucket.take('a') > 0
+    assert bucket.take('b') == 0
+
+
+def login(client, forwarded_for):
+    return client.post('/auth/login', json={"email": "user@mail.ru", "password": "password"},
+                       headers={"X-Forwarded-For": forwarded_for}).status_code
+
+
+def test_rate_limit_ignores_forwarded_for_without_trusted_proxy(make_app):
+    client = make_app(RATE_LIMIT_ENDPOINTS='auth.login', RATE_LIMIT_BURST=1).test_client()
+
+    assert login(client, '10.0.0.1') == 401
+    assert login(client, '10.0.0.2') == 429
+
+
+def test_rate_limit_per_client_behind_trusted_proxy(make_app):
+    client = make_app(RATE_LIMIT_ENDPOINTS='auth.login', RATE_LIMIT_BURST=1, TRUSTED_PROXY_COUNT=1).test_client()
+
+    assert login(client, '10.0.0.1') == 401
+    assert login(client, '10.0.0.2') == 401
+    assert login(client, '10.0.0.1') == 429
+    # Принимается только адрес, добавленный доверенным прокси
+    assert login(client, '10.0.0.3, 10.0.0.2') == 429
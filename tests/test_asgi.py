@@ -0,0 +1,145 @@
+import json
+from collections import Counter
+
+import pytest
+from sqlalchemy import event
+from starlette.testclient import TestClient
+
+from app import uow
+from app.asgi import AsyncAPI, _RequestSession
+from conftest import TestConfig
+
+
+def member(email, name='Иван'):
+    return {"name": name, "surname": "Иванов", "email": email, "password": "password"}
+
+
+def scenario(client):
+    """Одна и та же последовательность запросов; возвращает коды и тела ответов без токенов и времени."""
+    def call(method, path, **kwargs):
+        response = getattr(client, method)(path, **kwargs)
+        body = json.loads(response.text) if response.text else None
+        if isinstance(body, dict):
+            body.pop('access_token', None)
+            for change in body.get('changes', ()):
+                change.pop('created_at')
+        return response.status_code, body
+
+    steps = [
+        call('post', '/auth/register', json={"email": "leader@mail.ru", "password": "password", "name": "Лид"}),
+        call('post', '/auth/register', json={"email": "LEADER@mail.ru", "password": "password"}),
+        call('post', '/auth/register', json={"email": "admin@mail.ru", "password": "password", "role": "admin"}),
+        call('post', '/auth/register', json={"email": "bad"}),
+        call('post', '/auth/login', json={"email": "leader@mail.ru", "password": "wrong"}),
+    ]
+    response = client.post('/auth/login', json={"email": "leader@mail.ru", "password": "password"})
+    headers = {"Authorization": f"Bearer {json.loads(response.text)['access_token']}"}
+    steps += [
+        call('get', '/auth/protected', headers=headers),
+        call('get', '/auth/protected'),
+        call('post', '/new_team', json={"team_name": "t1"}, headers=headers),
+        call('post', '/new_team', json={"team_name": "t1"}, headers=headers),
+        call('post', '/t1/add_member', json=member('a@mail.ru')),
+        call('post', '/missing/add_member', json=member('b@mail.ru')),
+        call('post', '/t1/members:bulk', headers=headers,
+             json=[member('b@mail.ru'), member('A@mail.ru'), {"email": "c@mail.ru"}, member('b@mail.ru')]),
+        call('put', '/t1/a@mail.ru/profile', json={"name": "Пётр", "surname": "П"}, headers=headers),
+        call('put', '/t1/leader@mail.ru/profile', json={"name": "Лидер", "surname": "Л"}, headers=headers),
+        call('delete', '/t1/a@mail.ru', headers=headers),
+        call('delete', '/t1/a@mail.ru', headers=headers),
+        call('post', '/new_team', json={"team_name": "t2"}, headers=headers),
+        call('post', '/teams:restructure', headers=headers,
+             json={"move": [{"email": "b@mail.ru", "from_team": "t1", "to_team": "t2"}]}),
+        call('post', '/teams:restructure', headers=headers, json={"remove": [{"email": "b@mail.ru", "team": "t9"}]}),
+        call('get', '/t1'),
+        call('get', '/t2?limit=1'),
+        call('get', '/t2?limit=x'),
+        call('get', '/t9'),
+        call('get', '/t2/changes?since=2'),
+        call('get', '/t9/changes'),
+        call('get', '/users', headers=headers),
+    ]
+    return steps
+
+
+@pytest.fixture
+def asgi_client(make_app, tmp_path):
+    uri = f"sqlite:///{tmp_path / 'asgi.db'}"
+    make_app(SQLALCHEMY_DATABASE_URI=uri)  # создаёт таблицы
+    config = type('Config', (TestConfig,), {'SQLALCHEMY_DATABASE_URI': uri, 'ASYNC_DATABASE_URL': None})
+    with TestClient(AsyncAPI(config)) as client:
+        yield client
+
+
+def test_asgi_matches_flask(client, asgi_client):
+    flask_steps = scenario(client)
+    asgi_steps = scenario(asgi_client)
+
+    for index, (expected, actual) in enumerate(zip(flask_steps, asgi_steps)):
+        assert actual == expected, index
+
+
+def test_asgi_roster_etag(asgi_client):
+    asgi_client.post('/auth/register', json={"email": "leader@mail.ru", "password": "password"})
+    token = asgi_client.post('/auth/login', json={"email": "leader@mail.ru", "password": "password"}).json()
+    asgi_client.post('/new_team', json={"team_name": "t1"},
+                     headers={"Authorization": f"Bearer {token['access_token']}"})
+
+    etag = asgi_client.get('/t1').headers['ETag']
+    not_modified = asgi_client.get('/t1', headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    for response in (asgi_client.get('/t1'), not_modified, asgi_client.get('/t1?limit=1'),
+                     asgi_client.get('/t1', headers={"Accept": 'application/x-ndjson'})):
+        assert response.headers['Vary'] == 'Accept'
+    asgi_client.post('/t1/add_member', json=member('a@mail.ru'))
+    assert asgi_client.get('/t1', headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_asgi_rejects_dialect_without_conflict_insert(monkeypatch, tmp_path):
+    monkeypatch.delitem(uow._CONFLICT_INSERTS, 'sqlite')
+    config = type('Config', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'asgi.db'}", 'ASYNC_DATABASE_URL': None
+    })
+
+    with pytest.raises(ValueError, match='ON CONFLICT'):
+        AsyncAPI(config)
+
+
+def test_asgi_hashes_without_checked_out_connection(asgi_client, monkeypatch):
+    api = asgi_client.app
+    asgi_client.post('/auth/register', json={"email": "leader@mail.ru", "password": "password"})
+    token = asgi_client.post('/auth/login', json={"email": "leader@mail.ru", "password": "password"}).json()
+    headers = {"Authorization": f"Bearer {token['access_token']}"}
+    asgi_client.post('/new_team', json={"team_name": "t1"}, headers=headers)
+    connections, checked_out = Counter(), []
+    pool = api.engine.sync_engine.pool
+    event.listen(pool, 'checkout', lambda *args: connections.update(open=1))
+    event.listen(pool, 'checkin', lambda *args: connections.subtract(open=1))
+
+    def recording(method):
+        def wrapper(*args):
+            checked_out.append(connections['open'])
+            return method(*args)
+        return wrapper
+
+    for name in ('hash', 'hash_many', 'verify'):
+        monkeypatch.setattr(api.hasher, name, recording(getattr(api.hasher, name)))
+    monkeypatch.setattr(api.hasher, 'needs_rehash', lambda pwhash: True)
+
+    assert asgi_client.post('/auth/login', json={"email": "leader@mail.ru", "password": "password"}).status_code == 200
+    assert asgi_client.post('/t1/add_member', json=member('a@mail.ru')).status_code == 201
+    assert asgi_client.post('/t1/members:bulk', json=[member('b@mail.ru')], headers=headers).status_code == 200
+    # verify и пересчёт хеша при входе, хеш участника, хеши массового импорта
+    assert checked_out == [0, 0, 0, 0]
+
+
+def test_asgi_apps_keep_session_listeners_apart(tmp_path):
+    config = type('Config', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'asgi.db'}", 'ASYNC_DATABASE_URL': None
+    })
+    first, second = AsyncAPI(config), AsyncAPI(config)
+    first_class = first.sessionmaker.kw['sync_session_class']
+
+    assert event.contains(first_class, 'after_begin', first._set_statement_timeout)
+    assert not event.contains(first_class, 'after_begin', second._set_statement_timeout)
+    assert not event.contains(_RequestSession, 'after_begin', first._set_statement_timeout)
@@ -0,0 +1,91 @@
+from conftest import auth_headers
+
+
+def member(email):
+    return {"name": "Иван", "surname": "Иванов", "email": email, "password": "password"}
+
+
+def add_member_item(team, email):
+    return {"method": "POST", "path": f"/{team}/add_member", "body": member(email)}
+
+
+def test_batch_returns_sub_responses_in_order(client):
+    headers = auth_headers(client, 'leader@mail.ru')
+    client.post('/new_team', json={"team_name": "t1"}, headers=headers)
+
+    response = client.post('/batch', headers=headers, json=[
+        add_member_item('t1', 'a@mail.ru'),
+        {"method": "GET", "path": "/t1"},
+        {"method": "GET", "path": "/missing"},
+    ])
+
+    assert response.status_code == 200
+    results = response.get_json()
+    assert [result["status"] for result in results] == [201, 200, 404]
+    assert len(results[1]["body"]["members"]) == 2
+    assert results[1]["headers"]["ETag"] == client.get('/t1').headers['ETag']
+
+
+def test_atomic_batch_commits_and_returns_etags(client):
+    headers = auth_headers(client, 'leader@mail.ru')
+    client.post('/new_team', json={"team_name": "t1"}, headers=headers)
+
+    response = client.post('/batch?atomic=true', headers=headers, json=[
+        add_member_item('t1', 'a@mail.ru'),
+        {"method": "GET", "path": "/t1"},
+    ])
+
+    assert response.status_code == 200
+    etag = response.get_json()[1]["headers"]["ETag"]
+    assert client.get('/t1', headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_aborted_atomic_batch_drops_rolled_back_responses(client):
+    headers = auth_headers(client, 'leader@mail.ru')
+    client.post('/new_team', json={"team_name": "t1"}, headers=headers)
+
+    response = client.post('/batch?atomic=true', headers=headers, json=[
+        add_member_item('t1', 'y@mail.ru'),
+        {"method": "GET", "path": "/t1"},
+        add_member_item('missing', 'z@mail.ru'),
+        {"method": "GET", "path": "/t1"},
+    ])
+
+    assert response.status_code == 409
+    results = response.get_json()
+    assert [result["status"] for result in results] == [424, 424, 404, 424]
+    assert all("ETag" not in result["headers"] for result in results)
+    assert all(result["body"] == {"error": "Batch aborted"} for result in results[:2])
+
+    # Изменение после отката получает ту же версию команды, что и откаченное в пакете
+    client.post('/t1/add_member', json=member('q@mail.ru'))
+    assert len(client.get('/t1').get_json()["members"]) == 2
+    assert client.post('/auth/register', json={"email": "y@mail.ru", "password": "password"}).status_code == 201
+
+
+def test_atomic_batch_defers_cache_invalidation(client):
+    headers = auth_headers(client, 'leader@mail.ru')
+    client.post('/new_team', json={"team_name": "t1"}, headers=headers)
+    client.get('/t1')
+
+    response = client.post('/batch?atomic=true', headers=headers, json=[add_member_item('t1', 'a@mail.ru')])
+
+    assert response.status_code == 200
+    assert len(client.get('/t1').get_json()["members"]) == 2
+
+
+def test_batch_rejects_unknown_blueprint_and_streaming(client):
+    response = client.post('/batch', json=[
+        {"method": "GET", "path": "/metrics"},
+        {"method": "GET", "path": "/t1?format=ndjson"},
+    ])
+
+    assert [result["status"] for result in response.get_json()] == [404, 400]
+
+
+def test_batch_size_limit(make_app):
+    client = make_app(BATCH_MAX_REQUESTS=1).test_client()
+
+    response = client.post('/batch', json=[{"method": "GET", "path": "/t1"}] * 2)
+
+    assert response.status_code == 413
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+from werkzeug.security import check_password_hash
+
+from app import db, hasher
+from app.hashing import PasswordHasher
+from conftest import auth_headers
+from config import Config
+
+
+@pytest.fixture
+def process_hasher():
+    hasher = PasswordHasher()
+    hasher.configure({
+        **{name: getattr(Config, name) for name in dir(Config) if name.startswith('PASSWORD_HASH_')},
+        "PASSWORD_HASH_METHOD": 'pbkdf2:sha256:100000',  # ~20 мс на пароль
+        "PASSWORD_HASH_BACKEND": 'process',
+        "PASSWORD_HASH_WORKERS": 2,
+        "PASSWORD_HASH_BULK_WORKERS": 1,
+        "PASSWORD_HASH_TIMEOUT": 1.5,
+    })
+    # Процессы пула запускаются по требованию: запускаем оба заранее, чтобы старт не входил в замеры
+    warm_up = [threading.Thread(target=hasher.hash, args=('warm-up',)) for _ in range(2)]
+    for thread in warm_up:
+        thread.start()
+    for thread in warm_up:
+        thread.join()
+    yield hasher
+    hasher.backend.shutdown()
+
+
+def test_bulk_longer_than_timeout_completes(process_hasher):
+    passwords = [f'password-{index}' for index in range(96)]
+
+    started = time.monotonic()
+    hashes = process_hasher.hash_many(passwords, chunk_size=16)
+
+    # Таймаут действует на каждую часть, а не на весь список
+    assert time.monotonic() - started > process_hasher.backend.timeout
+    assert len(hashes) == len(passwords)
+    assert check_password_hash(hashes[-1], passwords[-1])
+    assert process_hasher.queue_depth == 0
+
+
+def test_bulk_leaves_workers_for_single_hashes(process_hasher):
+    bulk = threading.Thread(target=process_hasher.hash_many,
+                            args=([f'password-{index}' for index in range(96)],), kwargs={"chunk_size": 16})
+    bulk.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    process_hasher.hash('password')
+    elapsed = time.monotonic() - started
+    bulk.join()
+
+    # Без ограничения хеш ждал бы в очереди пула за всеми частями импорта (~1 с)
+    assert elapsed < 0.3
+
+
+def test_bulk_import_hashes_without_open_transaction(app, client, monkeypatch):
+    headers = auth_headers(client, 'leader@mail.ru')
+    client.post('/new_team', json={"team_name": "t1"}, headers=headers)
+    in_transaction = []
+    original = hasher.hash_many
+
+    def hash_many(passwords):
+        in_transaction.append(db.session().in_transaction())
+        return original(passwords)
+
+    monkeypatch.setattr(hasher, 'hash_many', hash_many)
+    rows = [{"name": "Иван", "surname": "Иванов", "email": "a@mail.ru", "password": "password"}]
+
+    assert client.post('/t1/members:bulk', json=rows, headers=headers).status_code == 200
+    assert in_transaction == [False]
+
+
+def test_login_and_add_member_hash_without_open_transaction(app, client, monkeypatch):
+    client.post('/auth/register', json={"email": "leader@mail.ru", "password": "password"})
+    client.post('/new_team', json={"team_name": "t1"}, headers=auth_headers(client, 'leader@mail.ru'))
+    in_transaction = []
+
+    def recording(method):
+        def wrapper(*args):
+            in_transaction.append(db.session().in_transaction())
+            return method(*args)
+        return wrapper
+
+    monkeypatch.setattr(hasher, 'hash', recording(hasher.hash))
+    monkeypatch.setattr(hasher, 'verify', recording(hasher.verify))
+    monkeypatch.setattr(hasher, 'needs_rehash', lambda pwhash: True)
+
+    login = client.post('/auth/login', json={"email": "leader@mail.ru", "password": "password"})
+    member = {"name": "Иван", "surname": "Иванов", "email": "a@mail.ru", "password": "password"}
+    added = client.post('/t1/add_member', json=member)
+
+    assert (login.status_code, added.status_code) == (200, 201)
+    # verify и пересчёт хеша при входе, хеш нового участника
+    assert in_transaction == [False, False, False]
+    monkeypatch.undo()
+    assert client.post('/auth/login', json={"email": "leader@mail.ru", "password": "password"}).status_code == 200
@@ -0,0 +1,155 @@
+import threading
+import time
+
+from sqlalchemy import func, select, update
+
+from app import db, hasher, services
+from app.idempotency import HEADER, REPLAYED_HEADER, _digest, _scope, _utcnow
+from app.models import IdempotencyKey, User
+from conftest import auth_headers
+
+
+def member(email):
+    return {"name": "Иван", "surname": "Иванов", "email": email, "password": "password"}
+
+
+def add_member(client, team, email, key, **kwargs):
+    return client.post(f'/{team}/add_member', json=member(email), headers={HEADER: key}, **kwargs)
+
+
+def user_count(app):
+    with app.app_context():
+        return db.session.scalar(select(func.count()).select_from(User))
+
+
+def create_team(client, name):
+    client.post('/new_team', json={"team_name": name}, headers=auth_headers(client, f'leader-{name}@mail.ru'))
+
+
+def test_replay_returns_stored_response(app, client):
+    create_team(client, 't1')
+
+    first = add_member(client, 't1', 'a@mail.ru', 'k1')
+    second = add_member(client, 't1', 'a@mail.ru', 'k1')
+
+    assert (first.status_code, second.status_code) == (201, 201)
+    assert REPLAYED_HEADER not in first.headers
+    assert second.headers[REPLAYED_HEADER] == 'true'
+    assert second.get_json() == first.get_json()
+    assert user_count(app) == 2
+
+
+def test_key_reused_with_different_body_is_rejected(client):
+    create_team(client, 't1')
+    add_member(client, 't1', 'a@mail.ru', 'k1')
+
+    assert add_member(client, 't1', 'b@mail.ru', 'k1').status_code == 422
+
+
+def test_error_responses_are_stored(client):
+    assert add_member(client, 'missing', 'a@mail.ru', 'k1').status_code == 404
+    create_team(client, 'missing')
+
+    replay = add_member(client, 'missing', 'a@mail.ru', 'k1')
+    assert replay.status_code == 404
+    assert replay.headers[REPLAYED_HEADER] == 'true'
+
+
+def test_key_is_scoped_by_team_and_anonymous_client(app, client):
+    create_team(client, 't1')
+    create_team(client, 't2')
+
+    assert add_member(client, 't1', 'a@mail.ru', 'k1').status_code == 201
+    assert add_member(client, 't2', 'b@mail.ru', 'k1').status_code == 201
+    other_client = {"environ_base": {"REMOTE_ADDR": '10.0.0.2'}}
+    response = add_member(client, 't1', 'c@mail.ru', 'k1', **other_client)
+    assert response.status_code == 201
+    assert REPLAYED_HEADER not in response.headers
+    assert user_count(app) == 5
+
+
+def test_exception_releases_key(app, client, monkeypatch):
+    create_team(client, 't1')
+
+    def fail(*args):
+        raise RuntimeError('database is down')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(services, 'add_member', fail)
+        assert add_member(client, 't1', 'a@mail.ru', 'k1').status_code == 500
+
+    retry = add_member(client, 't1', 'a@mail.ru', 'k1')
+    assert retry.status_code == 201
+    assert REPLAYED_HEADER not in retry.headers
+
+
+def claim_in_other_process(app, email, key):
+    """Занимает ключ строкой без ответа, как запрос, выполняющийся в другом рабочем процессе."""
+    with app.test_request_context('/t1/add_member', method='POST', environ_base={"REMOTE_ADDR": '127.0.0.1'}):
+        key = _digest(*_scope(), key)
+        fingerprint = _digest('POST', '/t1/add_member', app.json.dumps(member(email)))
+        db.session.add(IdempotencyKey(key=key, fingerprint=fingerprint, expires_at=_utcnow().replace(year=2100)))
+        db.session.commit()
+    return key, fingerprint
+
+
+def test_claim_of_another_process_times_out(make_app):
+    app = make_app(IDEMPOTENCY_WAIT_TIMEOUT=0.3)
+    client = app.test_client()
+    create_team(client, 't1')
+    claim_in_other_process(app, 'a@mail.ru', 'k1')
+
+    started = time.monotonic()
+    response = add_member(client, 't1', 'a@mail.ru', 'k1')
+
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert 0.3 <= time.monotonic() - started < 1
+    assert user_count(app) == 1
+
+
+def test_duplicate_waits_for_another_process(app, client):
+    create_team(client, 't1')
+    key, _ = claim_in_other_process(app, 'a@mail.ru', 'k1')
+
+    def complete():
+        time.sleep(0.2)
+        with app.app_context():
+            db.session.execute(update(IdempotencyKey).where(IdempotencyKey.key == key).values(
+                status=201, body='{"message":"Member added successfully"}'))
+            db.session.commit()
+
+    other_process = threading.Thread(target=complete)
+    other_process.start()
+    response = add_member(client, 't1', 'a@mail.ru', 'k1')
+    other_process.join()
+
+    assert response.status_code == 201
+    assert response.headers[REPLAYED_HEADER] == 'true'
+    assert user_count(app) == 1
+
+
+def test_concurrent_duplicates_execute_once(make_app, monkeypatch):
+    app = make_app(ADMISSION_ENABLED=False)
+    create_team(app.test_client(), 't1')
+    original_hash = hasher.hash
+
+    def slow_hash(password):
+        time.sleep(0.2)
+        return original_hash(password)
+
+    monkeypatch.setattr(hasher, 'hash', slow_hash)
+    responses = []
+
+    def send():
+        responses.append(add_member(app.test_client(), 't1', 'a@mail.ru', 'k1'))
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [201] * 4
+    assert sum(REPLAYED_HEADER not in response.headers for response in responses) == 1
+    assert user_count(app) == 2
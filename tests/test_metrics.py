@@ -0,0 +1,42 @@
+import re
+
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.instrumentation import RequestTimings
+from conftest import auth_headers
+
+
+def roster_cache_counters(client):
+    text = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE roster_cache_hits_total counter' in text
+    assert '# TYPE roster_cache_misses_total counter' in text
+    return [int(re.search(rf'^{name} (\d+)$', text, re.M).group(1))
+            for name in ('roster_cache_hits_total', 'roster_cache_misses_total')]
+
+
+def test_roster_cache_counters(client):
+    client.post('/new_team', json={"team_name": "t1"}, headers=auth_headers(client, 'leader@mail.ru'))
+    hits, misses = roster_cache_counters(client)
+
+    for _ in range(3):
+        client.get('/t1')
+
+    assert roster_cache_counters(client) == [hits + 2, misses + 1]
+
+
+def test_failed_query_leaves_no_timing(make_app):
+    app = make_app(INSTRUMENTATION_SAMPLE_RATE=1.0)
+
+    with app.test_request_context(), db.engine.connect() as connection:
+        g._request_timings = timings = RequestTimings()
+        with pytest.raises(OperationalError):
+            connection.execute(text('SELECT * FROM missing'))
+        connection.rollback()
+        connection.execute(text('SELECT 1'))
+
+        assert connection.info['query_started'] == []
+        assert timings.queries == 2
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+from sqlalchemy import insert
+
+from app import db, replicas
+from app.models import Team, User, user_team
+from conftest import auth_headers
+
+
+def seed_replica(engine, leader_name):
+    """Создаёт таблицы и команду x, лидер которой назван по реплике."""
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User).values(id=1, email='leader@mail.ru', password='-', role='user',
+                                               name=leader_name))
+        connection.execute(insert(Team).values(id=1, name='x', leader_id=1))
+        connection.execute(insert(user_team).values(user_id=1, team_id=1))
+
+
+def wait_for_checks():
+    deadline = time.monotonic() + 5
+    while any(replica.checked_at is None or replica.checking for replica in replicas.replicas):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def leader_name(client, team='x'):
+    response = client.get(f'/{team}?limit=10')
+    assert response.status_code == 200
+    return response.get_json()["members"][0]["name"]
+
+
+@pytest.fixture
+def make_replicated_app(make_app, tmp_path):
+    def factory(*replica_names):
+        app = make_app(SQLALCHEMY_REPLICA_URIS=tuple(f"sqlite:///{tmp_path / name}" for name in replica_names))
+        for replica, name in zip(replicas.replicas, replica_names):
+            if '/' not in name:
+                seed_replica(replica.engine, name.split('.')[0])
+
+        # Основная база: та же команда x с лидером primary
+        writer = app.test_client()
+        writer.environ_base['REMOTE_ADDR'] = '10.0.0.1'
+        headers = auth_headers(writer, 'leader@mail.ru')
+        writer.put('/x/leader@mail.ru/profile', json={"name": "primary", "surname": "P"}, headers=headers)
+        writer.post('/new_team', json={"team_name": "x"}, headers=headers)
+        writer.post('/new_team', json={"team_name": "fresh"}, headers=headers)
+
+        client = app.test_client()
+        client.get('/x?limit=10')  # запускает первые проверки реплик
+        wait_for_checks()
+        return app, client
+
+    yield factory
+    for replica in replicas.replicas:
+        replica.engine.dispose()
+
+
+def test_reads_go_to_replicas_round_robin(make_replicated_app):
+    _, client = make_replicated_app('one.db', 'two.db')
+
+    names = [leader_name(client) for _ in range(4)]
+
+    assert set(names) == {'one', 'two'}
+    assert names[0] != names[1] and names[:2] == names[2:]
+
+
+def test_replica_is_not_used_before_first_check(make_app, tmp_path):
+    make_app(SQLALCHEMY_REPLICA_URIS=(f"sqlite:///{tmp_path / 'one.db'}",))
+
+    assert replicas.choose() is None
+    wait_for_checks()
+    assert replicas.healthy_count == 1
+
+
+def test_client_reads_primary_after_write(make_replicated_app):
+    _, client = make_replicated_app('one.db', 'two.db')
+
+    client.post('/auth/register', json={"email": "reader@mail.ru", "password": "password"})
+
+    assert leader_name(client) == 'primary'
+    # Между процессами признак передаётся cookie, без неё клиент снова читает с реплик
+    client.delete_cookie('db_sticky')
+    client.environ_base['REMOTE_ADDR'] = '10.0.0.2'
+    assert leader_name(client) in ('one', 'two')
+
+
+def test_missing_on_replica_falls_back_to_primary(make_replicated_app):
+    _, client = make_replicated_app('one.db', 'two.db')
+
+    assert leader_name(client, 'fresh') == 'primary'
+
+
+def test_dead_replica_is_ejected(make_replicated_app):
+    _, client = make_replicated_app('one.db', 'missing/two.db')
+
+    assert replicas.healthy_count == 1
+    assert [leader_name(client) for _ in range(4)] == ['one'] * 4
+
+
+def test_all_replicas_dead_reads_primary(make_replicated_app):
+    _, client = make_replicated_app('missing/one.db', 'missing/two.db')
+
+    assert replicas.healthy_count == 0
+    assert leader_name(client) == 'primary'
@@ -0,0 +1,74 @@
+import sys
+
+import pytest
+from sqlalchemy import delete, select
+
+from app import db, services
+from app.models import User, user_team
+from app.serializers import loads
+from app.uow import unit_of_work
+from conftest import auth_headers
+
+
+def test_roster_responses_vary_on_accept(client):
+    client.post('/new_team', json={"team_name": "t1"}, headers=auth_headers(client, 'leader@mail.ru'))
+
+    fresh = client.get('/t1')
+    cached = client.get('/t1')
+    not_modified = client.get('/t1', headers={"If-None-Match": fresh.headers['ETag']})
+    page = client.get('/t1?limit=1')
+    stream = client.get('/t1', headers={"Accept": 'application/x-ndjson'})
+
+    responses = (fresh, cached, not_modified, page, stream)
+    assert [response.status_code for response in responses] == [200, 200, 304, 200, 200]
+    assert stream.mimetype == 'application/x-ndjson'
+    for response in responses:
+        assert response.headers['Vary'] == 'Accept'
+
+
+def test_roster_cache_sees_changes_from_other_workers(app, client):
+    client.post('/new_team', json={"team_name": "t1"}, headers=auth_headers(client, 'leader@mail.ru'))
+    before = client.get('/t1').get_json()['members']
+
+    # Участник добавлен другим рабочим процессом: кеш этого процесса не сброшен
+    with app.app_context(), unit_of_work():
+        data = {"name": "Иван", "surname": "Иванов", "email": "a@mail.ru", "password": "password"}
+        services.add_member(db.session, services.team_id_by_name(db.session, 't1'), 't1', data, 'hash')
+
+    after = client.get('/t1').get_json()['members']
+    assert len(after) == len(before) + 1
+    assert {"name": 'Иван', "role": 'member', "surname": 'Иванов'} in after
+
+
+def test_redis_roster_cache_requires_package(make_app, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'redis', None)
+
+    with pytest.raises(ValueError, match='redis package'):
+        make_app(ROSTER_CACHE_BACKEND='redis')
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3])
+def test_roster_pages_count_leader_in_limit(app, client, limit):
+    client.post('/new_team', json={"team_name": "t1"}, headers=auth_headers(client, 'leader@mail.ru'))
+    for email in ('a@mail.ru', 'b@mail.ru'):
+        client.post('/t1/add_member', json={
+            "name": "Иван", "surname": "Иванов", "email": email, "password": "password"
+        })
+    # Лидер, не состоящий в команде, добавляется к списку участников
+    with app.app_context():
+        db.session.execute(delete(user_team).where(user_team.c.user_id == select(User.id).where(
+            User.email == 'leader@mail.ru').scalar_subquery()))
+        db.session.commit()
+
+    members = client.get('/t1').get_json()['members']
+    pages, path = [], f'/t1?limit={limit}'
+    while path:
+        page = client.get(path).get_json()
+        pages.append(page['members'])
+        path = page['next_cursor'] and f'/t1?limit={limit}&after={page["next_cursor"]}'
+    stream = client.get('/t1?format=ndjson').get_data(as_text=True).splitlines()
+
+    assert len(members) == 3 and members[-1]['role'] == 'leader'
+    assert all(len(page) <= limit for page in pages)
+    assert [member for page in pages for member in page] == members
+    assert [loads(line) for line in stream[1:]] == members
@@ -0,0 +1,20 @@
+from collections import namedtuple
+
+import pytest
+
+from app.serializers import RowSerializer, dumps
+
+Row = namedtuple('Row', ['name', 'surname', 'role', 'id'])
+
+
+def test_row_serializer_matches_dumps():
+    row = Row('Иван', 'Иванов', 'user', 7)
+
+    assert RowSerializer('surname', 'name', 'role', seq='id')(row) == dumps(
+        {"surname": 'Иванов', "name": 'Иван', "role": 'user', "seq": 7})
+    assert RowSerializer(team_name='name')(row) == dumps({"team_name": 'Иван'})
+
+
+def test_row_serializer_rejects_invalid_column():
+    with pytest.raises(ValueError):
+        RowSerializer(name='leader.name')
@@ -0,0 +1,9 @@
+from bench.startup import HEAVY_MODULES, check_budget, measure
+
+
+def test_worker_startup_budget(tmp_path):
+    # Новый интерпретатор: import app + create_app() с настройками рабочего процесса
+    report = measure({"DATABASE_URL": f"sqlite:///{tmp_path / 'startup.db'}"}, repeat=3)
+
+    assert not set(report["heavy_modules"]) & set(HEAVY_MODULES)
+    assert check_budget(report, max_seconds=1.0, max_rss_mb=80) == []
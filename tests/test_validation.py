@@ -0,0 +1,58 @@
+import io
+import json
+
+import pytest
+
+from app.schemas import EMAIL, Schema
+from conftest import auth_headers
+
+
+def chunked(client, path, body, **kwargs):
+    """Отправляет тело без Content-Length, как сервер передаёт запрос с Transfer-Encoding: chunked."""
+    return client.post(path, input_stream=io.BytesIO(body), content_type='application/json',
+                       headers={"Transfer-Encoding": "chunked", **kwargs.pop('headers', {})},
+                       environ_overrides={"wsgi.input_terminated": True}, **kwargs)
+
+
+def register_body(padding):
+    return json.dumps({"email": "a@mail.ru", "password": "password", "name": "x" * padding}).encode()
+
+
+def test_body_over_limit_is_rejected(make_app):
+    client = make_app(JSON_MAX_BODY_SIZE=100).test_client()
+
+    response = client.post('/auth/register', data=register_body(200), content_type='application/json')
+
+    assert response.status_code == 413
+
+
+def test_chunked_body_over_limit_is_rejected(make_app):
+    client = make_app(JSON_MAX_BODY_SIZE=100).test_client()
+
+    assert chunked(client, '/auth/register', register_body(200)).status_code == 413
+    assert chunked(client, '/auth/register', register_body(10)).status_code == 201
+
+
+def test_chunked_bulk_body_over_limit_is_rejected(make_app):
+    client = make_app(MAX_CONTENT_LENGTH=200).test_client()
+    headers = auth_headers(client, 'leader@mail.ru')
+    client.post('/new_team', json={"team_name": "t1"}, headers=headers)
+    rows = [{"name": "Иван", "surname": "Иванов", "email": f"{index}@mail.ru", "password": "password"}
+            for index in range(10)]
+
+    response = chunked(client, '/t1/members:bulk', json.dumps(rows).encode(), headers=headers)
+
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize('definition', [
+    {"type": "object", "properties": {"email": EMAIL}, "additionalProperties": False},
+    {"type": "object", "properties": {"email": {**EMAIL, "pattern": ".+"}}},
+    {"type": "object", "properties": {"email": {**EMAIL, "required": ["x"]}}},
+    {"type": "object", "properties": {"age": {"type": "integer"}}},
+    {"type": "object", "properties": {"site": {"type": "string", "format": "uri"}}},
+    {"type": "object", "required": ["email", "name"], "properties": {"email": EMAIL}},
+])
+def test_schema_rejects_unsupported_definition(definition):
+    with pytest.raises(ValueError):
+        Schema(definition)